@@ -0,0 +1,85 @@
+"""
+Benchmark of the conversation archive: batched writes and full-text search.
+
+Fills a temporary archive with synthetic conversations, then times searches
+of single words and phrases, and the sidebar queries (a page of the
+conversation list and a page of messages).
+
+Usage: python -m benchmarks.bench_archive [--conversations N] [--turns N]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.recordings import WORDS, sample_tokens
+from tinychat.backend.archive import ConversationArchive
+
+
+def timed(function, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--conversations", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=150, help="per message")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archive = ConversationArchive(os.path.join(temp_dir, "archive.sqlite3"))
+        start = time.perf_counter()
+        ids = []
+        for number in range(args.conversations):
+            conversation_id = archive.new_conversation_id()
+            ids.append(conversation_id)
+            for turn in range(args.turns):
+                for role in ("user", "assistant"):
+                    seed = number * args.turns * 2 + turn * 2 + (role == "user")
+                    text = "".join(sample_tokens(args.tokens, seed))
+                    archive.add_message(conversation_id, "GPT-4o", role, text)
+        queued = time.perf_counter() - start
+        archive.flush()
+        written = time.perf_counter() - start
+        messages = archive.count_messages()
+        print(
+            f"{messages:,} messages in {args.conversations:,} conversations: "
+            f"queued in {queued:.2f}s, written in {written:.2f}s "
+            f"({messages / written:,.0f} messages/s)"
+        )
+
+        rng = random.Random(0)
+        words = [word for word in WORDS if word.isalpha()]
+        queries = {
+            "search word": lambda: archive.search(rng.choice(words)),
+            "search 2 words": lambda: archive.search(
+                f"{rng.choice(words)} {rng.choice(words)}"
+            ),
+            "search no match": lambda: archive.search("xylophone"),
+            "conversations page": lambda: archive.list_conversations(
+                rng.randrange(args.conversations), 50
+            ),
+            "messages page": lambda: archive.load_messages(rng.choice(ids), 0, 50),
+        }
+        print(f"{'query':<20} {'median ms':>10} {'max ms':>8}")
+        for name, query in queries.items():
+            timings = timed(query, args.repeat)
+            print(
+                f"{name:<20} {statistics.median(timings) * 1000:>10.2f} "
+                f"{timings[-1] * 1000:>8.2f}"
+            )
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+End-to-end streaming benchmark of every handler against the mock provider.
+
+Each turn goes through the real wire path: stream_response encodes the
+request, posts it with the shared session, and decodes the streamed body.
+The mock provider runs in a separate process, so that the CPU time measured
+is only the client's. Reports, per handler:
+
+    tokens/s     response pieces received per second of wall time
+    CPU us/tok   client CPU time per response piece
+    peak KiB     peak memory allocated during a turn (tracemalloc)
+
+Usage: python -m benchmarks.bench_e2e [--tokens N] [--turns N]
+       [--token-rate TOKENS_PER_S] [--chunk-size BYTES] [--latency S]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.mock_provider import providers_redirected_to
+from tinychat.llms.anthropic import AnthropicAIHandler
+from tinychat.llms.cohere import CohereHandler
+from tinychat.llms.google import GoogleAIHandler
+from tinychat.llms.mistral import MistralHandler
+from tinychat.llms.openai import OpenAIHandler
+from tinychat.llms.together import TogetherHandler
+
+HANDLERS = {
+    "openai": lambda: OpenAIHandler("gpt-4o"),
+    "mistral": lambda: MistralHandler("mistral-large-latest"),
+    "together": lambda: TogetherHandler("meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo"),
+    "anthropic": lambda: AnthropicAIHandler("claude-3-5-sonnet-20240620"),
+    "gemini": lambda: GoogleAIHandler(),
+    "cohere": lambda: CohereHandler(),
+}
+
+
+def run_turn(make_handler) -> int:
+    handler = make_handler()
+    pieces = 0
+    for _ in handler.stream_response("Tell me a story."):
+        pieces += 1
+    return pieces
+
+
+def measure(make_handler, turns: int) -> tuple[float, float, float]:
+    """Return tokens/s, CPU seconds per token and peak bytes of a turn."""
+    run_turn(make_handler)  # warm up the connection and the caches
+    pieces = 0
+    wall = cpu = 0.0
+    for _ in range(turns):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        pieces += run_turn(make_handler)
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+
+    tracemalloc.start()
+    try:
+        run_turn(make_handler)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return pieces / wall, cpu / pieces, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    parser.add_argument("--chunk-size", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument(
+        "--handlers", nargs="*", choices=list(HANDLERS), default=list(HANDLERS)
+    )
+    args = parser.parse_args()
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.mock_provider",
+            "--port=0",
+            f"--tokens={args.tokens}",
+            f"--token-rate={args.token_rate}",
+            f"--chunk-size={args.chunk_size}",
+            f"--latency={args.latency}",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        base_url = server.stdout.readline().split()[-1]  # type: ignore
+        print(
+            f"{args.tokens} tokens, {args.turns} turns, "
+            f"chunk size {args.chunk_size or 'event'}, "
+            f"rate {args.token_rate or 'unlimited'}"
+        )
+        print(f"{'handler':<10} {'tokens/s':>12} {'CPU us/tok':>11} {'peak KiB':>9}")
+        with providers_redirected_to(base_url):
+            for name in args.handlers:
+                rate, cpu_per_token, peak = measure(HANDLERS[name], args.turns)
+                print(
+                    f"{name:<10} {rate:>12,.0f} {cpu_per_token * 1e6:>11.1f} "
+                    f"{peak / 1024:>9.0f}"
+                )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
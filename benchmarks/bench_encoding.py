@@ -0,0 +1,70 @@
+"""
+Benchmark of the request body serialization over a long session.
+
+At every turn the whole conversation is sent. The previous code built the
+body with requests' json=data, which re-serializes every message; now only the
+new messages are serialized and the cached encodings of the others are
+spliced into the body.
+
+Usage: python -m benchmarks.bench_encoding [--turns N] [--message-size CHARS]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.recordings import sample_tokens
+from tinychat.llms.base import (
+    ASSISTANT_ROLE,
+    USER_ROLE,
+    Conversation,
+    chat_completions_message,
+    encode_json_body,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--message-size", type=int, default=20_000)
+    args = parser.parse_args()
+
+    # A code dump like text, with quotes and newlines to escape
+    text = "".join(sample_tokens(args.message_size // 5))[: args.message_size]
+    conversation = Conversation()
+    report_at = {1, 10, 25, 50, 75, args.turns}
+    totals = {"json=data": 0.0, "incremental": 0.0}
+
+    print(f"{args.turns} turns, {args.message_size} chars per message")
+    print(f"{'turn':>5} {'body MB':>8} {'json=data ms':>13} {'incremental ms':>15}")
+    for turn in range(1, args.turns + 1):
+        conversation.append(USER_ROLE, f"{turn}: {text}")
+        fields = {"model": "gpt-4o", "temperature": 0.0, "stream": True}
+
+        start = time.perf_counter()
+        data = dict(fields, messages=conversation.to_wire(chat_completions_message))
+        full_body = json.dumps(data).encode("utf-8")
+        full_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        messages = conversation.encode(chat_completions_message)
+        encode_json_body(dict(fields, messages=messages))
+        incremental_elapsed = time.perf_counter() - start
+
+        totals["json=data"] += full_elapsed
+        totals["incremental"] += incremental_elapsed
+        if turn in report_at:
+            print(
+                f"{turn:>5} {len(full_body) / 1e6:>8.2f} "
+                f"{full_elapsed * 1000:>13.3f} {incremental_elapsed * 1000:>15.3f}"
+            )
+        conversation.append(ASSISTANT_ROLE, f"{turn}: {text}")
+
+    print(
+        f"total {'':>8} {totals['json=data'] * 1000:>13.1f} "
+        f"{totals['incremental'] * 1000:>15.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of the Cohere NDJSON decoding hot path.
+
+Compares NDJSONStream with the previous loop, which called json.loads on each
+raw chunk of the response and skipped the chunks that failed to parse.
+Iterating a requests.Response yields 128 byte chunks, which is the default
+chunk size used here.
+
+Usage: python -m benchmarks.bench_ndjson [--tokens N] [--chunk-size BYTES]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.recordings import chunked, cohere_ndjson, sample_tokens
+from tinychat.llms.streams import NDJSONStream
+
+
+def decode_and_discard(chunks: list[bytes]) -> list[str]:
+    texts = []
+    for response_piece in chunks:
+        try:
+            data = json.loads(response_piece.decode("utf-8"))
+        except ValueError:
+            continue
+        if not "event_type" in data.keys():
+            continue
+        if data["event_type"] == "text-generation":
+            texts.append(data["text"])
+    return texts
+
+
+def ndjson_stream(chunks: list[bytes]) -> list[str]:
+    texts = []
+    for data in NDJSONStream(iter(chunks)).events():
+        if data.get("event_type") == "text-generation":
+            texts.append(data["text"])
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--chunk-size", type=int, default=128)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--aligned",
+        action="store_true",
+        help="one event per chunk, the only case the old loop decodes fully",
+    )
+    args = parser.parse_args()
+
+    tokens = sample_tokens(args.tokens)
+    payload = cohere_ndjson(tokens)
+    if args.aligned:
+        chunks = [line + b"\n" for line in payload.split(b"\n") if line]
+        layout = "one event per chunk"
+    else:
+        chunks = chunked(payload, args.chunk_size)
+        layout = f"{args.chunk_size} byte chunks"
+
+    print(f"{args.tokens} tokens, {layout}, best of {args.repeat}")
+    print(f"{'decoder':<20} {'tokens/s':>12} {'tokens kept':>12}")
+    for name, decode in (
+        ("decode-and-discard", decode_and_discard),
+        ("NDJSONStream", ndjson_stream),
+    ):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            texts = decode(chunks)
+            timings.append(time.perf_counter() - start)
+        kept = len(texts)
+        print(f"{name:<20} {args.tokens / min(timings):>12,.0f} {kept:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of the SSE decoding hot path.
+
+Compares tinychat's SSEStream with sseclient-py (if installed) on OpenAI,
+Anthropic and Gemini streams, doing the same work as the handlers: decode
+each event and json.loads its data.
+
+Usage: python -m benchmarks.bench_sse [--tokens N] [--chunk-size BYTES]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.recordings import (
+    anthropic_sse,
+    chunked,
+    gemini_sse,
+    openai_sse,
+    sample_tokens,
+)
+from tinychat.llms.streams import SSEStream
+
+try:
+    from sseclient import SSEClient
+except ImportError:
+    SSEClient = None
+
+
+def parse_with_sse_stream(chunks: list[bytes], decode_json: bool) -> int:
+    events = 0
+    for data in SSEStream(iter(chunks)).events():
+        if decode_json and data != "[DONE]":
+            json.loads(data)
+        events += 1
+    return events
+
+
+def parse_with_sseclient(chunks: list[bytes], decode_json: bool) -> int:
+    events = 0
+    for event in SSEClient(event_source=iter(chunks)).events():  # type: ignore
+        if decode_json and event.data != "[DONE]":
+            json.loads(event.data)
+        events += 1
+    return events
+
+
+def best_time(parse, chunks: list[bytes], repeat: int, decode_json: bool) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(chunks, decode_json)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--parse-only",
+        action="store_true",
+        help="only decode the events, without json.loads of their data",
+    )
+    args = parser.parse_args()
+
+    tokens = sample_tokens(args.tokens)
+    streams = {
+        "openai": openai_sse(tokens),
+        "anthropic": anthropic_sse(tokens),
+        "gemini": gemini_sse(tokens),
+    }
+    parsers = {"SSEStream": parse_with_sse_stream}
+    if SSEClient is not None:
+        parsers["sseclient-py"] = parse_with_sseclient
+
+    print(f"{args.tokens} tokens, {args.chunk_size} byte chunks, best of {args.repeat}")
+    print(f"{'stream':<10} {'parser':<14} {'tokens/s':>12} {'MB/s':>8}")
+    for stream_name, payload in streams.items():
+        chunks = chunked(payload, args.chunk_size)
+        for parser_name, parse in parsers.items():
+            elapsed = best_time(parse, chunks, args.repeat, not args.parse_only)
+            print(
+                f"{stream_name:<10} {parser_name:<14} "
+                f"{args.tokens / elapsed:>12,.0f} {len(payload) / elapsed / 1e6:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
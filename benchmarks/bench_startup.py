@@ -0,0 +1,108 @@
+"""
+Cold-start benchmark: import times and time to the first paint of the window.
+
+Import times come from python -X importtime, for the modules loaded at
+startup and for a provider loaded on first selection. The time to first
+paint is measured from the spawn of the process to the first idle of the Tk
+main loop (written by tinychat through the TINYCHAT_STARTUP_PROBE file), for
+a source run (python -m tinychat) and optionally for a PyInstaller build of
+build.spec (--frozen dist/tinychat). First paint needs a display.
+
+Usage: python -m benchmarks.bench_startup [--repeat N] [--frozen EXECUTABLE]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from tinychat.__main__ import STARTUP_PROBE_ENV
+
+IMPORTS = {
+    "backend": "import tinychat.backend",
+    "ui": "import tinychat.ui.chat",
+    "startup": "import tinychat.backend, tinychat.ui.chat",
+    "provider": "import tinychat.llms.openai",
+}
+
+
+def import_times(statement: str) -> tuple[float, list[tuple[int, str]]]:
+    """Return the total import time (s) and the self time (us) of each module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append((int(self_us), name.strip()))
+        # Top level imports are not indented
+        if not name[1:].startswith(" "):
+            total += int(cumulative_us)
+    return total / 1e6, modules
+
+
+def first_paint(command: list[str]) -> float:
+    """
+    Return the seconds from the spawn of command to the first paint. It runs
+    in a temporary folder, so that the config and archive files are new.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        probe_path = os.path.join(temp_dir, "probe")
+        env = dict(os.environ, PYTHONPATH=os.getcwd())
+        env[STARTUP_PROBE_ENV] = probe_path
+        started = time.time()
+        result = subprocess.run(
+            command, env=env, cwd=temp_dir, capture_output=True, text=True
+        )
+        if not os.path.exists(probe_path):
+            raise RuntimeError(
+                f"{' '.join(command)} exited without painting:\n{result.stderr[-500:]}"
+            )
+        with open(probe_path) as probe:
+            return float(probe.read()) - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--frozen", help="PyInstaller executable built from build.spec")
+    args = parser.parse_args()
+
+    print(f"{'imports':<10} {'median ms':>10}")
+    for name, statement in IMPORTS.items():
+        totals = [import_times(statement)[0] for _ in range(args.repeat)]
+        print(f"{name:<10} {statistics.median(totals) * 1000:>10.1f}")
+
+    _, modules = import_times(IMPORTS["startup"])
+    print(f"\nslowest modules at startup (self time)")
+    for self_us, name in sorted(modules, reverse=True)[: args.top]:
+        print(f"{name:<40} {self_us / 1000:>8.1f} ms")
+
+    commands = {"source": [sys.executable, "-m", "tinychat"]}
+    if args.frozen:
+        commands["frozen"] = [os.path.abspath(args.frozen)]
+    print(f"\n{'first paint':<10} {'median ms':>10} {'min ms':>8}")
+    for name, command in commands.items():
+        try:
+            timings = [first_paint(command) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{name:<10} not measured: {e}")
+            continue
+        print(
+            f"{name:<10} {statistics.median(timings) * 1000:>10.0f} "
+            f"{min(timings) * 1000:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
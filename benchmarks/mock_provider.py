@@ -0,0 +1,292 @@
+"""
+Local HTTP server speaking the streaming wire formats of all the providers.
+
+Routes, by path (the host and the query string are ignored):
+
+    /v1/chat/completions                    OpenAI, Mistral, Together (SSE)
+    /v1/messages                            Anthropic (SSE)
+    /v1beta/models/*:streamGenerateContent  Gemini alt=sse (SSE, CRLF)
+    /v1/chat                                Cohere (NDJSON)
+
+Responses are sent with chunked transfer encoding over keep-alive
+connections, like the real APIs. The streams are synthetic (see recordings)
+or replayed from recorded response bodies, at a configurable token rate,
+chunk size and time to first byte. The first requests can be answered with
+error statuses instead (see failures), to exercise the retries, and the
+body can stall in the middle (see stall), to exercise the timeouts.
+
+Usage: python -m benchmarks.mock_provider [--port N] [--tokens N]
+       [--token-rate TOKENS_PER_S] [--chunk-size BYTES] [--latency S]
+       [--replay ROUTE=FILE ...] [--fail STATUS ...] [--retry-after S]
+       [--stall S]
+"""
+
+import argparse
+import contextlib
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+from benchmarks.recordings import (
+    anthropic_sse,
+    chunked,
+    cohere_ndjson,
+    gemini_sse,
+    openai_sse,
+    sample_tokens,
+)
+
+# route: (content type, event separator, stream builder)
+ROUTES: dict[str, tuple[str, bytes, Callable[[list[str]], bytes]]] = {
+    "chat_completions": ("text/event-stream", b"\n\n", openai_sse),
+    "anthropic": ("text/event-stream", b"\n\n", anthropic_sse),
+    "gemini": ("text/event-stream", b"\r\n\r\n", gemini_sse),
+    "cohere": ("application/stream+json", b"\n", cohere_ndjson),
+}
+
+
+def route_of(path: str) -> Optional[str]:
+    path = urlsplit(path).path
+    if path == "/v1/chat/completions":
+        return "chat_completions"
+    if path == "/v1/messages":
+        return "anthropic"
+    if path.startswith("/v1beta/models/") and path.endswith(":streamGenerateContent"):
+        return "gemini"
+    if path == "/v1/chat":
+        return "cohere"
+    return None
+
+
+def split_events(payload: bytes, separator: bytes) -> list[bytes]:
+    """Split a stream into its events, each one keeping its separator."""
+    events = []
+    start = 0
+    while start < len(payload):
+        end = payload.find(separator, start)
+        end = len(payload) if end == -1 else end + len(separator)
+        events.append(payload[start:end])
+        start = end
+    return events
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockProviderServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        route = route_of(self.path)
+        if route is None:
+            self.send_error(404)
+            return
+        content_type, separator, _ = ROUTES[route]
+        payload = self.server.payload(route)
+        started = time.monotonic()
+        self.server.requests += 1
+        request_id = f"mock-{self.server.requests}"
+
+        status = self.server.next_failure()
+        if status is not None:
+            body = b'{"error": {"message": "Mock failure"}}'
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("x-request-id", request_id)
+            if self.server.retry_after is not None:
+                self.send_header("Retry-After", str(self.server.retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("x-request-id", request_id)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+
+        for offset, piece in self.server.pieces(payload, separator):
+            deadline = started + self.server.deadline(offset, len(payload))
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class MockProviderServer(ThreadingHTTPServer):
+    """
+    The mock provider. Runs in a background thread as a context manager.
+
+    :param tokens: Number of tokens of the synthetic streams.
+    :param token_rate: Tokens sent per second (0: as fast as possible).
+    :param chunk_size: Bytes per write (0: one event per write, like the APIs).
+    :param latency: Seconds before the first byte of the body.
+    :param recordings: Recorded bodies to replay instead, by route.
+    :param failures: Error statuses to answer the first requests with, in order.
+    :param retry_after: Retry-After (seconds) sent with the error statuses.
+    :param stall: Seconds of silence in the middle of the body.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        tokens: int = 500,
+        token_rate: float = 0.0,
+        chunk_size: int = 0,
+        latency: float = 0.0,
+        recordings: Optional[dict[str, bytes]] = None,
+        failures: Optional[list[int]] = None,
+        retry_after: Optional[int] = None,
+        stall: float = 0.0,
+    ) -> None:
+        super().__init__(("127.0.0.1", port), MockProviderHandler)
+        self.tokens = tokens
+        self.token_rate = token_rate
+        self.chunk_size = chunk_size
+        self.latency = latency
+        self.requests = 0
+        self.failures = list(failures or [])
+        self.retry_after = retry_after
+        self.stall = stall
+        self._payloads = dict(recordings or {})
+        self._failures_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def payload(self, route: str) -> bytes:
+        if route not in self._payloads:
+            self._payloads[route] = ROUTES[route][2](sample_tokens(self.tokens))
+        return self._payloads[route]
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients hanging up in the middle of a response are expected (cancelled)
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def next_failure(self) -> Optional[int]:
+        """Return the error status of the next request, if it must fail."""
+        with self._failures_lock:
+            return self.failures.pop(0) if self.failures else None
+
+    def pieces(self, payload: bytes, separator: bytes) -> Iterator[tuple[int, bytes]]:
+        """Yield the writes of a response with the offset where each one ends."""
+        if self.chunk_size:
+            pieces = chunked(payload, self.chunk_size)
+        else:
+            pieces = split_events(payload, separator)
+        offset = 0
+        for piece in pieces:
+            offset += len(piece)
+            yield offset, piece
+
+    def deadline(self, offset: int, size: int) -> float:
+        """Seconds after the request at which the body is sent up to offset."""
+        stall = self.stall if offset > size // 2 else 0.0
+        if not self.token_rate:
+            return self.latency + stall
+        return self.latency + stall + self.tokens * offset / size / self.token_rate
+
+    def __enter__(self) -> "MockProviderServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+# URL attribute of each client class, and the path it is served on
+CLIENT_URLS = {
+    "tinychat.llms.openai.OpenAIClient.OPENAI_COMPLETION_API_URL": "/v1/chat/completions",
+    "tinychat.llms.mistral.MistralClient.MISTRAL_COMPLETION_API_URL": "/v1/chat/completions",
+    "tinychat.llms.together.TogetherClient.TOGHETER_COMPLETION_API_URL": "/v1/chat/completions",
+    "tinychat.llms.anthropic.AnthropicAIClient.ANTHROPIC_MESSAGES_API_URL": "/v1/messages",
+    "tinychat.llms.google.GoogleAIClient.BASE_GEMINI_ENDPOINT": "/v1beta/models/gemini-1.5-pro-latest:streamGenerateContent",
+    "tinychat.llms.cohere.CohereClient.COHERE_CHAT_API_URL": "/v1/chat",
+}
+
+
+@contextlib.contextmanager
+def providers_redirected_to(base_url: str):
+    """Point every client at base_url, with a dummy API key."""
+    with contextlib.ExitStack() as stack:
+        for target, path in CLIENT_URLS.items():
+            stack.enter_context(patch(target, base_url + path))
+        stack.enter_context(
+            patch("tinychat.llms.base.get_secret", return_value="mock-api-key")
+        )
+        yield
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    parser.add_argument("--chunk-size", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument(
+        "--replay",
+        action="append",
+        default=[],
+        metavar="ROUTE=FILE",
+        help=f"replay a recorded body, routes: {', '.join(ROUTES)}",
+    )
+    parser.add_argument(
+        "--fail",
+        type=int,
+        action="append",
+        default=[],
+        metavar="STATUS",
+        help="answer the next request with this status (repeatable)",
+    )
+    parser.add_argument("--retry-after", type=int)
+    parser.add_argument("--stall", type=float, default=0.0)
+    args = parser.parse_args()
+
+    recordings = {}
+    for replay in args.replay:
+        route, _, file_path = replay.partition("=")
+        if route not in ROUTES:
+            parser.error(f"unknown route {route!r}")
+        with open(file_path, "rb") as file:
+            recordings[route] = file.read()
+
+    server = MockProviderServer(
+        args.port,
+        args.tokens,
+        args.token_rate,
+        args.chunk_size,
+        args.latency,
+        recordings,
+        args.fail,
+        args.retry_after,
+        args.stall,
+    )
+    print(f"Listening on {server.url}", flush=True)
+    with contextlib.suppress(KeyboardInterrupt):
+        server.serve_forever()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Provider streams in the exact wire format of each API, used by the benchmarks.
+
+The event layout (field names, event names, separators, keep-alive events)
+mirrors responses recorded from the real endpoints; the token texts are
+generated so that streams of any length can be produced.
+"""
+
+import json
+import random
+
+WORDS = (
+    "the model streams tokens as soon as they are sampled , so a client that "
+    "parses each event quickly keeps the interface responsive . def main ( ) : "
+    "return { 'ok' : True } \n\n ```python\nprint('hello')\n``` café naïve"
+).split(" ")
+
+
+def sample_tokens(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [" " + rng.choice(WORDS) for _ in range(count)]
+
+
+def openai_sse(tokens: list[str]) -> bytes:
+    """OpenAI / Mistral / Together chat completions stream."""
+    events = []
+    base = {
+        "id": "chatcmpl-9abc",
+        "object": "chat.completion.chunk",
+        "created": 1718000000,
+        "model": "gpt-4o-2024-05-13",
+        "system_fingerprint": "fp_abc123",
+    }
+    first = dict(
+        base,
+        choices=[
+            {
+                "index": 0,
+                "delta": {"role": "assistant", "content": ""},
+                "logprobs": None,
+                "finish_reason": None,
+            }
+        ],
+    )
+    events.append(first)
+    for token in tokens:
+        events.append(
+            dict(
+                base,
+                choices=[
+                    {
+                        "index": 0,
+                        "delta": {"content": token},
+                        "logprobs": None,
+                        "finish_reason": None,
+                    }
+                ],
+            )
+        )
+    events.append(
+        dict(
+            base,
+            choices=[
+                {"index": 0, "delta": {}, "logprobs": None, "finish_reason": "stop"}
+            ],
+        )
+    )
+    body = b"".join(
+        b"data: " + json.dumps(event).encode() + b"\n\n" for event in events
+    )
+    return body + b"data: [DONE]\n\n"
+
+
+def anthropic_sse(tokens: list[str]) -> bytes:
+    """Anthropic messages stream."""
+    events = [
+        (
+            "message_start",
+            {
+                "type": "message_start",
+                "message": {
+                    "id": "msg_01abc",
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [],
+                    "model": "claude-3-5-sonnet-20240620",
+                    "stop_reason": None,
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": 25, "output_tokens": 1},
+                },
+            },
+        ),
+        (
+            "content_block_start",
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            },
+        ),
+        ("ping", {"type": "ping"}),
+    ]
+    for token in tokens:
+        events.append(
+            (
+                "content_block_delta",
+                {
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {"type": "text_delta", "text": token},
+                },
+            )
+        )
+    events += [
+        ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        (
+            "message_delta",
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": len(tokens)},
+            },
+        ),
+        ("message_stop", {"type": "message_stop"}),
+    ]
+    return b"".join(
+        b"event: " + name.encode() + b"\ndata: " + json.dumps(event).encode() + b"\n\n"
+        for name, event in events
+    )
+
+
+def gemini_sse(tokens: list[str], tokens_per_event: int = 4) -> bytes:
+    """Gemini streamGenerateContent?alt=sse stream (CRLF separated)."""
+    body = b""
+    for i in range(0, len(tokens), tokens_per_event):
+        event = {
+            "candidates": [
+                {
+                    "content": {
+                        "parts": [{"text": "".join(tokens[i : i + tokens_per_event])}],
+                        "role": "model",
+                    },
+                    "finishReason": (
+                        "STOP" if i + tokens_per_event >= len(tokens) else None
+                    ),
+                    "index": 0,
+                    "safetyRatings": [
+                        {
+                            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                            "probability": "NEGLIGIBLE",
+                        },
+                        {
+                            "category": "HARM_CATEGORY_HATE_SPEECH",
+                            "probability": "NEGLIGIBLE",
+                        },
+                        {
+                            "category": "HARM_CATEGORY_HARASSMENT",
+                            "probability": "NEGLIGIBLE",
+                        },
+                        {
+                            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+                            "probability": "NEGLIGIBLE",
+                        },
+                    ],
+                }
+            ],
+            "usageMetadata": {
+                "promptTokenCount": 10,
+                "candidatesTokenCount": i,
+                "totalTokenCount": 10 + i,
+            },
+        }
+        body += b"data: " + json.dumps(event).encode() + b"\r\n\r\n"
+    return body
+
+
+def cohere_ndjson(tokens: list[str]) -> bytes:
+    """Cohere v1/chat stream (newline delimited JSON)."""
+    events = [
+        {
+            "is_finished": False,
+            "event_type": "stream-start",
+            "generation_id": "4f3b-ab12",
+        }
+    ]
+    for token in tokens:
+        events.append(
+            {"is_finished": False, "event_type": "text-generation", "text": token}
+        )
+    events.append(
+        {
+            "is_finished": True,
+            "event_type": "stream-end",
+            "response": {
+                "response_id": "a1b2",
+                "text": "".join(tokens),
+                "generation_id": "4f3b-ab12",
+                "chat_history": [],
+                "finish_reason": "COMPLETE",
+                "meta": {
+                    "billed_units": {"input_tokens": 10, "output_tokens": len(tokens)}
+                },
+            },
+            "finish_reason": "COMPLETE",
+        }
+    )
+    return b"".join(json.dumps(event).encode() + b"\n" for event in events)
+
+
+def chunked(payload: bytes, chunk_size: int) -> list[bytes]:
+    """Split a payload the way it could come out of the socket."""
+    return [payload[i : i + chunk_size] for i in range(0, len(payload), chunk_size)]
@@ -6,7 +6,15 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # The providers are imported by name on first use, see tinychat/llms/registry.py
+    hiddenimports=[
+        'tinychat.llms.anthropic',
+        'tinychat.llms.cohere',
+        'tinychat.llms.google',
+        'tinychat.llms.mistral',
+        'tinychat.llms.openai',
+        'tinychat.llms.together',
+    ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
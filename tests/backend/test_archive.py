@@ -0,0 +1,139 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tests.fakes import FakeLLM
+from tinychat.backend.archive import ConversationArchive, fts_query
+from tinychat.backend.backend import Backend
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.file_path = os.path.join(self.temp_dir.name, "archive.sqlite3")
+        self.archive = ConversationArchive(self.file_path)
+        self.addCleanup(self.archive.close)
+
+
+class TestConversationArchive(ArchiveTestCase):
+    def add_turn(self, conversation_id, user, assistant, model="GPT-4o"):
+        self.archive.add_message(conversation_id, model, "user", user)
+        self.archive.add_message(conversation_id, model, "assistant", assistant)
+
+    def test_messages_are_stored_in_order(self):
+        conversation_id = self.archive.new_conversation_id()
+        self.add_turn(conversation_id, "  What is  SQLite?\n", "A database.")
+        self.add_turn(conversation_id, "Is it fast?", "Yes.")
+        self.archive.flush()
+
+        [conversation] = self.archive.list_conversations()
+        self.assertEqual(conversation["id"], conversation_id)
+        self.assertEqual(conversation["model"], "GPT-4o")
+        self.assertEqual(conversation["title"], "What is SQLite?")
+        messages = self.archive.load_messages(conversation_id)
+        self.assertEqual(
+            [(m["role"], m["content"]) for m in messages],
+            [
+                ("user", "  What is  SQLite?\n"),
+                ("assistant", "A database."),
+                ("user", "Is it fast?"),
+                ("assistant", "Yes."),
+            ],
+        )
+        self.assertEqual(
+            [m["content"] for m in self.archive.load_messages(conversation_id, 1, 2)],
+            ["A database.", "Is it fast?"],
+        )
+
+    def test_conversations_are_paged_most_recent_first(self):
+        ids = [self.archive.new_conversation_id() for _ in range(5)]
+        for number, conversation_id in enumerate(ids):
+            self.add_turn(conversation_id, f"question {number}", "answer")
+        self.add_turn(ids[0], "one more question", "answer")
+        self.archive.flush()
+
+        first_page = self.archive.list_conversations(0, 3)
+        second_page = self.archive.list_conversations(3, 3)
+        self.assertEqual(
+            [c["id"] for c in first_page + second_page],
+            [ids[0], ids[4], ids[3], ids[2], ids[1]],
+        )
+        self.assertEqual(self.archive.count_messages(), 12)
+        self.assertEqual(self.archive.count_messages(ids[0]), 4)
+
+    def test_search(self):
+        first, second = (self.archive.new_conversation_id() for _ in range(2))
+        self.add_turn(first, "How do I open a file in Python?", "Use open().")
+        self.add_turn(second, "Write a haiku", "Files rest in silence")
+        self.archive.flush()
+
+        results = self.archive.search("python file")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["conversation_id"], first)
+        self.assertEqual(results[0]["role"], "user")
+        self.assertIn("[Python]", results[0]["snippet"])
+        self.assertEqual(self.archive.search("silence")[0]["conversation_id"], second)
+        self.assertEqual(self.archive.search("missing"), [])
+        self.assertEqual(self.archive.search("   "), [])
+        # FTS5 operators and quotes are searched as plain words
+        self.assertEqual(self.archive.search('open() AND "file'), [])
+        self.assertEqual(len(self.archive.search("open()")), 2)
+
+    def test_fts_query(self):
+        self.assertEqual(fts_query('say "hi" NOT'), '"say" """hi""" "NOT"')
+
+    def test_reopened(self):
+        conversation_id = self.archive.new_conversation_id()
+        self.add_turn(conversation_id, "hello", "hi")
+        self.archive.close()
+        self.archive = ConversationArchive(self.file_path)
+        self.assertEqual(self.archive.count_messages(conversation_id), 2)
+
+
+class TestBackendArchive(ArchiveTestCase):
+    @patch("tinychat.backend.backend.ARCHIVE_ENABLED", False)
+    @patch("tinychat.backend.backend.get_secret", return_value="0.5")
+    def setUp(self, mock_get_secret):
+        super().setUp()
+        self.backend = Backend()
+        self.backend.archive = self.archive
+        self.backend._models["GPT-4o"] = FakeLLM
+        self.backend._models["Llama 3.1 8B"] = FakeLLM
+
+    @patch("tinychat.backend.backend.ARCHIVE_ENABLED", True)
+    @patch("tinychat.backend.backend.get_secret", return_value="0.5")
+    def test_without_archive(self, mock_get_secret):
+        # As for the batch runs and the gateway, no file and no writer thread
+        self.assertIsNone(Backend(archive=False).archive)
+
+    def test_turns_are_archived(self):
+        self.backend.set_model("GPT-4o")
+        self.assertEqual("".join(self.backend.get_stream_response("hi")), "Re: hi")
+        self.assertEqual(
+            "".join(self.backend.get_stream_response("again")), "Re: again"
+        )
+        # New Chat starts a new conversation
+        self.backend.new_chat()
+        "".join(self.backend.get_stream_response("new"))
+        self.archive.flush()
+
+        conversations = self.archive.list_conversations()
+        self.assertEqual([c["title"] for c in conversations], ["new", "hi"])
+        self.assertEqual(self.archive.count_messages(conversations[1]["id"]), 4)
+
+    def test_fanout_turns_are_archived(self):
+        self.backend.set_fanout_models(["GPT-4o", "Llama 3.1 8B"])
+        futures = self.backend.get_fanout_responses("hi", lambda *args: None)
+        for future in futures.values():
+            future.result()
+        self.archive.flush()
+        conversations = self.archive.list_conversations()
+        self.assertEqual(
+            sorted(c["model"] for c in conversations), ["GPT-4o", "Llama 3.1 8B"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
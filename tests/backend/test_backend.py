@@ -0,0 +1,144 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tests.fakes import FakeLLM
+from tinychat.backend.backend import Backend
+
+
+def join_prewarms():
+    for thread in threading.enumerate():
+        if thread.name == "tinychat-prewarm":
+            thread.join()
+
+
+class TestBackendFanOut(unittest.TestCase):
+    @patch("tinychat.backend.backend.ARCHIVE_ENABLED", False)
+    @patch("tinychat.backend.backend.get_secret", return_value="0.5")
+    def setUp(self, mock_get_secret):
+        self.backend = Backend()
+        self.llms = {
+            "GPT-4o": FakeLLM(pieces=["Hello", " there"], delay=0.2),
+            "Llama 3.1 8B": FakeLLM(pieces=["Hi"], delay=0.2),
+            "Mistral Large": FakeLLM(
+                error=ValueError("Server responded with error: 500")
+            ),
+        }
+        for model_name, llm in self.llms.items():
+            llm.last_metrics = MagicMock()
+            self.backend._models[model_name] = lambda llm=llm: llm
+
+    def test_set_fanout_models(self):
+        self.backend.set_fanout_models(["GPT-4o", "Llama 3.1 8B"])
+        self.assertEqual(self.backend.fanout_models(), ["GPT-4o", "Llama 3.1 8B"])
+        self.assertEqual(self.llms["GPT-4o"].name, "GPT-4o")
+        self.assertEqual(
+            self.llms["GPT-4o"].context_budget, self.backend.context_budget("GPT-4o")
+        )
+        with self.assertRaises(KeyError):
+            self.backend.set_fanout_models(["GPT-5"])
+        self.backend.set_fanout_models([])
+        self.assertEqual(self.backend.fanout_models(), [])
+
+    def test_responses_are_streamed_concurrently(self):
+        self.backend.set_fanout_models(["GPT-4o", "Llama 3.1 8B", "Mistral Large"])
+        received = []
+        started = time.monotonic()
+        futures = self.backend.get_fanout_responses(
+            "hello", lambda model_name, piece: received.append((model_name, piece))
+        )
+        self.assertIs(futures["GPT-4o"].result(), self.llms["GPT-4o"].last_metrics)
+        self.assertIs(
+            futures["Llama 3.1 8B"].result(), self.llms["Llama 3.1 8B"].last_metrics
+        )
+        with self.assertRaises(ValueError):
+            futures["Mistral Large"].result()
+        # the slowest model sets the time, not the sum of the latencies
+        self.assertLess(time.monotonic() - started, 0.35)
+
+        self.assertEqual(
+            sorted(received),
+            [("GPT-4o", " there"), ("GPT-4o", "Hello"), ("Llama 3.1 8B", "Hi")],
+        )
+        for llm in self.llms.values():
+            self.assertEqual(llm.inputs, ["hello"])
+        self.assertNotEqual(
+            self.llms["GPT-4o"].threads, self.llms["Llama 3.1 8B"].threads
+        )
+
+    def test_no_fanout_models(self):
+        with self.assertRaises(ValueError):
+            self.backend.get_fanout_responses("hello", MagicMock())
+
+
+class TestBackend(unittest.TestCase):
+    @patch("tinychat.backend.backend.ARCHIVE_ENABLED", False)
+    @patch("tinychat.backend.backend.get_secret", return_value="0.5")
+    def setUp(self, mock_get_secret):
+        self.backend = Backend()
+
+    def test_export_conversation(self):
+        llm = MagicMock()
+        llm.export_conversation.return_value = "You: hi\nLLM: hello"
+        self.backend._models["GPT-4o"] = lambda: llm
+        self.backend.set_model("GPT-4o")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "chat.txt")
+            self.backend.export_conversation(file_path)
+            with open(file_path) as f:
+                self.assertEqual(f.read(), "You: hi\nLLM: hello")
+
+    def test_cancel(self):
+        llms = {"GPT-4o": MagicMock(), "Mistral Large": MagicMock()}
+        for model_name, llm in llms.items():
+            self.backend._models[model_name] = lambda llm=llm: llm
+        self.backend.cancel()
+        self.backend.set_model("GPT-4o")
+        self.backend.set_fanout_models(["Mistral Large"])
+        self.backend.cancel()
+        llms["GPT-4o"].cancel.assert_called_once_with()
+        llms["Mistral Large"].cancel.assert_called_once_with()
+
+    def test_handlers_are_reused(self):
+        llm = MagicMock()
+        factory = MagicMock(return_value=llm)
+        self.backend._models["GPT-4o"] = factory
+        self.backend.set_model("GPT-4o")
+        llm.reset.assert_not_called()
+        self.backend.new_chat()
+        self.backend.set_model("GPT-4o")
+        factory.assert_called_once_with()
+        self.assertEqual(llm.reset.call_count, 2)
+        join_prewarms()
+        self.assertEqual(llm.prewarm.call_count, 3)
+
+    @patch("tinychat.backend.backend.get_secret", return_value="0.2")
+    def test_reload_settings(self, mock_get_secret):
+        factory = MagicMock()
+        self.backend._models["GPT-4o"] = factory
+        self.backend.set_model("GPT-4o")
+        self.backend.reload_settings()
+        self.assertEqual(self.backend.temperature, 0.2)
+        self.backend.new_chat()
+        self.assertEqual(factory.call_count, 2)
+
+    def test_prewarm_errors_are_ignored(self):
+        llm = MagicMock()
+        llm.prewarm.side_effect = OSError("Name or service not known")
+        self.backend._models["GPT-4o"] = lambda: llm
+        self.backend.set_model("GPT-4o")
+        join_prewarms()
+        llm.prewarm.assert_called_once_with()
+
+    @patch("tinychat.backend.backend.handler_class")
+    def test_models_are_created_through_the_registry(self, mock_handler_class):
+        self.backend.set_model("Gemini Pro 1.5")
+        mock_handler_class.assert_called_once_with("google")
+        mock_handler_class.return_value.assert_called_once_with(0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tinychat.backend.cache import ResponseCache
+from tinychat.llms.openai import OpenAIClient, OpenAIHandler
+from tinychat.llms.streams import SSEStream
+
+
+def sse(*contents):
+    return [
+        f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}\n\n".encode()
+        for c in contents
+    ] + [b"data: [DONE]\n\n"]
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.file_path = os.path.join(self.temp_dir.name, "cache.sqlite3")
+
+    def make_cache(self, **kwargs):
+        cache = ResponseCache(self.file_path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_put_and_get(self):
+        cache = self.make_cache()
+        self.assertIsNone(cache.get("key"))
+        cache.put("key", "GPT-4o", [(0.1, "Hello"), (0.2, " world")])
+        self.assertEqual(cache.get("key"), [(0.1, "Hello"), (0.2, " world")])
+
+    def test_persisted(self):
+        self.make_cache().put("key", "GPT-4o", [(0.1, "Hello")])
+        self.assertEqual(self.make_cache().get("key"), [(0.1, "Hello")])
+
+    @patch("tinychat.backend.cache.time.time")
+    def test_expired_responses_are_not_returned(self, mock_time):
+        cache = self.make_cache(ttl=60)
+        mock_time.return_value = 1000.0
+        cache.put("key", "GPT-4o", [(0.1, "Hello")])
+        mock_time.return_value = 1059.0
+        self.assertIsNotNone(cache.get("key"))
+        mock_time.return_value = 1061.0
+        self.assertIsNone(cache.get("key"))
+
+    @patch("tinychat.backend.cache.time.time")
+    def test_least_recently_used_are_evicted(self, mock_time):
+        response = [(0.0, "x" * 100)]
+        size = len(json.dumps(response))
+        cache = self.make_cache(max_bytes=3 * size)
+        for now, key in enumerate(["a", "b", "c"]):
+            mock_time.return_value = float(now)
+            cache.put(key, "GPT-4o", response)
+        mock_time.return_value = 10.0
+        cache.get("a")
+        mock_time.return_value = 11.0
+        cache.put("d", "GPT-4o", response)
+        self.assertIsNone(cache.get("b"))
+        for key in ["a", "c", "d"]:
+            self.assertIsNotNone(cache.get(key))
+
+
+class TestHandlerResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(":memory:")
+        self.addCleanup(self.cache.close)
+
+    def make_handler(self, temperature=0.0):
+        handler = OpenAIHandler("gpt-4o", temperature)
+        handler.response_cache = self.cache
+        return handler
+
+    @patch.object(OpenAIClient, "perform_stream_request")
+    @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
+    def test_identical_requests_are_replayed(self, mock_api_key, mock_request):
+        mock_request.side_effect = lambda messages: SSEStream(sse("Hello", " world"))
+
+        first = self.make_handler()
+        self.assertEqual(list(first.stream_response("hi")), ["Hello", " world"])
+        second = self.make_handler()
+        # whitespace around the messages is ignored
+        self.assertEqual(list(second.stream_response("hi\n")), ["Hello", " world"])
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertIsNone(second.last_metrics)
+        self.assertEqual(
+            second._messages.to_wire(second.message_format),
+            [
+                {"role": "user", "content": "hi\n"},
+                {"role": "assistant", "content": "Hello world"},
+            ],
+        )
+
+        # a different history or different parameters are not cached
+        list(second.stream_response("hi"))
+        list(self.make_handler(temperature=0.5).stream_response("hi"))
+        self.assertEqual(mock_request.call_count, 3)
+
+    @patch("tinychat.llms.base.Canceller.sleep")
+    def test_realtime_replay(self, mock_sleep):
+        with patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock):
+            handler = self.make_handler()
+        response = [(0.5, "Hello"), (0.7, " world")]
+        self.assertEqual(
+            list(handler.replay_response(response, True)), ["Hello", " world"]
+        )
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertAlmostEqual(mock_sleep.call_args_list[0].args[0], 0.5, places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from benchmarks.mock_provider import MockProviderServer
+from benchmarks.recordings import sample_tokens
+from tests.fakes import FakeLLM
+from tinychat.backend.archive import ConversationArchive
+from tinychat.backend.backend import Backend
+from tinychat.backend.race import Race
+from tinychat.llms.base import (
+    USER_ROLE,
+    RequestCancelled,
+    close_http_session,
+)
+from tinychat.llms.mistral import MistralHandler
+from tinychat.llms.openai import OpenAIHandler
+
+
+class TestRace(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown)
+
+    def race(self, primary, backup, deadline=0.1):
+        race = Race(primary, backup, deadline, self.executor)
+        return race, "".join(race.stream())
+
+    def test_primary_answers_within_the_deadline(self):
+        primary = FakeLLM("primary", ["Hello", " there"])
+        backup = FakeLLM("backup", ["Hi"])
+        race, response = self.race(primary, backup)
+        self.assertEqual(response, "Hello there")
+        self.assertIs(race.winner, primary)
+        self.assertFalse(backup.started)
+
+    def test_backup_wins_after_the_deadline(self):
+        primary = FakeLLM("primary", ["Hello"], delay=5)
+        backup = FakeLLM("backup", ["Hi"])
+        started = time.monotonic()
+        race, response = self.race(primary, backup)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response, "Hi")
+        self.assertIs(race.winner, backup)
+        self.assertTrue(primary.cancelled.is_set())
+        self.assertFalse(backup.cancelled.is_set())
+
+    def test_backup_is_started_when_the_primary_fails(self):
+        primary = FakeLLM("primary", [], error=ValueError("500"))
+        backup = FakeLLM("backup", ["Hi"])
+        race, response = self.race(primary, backup, deadline=10)
+        self.assertEqual(response, "Hi")
+        self.assertIs(race.winner, backup)
+
+    def test_error_of_the_primary_when_both_fail(self):
+        primary = FakeLLM("primary", [], delay=0.2, error=ValueError("primary"))
+        backup = FakeLLM("backup", [], error=ValueError("backup"))
+        with self.assertRaisesRegex(ValueError, "primary"):
+            self.race(primary, backup)
+
+    def test_closing_cancels_the_racers(self):
+        primary = FakeLLM("primary", ["Hello", " there"])
+        backup = FakeLLM("backup", ["Hi"])
+        race = Race(primary, backup, 0.1, self.executor)
+        stream = race.stream()
+        next(stream)
+        stream.close()
+        self.assertTrue(primary.cancelled.is_set())
+
+    def test_stopped_primary_does_not_start_the_backup(self):
+        primary = FakeLLM("primary", ["Hello"], delay=5)
+        backup = FakeLLM("backup", ["Hi"])
+        threading.Timer(0.05, primary.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            self.race(primary, backup, deadline=1)
+        self.assertFalse(backup.started)
+
+
+class TestBackendRace(unittest.TestCase):
+    @patch("tinychat.backend.backend.ARCHIVE_ENABLED", False)
+    @patch("tinychat.backend.backend.get_secret", return_value="0.5")
+    def setUp(self, mock_get_secret):
+        self.backend = Backend()
+        self.primary = FakeLLM("GPT-4o", ["Hello"], delay=5)
+        self.backup = FakeLLM("Mistral Large", ["Hi"])
+        self.backend._models["GPT-4o"] = lambda: self.primary
+        self.backend._models["Mistral Large"] = lambda: self.backup
+        self.backend.race_deadline = 0.1
+
+    def test_only_the_winner_is_added_to_the_history(self):
+        self.backend.set_race_model("Mistral Large")
+        self.backend.set_model("GPT-4o")
+        self.assertEqual(self.backend.race_model(), "Mistral Large")
+        self.assertIs(self.backup.conversation, self.primary.conversation)
+        response = "".join(self.backend.get_stream_response("hello"))
+        self.assertEqual(response, "Hi")
+        self.assertEqual(self.backend.race_winner, "Mistral Large")
+        messages = [(m.role, m.content) for m in self.primary.conversation]
+        self.assertEqual(messages, [(USER_ROLE, "hello"), ("assistant", "Hi")])
+
+    def test_archived_under_the_winner(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        archive = ConversationArchive(os.path.join(temp_dir.name, "archive.sqlite3"))
+        self.addCleanup(archive.close)
+        self.backend.archive = archive
+        self.backend.set_race_model("Mistral Large")
+        self.backend.set_model("GPT-4o")
+        self.assertEqual("".join(self.backend.get_stream_response("hello")), "Hi")
+        archive.flush()
+        [conversation] = archive.list_conversations()
+        self.assertEqual(conversation["model"], "Mistral Large")
+
+    def test_set_race_model(self):
+        with self.assertRaises(KeyError):
+            self.backend.set_race_model("GPT-5")
+        self.backend.set_race_model(None)
+        self.assertIsNone(self.backend.race_model())
+        self.backend.set_model("GPT-4o")
+        self.assertIsNone(self.backend._race_backup)
+
+
+class TestRaceEndToEnd(unittest.TestCase):
+    """The loser is waiting for its headers, its connection is shut down."""
+
+    def tearDown(self):
+        close_http_session()
+
+    def test_slow_primary_is_cancelled(self):
+        slow = MockProviderServer(tokens=20, latency=5)
+        fast = MockProviderServer(tokens=20)
+        with slow, fast, patch(
+            "tinychat.llms.openai.OpenAIClient.OPENAI_COMPLETION_API_URL",
+            slow.url + "/v1/chat/completions",
+        ), patch(
+            "tinychat.llms.mistral.MistralClient.MISTRAL_COMPLETION_API_URL",
+            fast.url + "/v1/chat/completions",
+        ), patch(
+            "tinychat.llms.base.get_secret", return_value="mock-api-key"
+        ):
+            primary = OpenAIHandler("gpt-4o")
+            backup = MistralHandler("mistral-large-latest")
+            backup.conversation = primary.conversation
+            primary.conversation.append(USER_ROLE, "hello")
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                started = time.monotonic()
+                race = Race(primary, backup, 0.2, executor)
+                response = "".join(race.stream())
+                self.assertIs(race.winner, backup)
+            # The executor waited for the primary to give up
+            self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(response, "".join(sample_tokens(20)))
+        self.assertEqual(primary.last_metrics.error, "RequestCancelled")
+        self.assertIsNone(backup.last_metrics.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
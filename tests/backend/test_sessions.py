@@ -0,0 +1,185 @@
+import gc
+import os
+import tempfile
+import unittest
+import weakref
+from unittest.mock import patch
+
+from tests.fakes import FakeLLM
+from tinychat.backend.backend import Backend
+from tinychat.backend.sessions import SessionRegistry
+from tinychat.llms.base import ASSISTANT_ROLE, USER_ROLE, Conversation
+
+
+def conversation_of(*contents):
+    conversation = Conversation()
+    for index, content in enumerate(contents):
+        conversation.append(USER_ROLE if index % 2 == 0 else ASSISTANT_ROLE, content)
+    return conversation
+
+
+class TestSessionRegistry(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.file_path = os.path.join(self.temp_dir.name, "sessions.sqlite3")
+
+    def make_registry(self, max_chars):
+        registry = SessionRegistry(self.file_path, max_chars=max_chars)
+        self.addCleanup(registry.close)
+        return registry
+
+    def test_least_recently_used_are_evicted(self):
+        registry = self.make_registry(max_chars=20)
+        first = registry.create("GPT-4o", conversation_of("a" * 10))
+        second = registry.create("Mistral Large", conversation_of("b" * 10))
+        self.assertFalse(os.path.exists(self.file_path))
+        third = registry.create("GPT-4o", conversation_of("c" * 10))
+        self.assertIsNone(first.conversation)
+        self.assertIsNotNone(second.conversation)
+        self.assertEqual(first.title, "a" * 10)
+
+        self.assertIs(registry.get(first.id), first)
+        self.assertEqual(
+            [(m.role, m.content) for m in first.conversation], [(USER_ROLE, "a" * 10)]
+        )
+        self.assertEqual(
+            first.conversation.digest(), conversation_of("a" * 10).digest()
+        )
+        self.assertIsNone(second.conversation)
+        self.assertEqual(
+            [session.id for session in registry.sessions()],
+            [first.id, third.id, second.id],
+        )
+
+    def test_in_use_and_pinned_are_kept(self):
+        registry = self.make_registry(max_chars=5)
+        first = registry.create("GPT-4o", conversation_of("a" * 10))
+        self.assertIsNotNone(first.conversation)
+        with registry.pinned(first):
+            registry.create("GPT-4o", conversation_of("b" * 10))
+            self.assertIsNotNone(first.conversation)
+        registry.create("GPT-4o", conversation_of("c" * 10))
+        self.assertIsNone(first.conversation)
+
+    def test_remove(self):
+        registry = self.make_registry(max_chars=0)
+        first = registry.create("GPT-4o", conversation_of("a"))
+        registry.create("GPT-4o", conversation_of("b"))
+        registry.remove(first.id)
+        self.assertEqual(len(registry), 1)
+        with self.assertRaises(KeyError):
+            registry.get(first.id)
+
+    def test_shared_file(self):
+        registry = self.make_registry(max_chars=0)
+        first = registry.create("GPT-4o", conversation_of("a"))
+        registry.create("GPT-4o", conversation_of("b"))
+        other = self.make_registry(max_chars=0)
+        other.create("GPT-4o", conversation_of("c"))
+        other.create("GPT-4o", conversation_of("d"))
+        self.assertIsNotNone(registry.get(first.id).conversation)
+        other.close()
+        (count,) = registry._db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        self.assertEqual(count, 1)
+
+    def test_lost_history(self):
+        registry = self.make_registry(max_chars=0)
+        first = registry.create("GPT-4o", conversation_of("a"))
+        registry.create("GPT-4o", conversation_of("b"))
+        with registry._db:
+            registry._db.execute("DELETE FROM sessions")
+        with self.assertRaisesRegex(KeyError, "The history of the chat 'a' was lost"):
+            registry.get(first.id)
+        self.assertEqual(len(registry), 1)
+
+    def test_temporary_file(self):
+        registry = SessionRegistry("", max_chars=0)
+        self.addCleanup(registry.close)
+        first = registry.create("GPT-4o", conversation_of("a"))
+        registry.create("GPT-4o", conversation_of("b"))
+        self.assertIsNone(first.conversation)
+        self.assertIsNotNone(registry.get(first.id).conversation)
+
+
+class TestBackendSessions(unittest.TestCase):
+    @patch("tinychat.backend.backend.ARCHIVE_ENABLED", False)
+    @patch("tinychat.backend.backend.get_secret", return_value="0.5")
+    def setUp(self, mock_get_secret):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.backend = Backend()
+        self.backend.sessions = SessionRegistry(
+            os.path.join(self.temp_dir.name, "sessions.sqlite3"), max_chars=10
+        )
+        self.addCleanup(self.backend.sessions.close)
+        self.backend._models["GPT-4o"] = FakeLLM
+        self.backend._models["Llama 3.1 8B"] = FakeLLM
+
+    def send(self, user_input):
+        return "".join(self.backend.get_stream_response(user_input))
+
+    def test_switch_session(self):
+        self.backend.set_model("GPT-4o")
+        self.send("first chat")
+        first = self.backend.session_id()
+        self.backend.set_model("Llama 3.1 8B")
+        self.send("second chat")
+        self.backend.new_chat()
+        self.send("third chat")
+        self.assertEqual(
+            [title for _, _, title in self.backend.open_sessions()],
+            ["third chat", "second chat", "first chat"],
+        )
+        # Evicted, past 10 characters
+        self.assertIsNone(self.backend.sessions.sessions()[2].conversation)
+
+        self.assertEqual(self.backend.switch_session(first), "GPT-4o")
+        # The chat left, evicted in turn, stays open
+        self.assertEqual(len(self.backend.open_sessions()), 3)
+        self.assertEqual(self.send("again"), "Re: again")
+        self.assertEqual(
+            self.backend.messages(),
+            [
+                (USER_ROLE, "first chat"),
+                (ASSISTANT_ROLE, "Re: first chat"),
+                (USER_ROLE, "again"),
+                (ASSISTANT_ROLE, "Re: again"),
+            ],
+        )
+        self.assertEqual(
+            self.backend.messages(2, 4),
+            [(USER_ROLE, "again"), (ASSISTANT_ROLE, "Re: again")],
+        )
+        self.assertEqual(self.backend.message_count(), 4)
+        with self.assertRaises(KeyError):
+            self.backend.switch_session("unknown")
+
+    def test_evicted_history_is_freed(self):
+        self.backend.set_model("GPT-4o")
+        self.send("first chat")
+        first = weakref.ref(self.backend.sessions.sessions()[0].conversation)
+        self.backend.set_model("Llama 3.1 8B")
+        self.send("second chat")
+        self.assertIsNone(self.backend.sessions.sessions()[1].conversation)
+        gc.collect()
+        self.assertIsNone(first())
+
+    def test_empty_sessions_are_dropped(self):
+        self.backend.set_model("GPT-4o")
+        self.backend.set_model("Llama 3.1 8B")
+        self.backend.new_chat()
+        self.assertEqual(len(self.backend.open_sessions()), 1)
+
+    def test_close_session(self):
+        self.backend.set_model("GPT-4o")
+        self.send("first chat")
+        first = self.backend.session_id()
+        self.backend.close_session(first)
+        self.assertNotEqual(self.backend.session_id(), first)
+        self.assertEqual(self.backend.messages(), [])
+        self.assertEqual(len(self.backend.open_sessions()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
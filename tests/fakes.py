@@ -0,0 +1,94 @@
+import threading
+from typing import Generator, Optional
+
+from tinychat.llms.base import (
+    ASSISTANT_ROLE,
+    USER_ROLE,
+    Conversation,
+    RequestCancelled,
+)
+
+
+class FakeLLM:
+    """
+    A handler following LLMProtocol, without a provider. It answers with
+    pieces, by default "Re: " and the prompt, after delay seconds, or raises
+    error then. Like the handlers, cancel() makes the response being streamed
+    raise RequestCancelled, and the part received is kept in the history.
+
+    :param name: The model name.
+    :param pieces: The pieces of every response.
+    :param delay: Seconds before the first piece.
+    :param error: Raised instead of responding.
+    :param provider: The provider, for the batch runs.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        pieces: Optional[list[str]] = None,
+        delay: float = 0.0,
+        error: Optional[Exception] = None,
+        provider: str = "",
+    ) -> None:
+        self.name = name
+        self.pieces = pieces
+        self.delay = delay
+        self.error = error
+        self.provider = provider
+        self.context_budget = None
+        self.trimmed_messages = 0
+        self.last_metrics = None
+        self.response_cache = None
+        self.conversation = Conversation()
+        self.cancelled = threading.Event()
+        # What the fake was asked, and on which threads
+        self.started = False
+        self.inputs: list[str] = []
+        self.threads: set[str] = set()
+
+    def stream_response(self, user_input: str) -> Generator[str, None, None]:
+        self.inputs.append(user_input)
+        conversation = self.conversation
+        conversation.append(USER_ROLE, user_input)
+        response = []
+        try:
+            for piece in self.stream_reply():
+                response.append(piece)
+                yield piece
+        except RequestCancelled:
+            conversation.end_cancelled_turn("".join(response))
+            raise
+        conversation.append(ASSISTANT_ROLE, "".join(response))
+
+    def stream_reply(self) -> Generator[str, None, None]:
+        self.started = True
+        self.threads.add(threading.current_thread().name)
+        cancelled = self.cancelled
+        if cancelled.wait(self.delay):
+            raise RequestCancelled("The request was cancelled.")
+        if self.error is not None:
+            raise self.error
+        pieces = self.pieces
+        if pieces is None:
+            pieces = ["Re: ", self.conversation[-1].content]
+        for piece in pieces:
+            if cancelled.is_set():
+                raise RequestCancelled("The request was cancelled.")
+            yield piece
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def queue_turn(self) -> None:
+        self.cancelled = threading.Event()
+
+    def reset(self) -> None:
+        self.conversation = Conversation()
+        self.cancelled = threading.Event()
+
+    def prewarm(self) -> None:
+        pass
+
+    def export_conversation(self) -> str:
+        return self.conversation.export()
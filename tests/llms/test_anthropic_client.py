@@ -8,55 +8,52 @@ from tinychat.llms.anthropic import AnthropicAIClient
 
 
 class TestAnthropicAIClientStreaming(unittest.TestCase):
-    @patch("tinychat.llms.anthropic.requests.post")
+    @patch("tinychat.llms.base.get_http_session")
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
-    def test_perform_stream_request_success(self, mock_api_key, mock_post):
+    def test_perform_stream_request_success(self, mock_api_key, mock_get_http_session):
         # Setting a dummy value for mock_api_key is not strictly needed here
 
         # Mocking the response
         mock_response = Mock(spec=Response)
         mock_response.status_code = 200
-        mock_post.return_value = mock_response
+        mock_get_http_session.return_value.post.return_value = mock_response
 
-        # Creating mock events
-        mock_event1 = MagicMock()
-        mock_event1.data = json.dumps(
-            {"type": "content_block_delta", "delta": {"text": "part1"}}
+        # Raw SSE bytes as read from the socket, with named events
+        mock_response.iter_content.return_value = iter(
+            [
+                b"event: content_block_delta\r\n"
+                b'data: {"type": "content_block_delta", "delta": {"text": "part1"}}\r\n\r\n',
+                b"event: ping\r\n"
+                b'data: {"type": "ping"}\r\n\r',
+                b"\nevent: content_block_delta\r\n"
+                b'data: {"type": "content_block_delta", "delta": {"text": "part2"}}\r\n\r\n',
+                b'event: message_stop\r\ndata: {"type": "message_stop"}\r\n\r\n',
+            ]
         )
-        mock_event2 = MagicMock()
-        mock_event2.data = json.dumps(
-            {"type": "content_block_delta", "delta": {"text": "part2"}}
-        )
-        mock_event_done = MagicMock()
-        mock_event_done.data = json.dumps({"type": "done"})
-
-        # Mocking SSEClient to return test events
-        with patch("tinychat.llms.anthropic.SSEClient") as mock_sse_client:
-            test_stream = iter([mock_event1, mock_event2, mock_event_done])
-            mock_sse_client.return_value.events = MagicMock(return_value=test_stream)
 
-            client = AnthropicAIClient(model_name="test_model", temperature=0.0)
-            messages = [{"role": "user", "content": "hello"}]
-            stream = client.perform_stream_request(messages)
+        client = AnthropicAIClient(model_name="test_model", temperature=0.0)
+        messages = [{"role": "user", "content": "hello"}]
+        stream = client.perform_stream_request(messages)
 
-            # Extracting and verifying the stream response
-            responses = []
-            for event in stream.events():
-                event_data = json.loads(event.data)
-                if event_data.get("type") == "content_block_delta":
-                    responses.append(event_data["delta"]["text"])
+        # Extracting and verifying the stream response
+        responses = []
+        for data in stream.events():
+            event_data = json.loads(data)
+            if event_data.get("type") == "content_block_delta":
+                responses.append(event_data["delta"]["text"])
 
-            self.assertEqual(responses, ["part1", "part2"])
+        self.assertEqual(responses, ["part1", "part2"])
 
-    @patch("tinychat.llms.anthropic.requests.post")
+    @patch("tinychat.llms.base.get_http_session")
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
-    def test_perform_stream_request_failure(self, mock_api_key, mock_post):
+    def test_perform_stream_request_failure(self, mock_api_key, mock_get_http_session):
         # Setting a dummy value for mock_api_key is not strictly needed here
 
         # Mocking the response with an error status code
         mock_response = Mock(spec=Response)
         mock_response.status_code = 400
-        mock_post.return_value = mock_response
+        mock_response.headers = {}
+        mock_get_http_session.return_value.post.return_value = mock_response
 
         client = AnthropicAIClient(model_name="test_model", temperature=0.0)
         messages = [{"role": "user", "content": "hello"}]
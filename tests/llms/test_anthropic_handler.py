@@ -1,6 +1,8 @@
 import json
+import threading
 import unittest
-from unittest.mock import MagicMock, Mock, patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
 
 from tinychat.llms.anthropic import AnthropicAIClient, AnthropicAIHandler
 
@@ -12,43 +14,37 @@ class TestAnthropicAIHandlerStreaming(unittest.TestCase):
     def test_stream_response_success(self, mock_api_key, mock_perform_stream_request):
         # Setting a dummy value for mock_api_key is not strictly needed here
 
-        # Create a mock SSEClient with a mock events method
-        mock_sse_client = MagicMock()
+        # Create a mock SSEStream yielding the data of each event
+        mock_sse_stream = MagicMock()
         mock_stream = iter(
             [
-                Mock(
-                    data=json.dumps(
-                        {
-                            "type": "content_block_start",
-                            "index": 0,
-                            "content_block": {"type": "text", "text": ""},
-                        }
-                    )
+                json.dumps(
+                    {
+                        "type": "content_block_start",
+                        "index": 0,
+                        "content_block": {"type": "text", "text": ""},
+                    }
                 ),
-                Mock(data=json.dumps({"type": "ping"})),
-                Mock(
-                    data=json.dumps(
-                        {
-                            "type": "content_block_delta",
-                            "index": 0,
-                            "delta": {"type": "text_delta", "text": "Hello"},
-                        }
-                    )
+                json.dumps({"type": "ping"}),
+                json.dumps(
+                    {
+                        "type": "content_block_delta",
+                        "index": 0,
+                        "delta": {"type": "text_delta", "text": "Hello"},
+                    }
                 ),
-                Mock(
-                    data=json.dumps(
-                        {
-                            "type": "content_block_delta",
-                            "index": 0,
-                            "delta": {"type": "text_delta", "text": "!"},
-                        }
-                    )
+                json.dumps(
+                    {
+                        "type": "content_block_delta",
+                        "index": 0,
+                        "delta": {"type": "text_delta", "text": "!"},
+                    }
                 ),
-                Mock(data=json.dumps({"type": "content_block_stop", "index": 0})),
+                json.dumps({"type": "content_block_stop", "index": 0}),
             ]
         )
-        mock_sse_client.events.return_value = mock_stream
-        mock_perform_stream_request.return_value = mock_sse_client
+        mock_sse_stream.events.return_value = mock_stream
+        mock_perform_stream_request.return_value = mock_sse_stream
 
         handler = AnthropicAIHandler(model_name="test_model")
         generator = handler.stream_response("hello")
@@ -60,9 +56,138 @@ class TestAnthropicAIHandlerStreaming(unittest.TestCase):
 
         self.assertEqual(responses, ["Hello", "!"])
         self.assertEqual(
-            handler._messages,
+            handler._messages.to_wire(handler.message_format),
             [
                 {"role": "user", "content": "hello"},
                 {"role": "assistant", "content": "Hello!"},
             ],
         )
+
+
+class AnthropicStandIn(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the messages endpoint that emulates prompt caching:
+    the prefix ending at each cache breakpoint is cached, and the usage fields
+    of message_start report how many prompt tokens were written and read.
+    """
+
+    cached_prefixes: dict = {}
+    received: list = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.received.append((dict(self.headers), body))
+
+        blocks = []
+        for block in body.get("system", []):
+            blocks.append(("system", block))
+        for message in body["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            for block in content:
+                blocks.append((message["role"], block))
+
+        def prefix_key(end):
+            return json.dumps([(role, block["text"]) for role, block in blocks[:end]])
+
+        def tokens(end):
+            return sum(len(block["text"]) // 4 for _, block in blocks[:end])
+
+        breakpoints = [
+            index + 1
+            for index, (_, block) in enumerate(blocks)
+            if "cache_control" in block
+        ]
+        read = max(
+            [
+                tokens(end)
+                for end in breakpoints
+                if prefix_key(end) in self.cached_prefixes
+            ]
+            + [0]
+        )
+        written = tokens(breakpoints[-1]) - read if breakpoints else 0
+        for end in breakpoints:
+            self.cached_prefixes[prefix_key(end)] = True
+
+        usage = {
+            "input_tokens": tokens(len(blocks)) - read - written,
+            "cache_creation_input_tokens": written,
+            "cache_read_input_tokens": read,
+            "output_tokens": 1,
+        }
+        events = [
+            {"type": "message_start", "message": {"usage": usage}},
+            {"type": "content_block_delta", "delta": {"text": "ok"}},
+            {"type": "message_delta", "usage": {"output_tokens": 2}},
+            {"type": "message_stop"},
+        ]
+        payload = b"".join(
+            b"event: "
+            + event["type"].encode()
+            + b"\ndata: "
+            + json.dumps(event).encode()
+            + b"\n\n"
+            for event in events
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAnthropicAIHandlerPromptCaching(unittest.TestCase):
+    def setUp(self):
+        AnthropicStandIn.cached_prefixes = {}
+        AnthropicStandIn.received = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), AnthropicStandIn)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/messages"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
+    def test_conversation_prefix_is_cached(self, mock_api_key):
+        handler = AnthropicAIHandler(
+            model_name="test_model", system_prompt="You are a careful assistant. " * 50
+        )
+        handler._client.ANTHROPIC_MESSAGES_API_URL = self.url
+
+        self.assertEqual(list(handler.stream_response("first question " * 40)), ["ok"])
+        first_usage = handler.last_usage
+        self.assertGreater(first_usage["cache_creation_input_tokens"], 0)
+        self.assertEqual(first_usage["cache_read_input_tokens"], 0)
+        self.assertEqual(first_usage["output_tokens"], 2)
+        # Reported with the metrics of the response
+        self.assertEqual(
+            handler.last_metrics.cache_creation_tokens,
+            first_usage["cache_creation_input_tokens"],
+        )
+        self.assertEqual(handler.last_metrics.cache_read_tokens, 0)
+
+        self.assertEqual(list(handler.stream_response("second question")), ["ok"])
+        second_usage = handler.last_usage
+        self.assertEqual(
+            second_usage["cache_read_input_tokens"],
+            first_usage["cache_creation_input_tokens"],
+        )
+        self.assertEqual(second_usage["input_tokens"], 0)
+        self.assertEqual(
+            handler.last_metrics.cache_read_tokens,
+            first_usage["cache_creation_input_tokens"],
+        )
+
+        headers, body = AnthropicStandIn.received[-1]
+        self.assertIn("prompt-caching-2024-07-31", headers["anthropic-beta"])
+        self.assertEqual(body["system"][0]["cache_control"], {"type": "ephemeral"})
+        # Breakpoints on the last two user messages only
+        self.assertIn("cache_control", body["messages"][0]["content"][0])
+        self.assertEqual(body["messages"][1], {"role": "assistant", "content": "ok"})
+        self.assertIn("cache_control", body["messages"][2]["content"][0])
@@ -0,0 +1,91 @@
+import threading
+import time
+import unittest
+
+from benchmarks.bench_e2e import HANDLERS
+from benchmarks.mock_provider import MockProviderServer, providers_redirected_to
+from tinychat.llms.base import (
+    ASSISTANT_ROLE,
+    USER_ROLE,
+    RequestCancelled,
+    close_http_session,
+)
+
+
+class TestCancellation(unittest.TestCase):
+    """Responses cancelled from another thread, against the mock provider."""
+
+    def tearDown(self):
+        close_http_session()
+
+    def cancel_later(self, handler, delay):
+        cancelled_at = []
+
+        def cancel():
+            cancelled_at.append(time.monotonic())
+            handler.cancel()
+
+        threading.Timer(delay, cancel).start()
+        return cancelled_at
+
+    def test_cancel_in_the_middle_of_the_body(self):
+        for name in ("anthropic", "gemini", "cohere"):
+            server = MockProviderServer(tokens=500, token_rate=100)
+            with self.subTest(handler=name), server, providers_redirected_to(
+                server.url
+            ):
+                handler = HANDLERS[name]()
+                received = []
+                cancelled_at = self.cancel_later(handler, 0.3)
+                with self.assertRaises(RequestCancelled):
+                    for piece in handler.stream_response("hello"):
+                        received.append(piece)
+                latency = time.monotonic() - cancelled_at[0]
+                self.assertLess(latency, 0.05)
+                self.assertTrue(received)
+                messages = [(m.role, m.content) for m in handler.conversation]
+                self.assertEqual(
+                    messages,
+                    [(USER_ROLE, "hello"), (ASSISTANT_ROLE, "".join(received))],
+                )
+                self.assertEqual(handler.last_metrics.error, "RequestCancelled")
+
+    def test_cancel_while_waiting_for_the_headers(self):
+        server = MockProviderServer(tokens=10, latency=5)
+        with server, providers_redirected_to(server.url):
+            handler = HANDLERS["openai"]()
+            cancelled_at = self.cancel_later(handler, 0.2)
+            with self.assertRaises(RequestCancelled):
+                list(handler.stream_response("hello"))
+            self.assertLess(time.monotonic() - cancelled_at[0], 0.05)
+        # Nothing was received, the question is taken back
+        self.assertEqual(len(handler.conversation), 0)
+
+    def test_cancel_after_the_end(self):
+        server = MockProviderServer(tokens=10)
+        with server, providers_redirected_to(server.url):
+            handler = HANDLERS["mistral"]()
+            list(handler.stream_response("hello"))
+            handler.cancel()
+            list(handler.stream_response("hello again"))
+        self.assertEqual(len(handler.conversation), 4)
+        # The connection went back to the pool and was reused
+        self.assertEqual(handler.last_metrics.connect, 0.0)
+
+    def test_cancel_while_queued(self):
+        server = MockProviderServer(tokens=10)
+        with server, providers_redirected_to(server.url):
+            handler = HANDLERS["openai"]()
+            handler.queue_turn()
+            handler.cancel()
+            with self.assertRaises(RequestCancelled):
+                list(handler.stream_response("hello"))
+            self.assertEqual(server.requests, 0)
+            # The next turn is not cancelled
+            list(handler.stream_response("hello"))
+            self.assertEqual(server.requests, 1)
+        self.assertEqual(len(handler.conversation), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,34 +4,44 @@ from unittest.mock import MagicMock, patch, Mock
 import requests
 
 from tinychat.llms.cohere import CohereClient
+from tinychat.llms.streams import NDJSONStream
 
 
 class TestCohereClientStreaming(unittest.TestCase):
-    @patch("tinychat.llms.cohere.requests.post")
+    @patch("tinychat.llms.base.get_http_session")
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
-    def test_perform_stream_request_success(self, mock_api_key, mock_post):
+    def test_perform_stream_request_success(self, mock_api_key, mock_get_http_session):
         # Setting a dummy value for mock_api_key is not strictly needed here
         
         mock_response = Mock(spec=requests.Response)
         mock_response.status_code = 200
-        mock_post.return_value = mock_response
+        mock_get_http_session.return_value.post.return_value = mock_response
         client = CohereClient(temperature=0.0)
         chat_history = [
             {"role": "User", "message": "hello"},
             {"role": "Chatbot", "message": "hello!"},
         ]
-        response = client.perform_stream_request("how are you?", chat_history)
-        self.assertIsInstance(response, requests.Response)
-        self.assertEqual(response.status_code, 200)
+        mock_response.iter_content.return_value = iter(
+            [
+                b'{"event_type": "text-generation", "text": "I am"}\n{"event_ty',
+                b'pe": "text-generation", "text": " fine"}\n',
+            ]
+        )
+        stream = client.perform_stream_request("how are you?", chat_history)
+        self.assertIsInstance(stream, NDJSONStream)
+        self.assertEqual(
+            [event["text"] for event in stream.events()], ["I am", " fine"]
+        )
 
-    @patch("tinychat.llms.cohere.requests.post")
+    @patch("tinychat.llms.base.get_http_session")
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
-    def test_perform_stream_request_failure(self, mock_api_key, mock_post):
+    def test_perform_stream_request_failure(self, mock_api_key, mock_get_http_session):
         # Setting a dummy value for mock_api_key is not strictly needed here
         
         mock_response = Mock(spec=requests.Response)
         mock_response.status_code = 400
-        mock_post.return_value = mock_response
+        mock_response.headers = {}
+        mock_get_http_session.return_value.post.return_value = mock_response
         client = CohereClient(temperature=0.0)
         chat_history = [
             {"role": "User", "message": "hello"},
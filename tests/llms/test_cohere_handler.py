@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import MagicMock, patch
 
 from tinychat.llms.cohere import CohereHandler, CohereClient
+from tinychat.llms.streams import NDJSONStream
 
 
 class TestCohereHandlerStreaming(unittest.TestCase):
@@ -10,15 +11,18 @@ class TestCohereHandlerStreaming(unittest.TestCase):
     def test_stream_response_success(self, mock_api_key, mock_perform_stream_request):
         # Setting a dummy value for mock_api_key is not strictly needed here
 
-        # Mocking the stream of responses
-        mock_stream = [b'{"event_type": "text-generation", "text": "Hi!"}', 
-                       b'{"event_type": "text-generation", "text": "How can I help?"}']
-        mock_perform_stream_request.return_value = mock_stream
+        # Mocking the stream of responses, with events split across chunks
+        mock_stream = [
+            b'{"event_type": "stream-start"}\n{"event_type": "text-gen',
+            b'eration", "text": "Hi!"}\n{"event_type": "text-generation", ',
+            b'"text": "How can I help?"}\n{"event_type": "stream-end"}\n',
+        ]
+        mock_perform_stream_request.return_value = NDJSONStream(iter(mock_stream))
 
         handler = CohereHandler()
         user_input = "hello"
         generator = handler.stream_response(user_input)
-        
+
         # Collecting responses from the generator
         responses = [resp for resp in generator]
 
@@ -26,8 +30,14 @@ class TestCohereHandlerStreaming(unittest.TestCase):
         expected_responses = ["Hi!", "How can I help?"]
         expected_chat_history = [
             {"role": "User", "message": user_input},
-            {"role": "Chatbot", "message": "".join(expected_responses)}
+            {"role": "Chatbot", "message": "".join(expected_responses)},
         ]
 
         self.assertEqual(responses, expected_responses)
-        self.assertEqual(handler._chat_history, expected_chat_history)
+        # The user input is not repeated in the chat history sent along with it
+        message, chat_history = mock_perform_stream_request.call_args.args
+        self.assertEqual(message, user_input)
+        self.assertEqual(bytes(chat_history), b"[]")
+        self.assertEqual(
+            handler._messages.to_wire(handler.message_format), expected_chat_history
+        )
@@ -0,0 +1,74 @@
+import unittest
+
+from benchmarks.bench_e2e import HANDLERS
+from benchmarks.mock_provider import MockProviderServer, providers_redirected_to
+from benchmarks.recordings import sample_tokens
+from tinychat.llms.base import close_http_session
+from tinychat.llms.retry import ProviderError, reset_circuit_breakers
+
+
+class TestEndToEndStreaming(unittest.TestCase):
+    """Every handler against the mock provider, through the real wire path."""
+
+    TOKENS = 50
+
+    def tearDown(self):
+        close_http_session()
+        reset_circuit_breakers()
+
+    def assert_streams(self, server):
+        expected = "".join(sample_tokens(self.TOKENS))
+        with server, providers_redirected_to(server.url):
+            for name, make_handler in HANDLERS.items():
+                with self.subTest(handler=name):
+                    handler = make_handler()
+                    for _ in range(2):
+                        response = "".join(handler.stream_response("hello"))
+                        self.assertEqual(response, expected)
+                    self.assertEqual(len(handler._messages), 4)
+        self.assertEqual(server.requests, 2 * len(HANDLERS))
+
+    def test_one_event_per_write(self):
+        self.assert_streams(MockProviderServer(tokens=self.TOKENS))
+
+    def test_events_split_across_writes(self):
+        self.assert_streams(MockProviderServer(tokens=self.TOKENS, chunk_size=7))
+
+    def test_transient_errors_are_retried(self):
+        server = MockProviderServer(
+            tokens=self.TOKENS, failures=[429, 503], retry_after=0
+        )
+        with server, providers_redirected_to(server.url):
+            handler = HANDLERS["openai"]()
+            response = "".join(handler.stream_response("hello"))
+        self.assertEqual(response, "".join(sample_tokens(self.TOKENS)))
+        self.assertEqual(server.requests, 3)
+
+    def test_fatal_errors_are_typed(self):
+        server = MockProviderServer(tokens=self.TOKENS, failures=[401])
+        with server, providers_redirected_to(server.url):
+            handler = HANDLERS["anthropic"]()
+            with self.assertRaises(ProviderError) as context:
+                "".join(handler.stream_response("hello"))
+        self.assertEqual(context.exception.status, 401)
+        self.assertEqual(context.exception.provider, "anthropic")
+        self.assertEqual(context.exception.request_id, "mock-1")
+        self.assertEqual(server.requests, 1)
+
+    def test_prewarmed_connection(self):
+        server = MockProviderServer(tokens=self.TOKENS)
+        with server, providers_redirected_to(server.url):
+            cold = HANDLERS["mistral"]()
+            "".join(cold.stream_response("hello"))
+            close_http_session()
+            warm = HANDLERS["mistral"]()
+            warm.prewarm()
+            "".join(warm.stream_response("hello"))
+        self.assertGreater(cold.last_metrics.connect, 0.0)
+        # The handshakes were done by prewarm(), which sent no request
+        self.assertEqual(warm.last_metrics.connect, 0.0)
+        self.assertEqual(server.requests, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,32 +8,23 @@ from tinychat.llms.google import GoogleAIClient
 
 
 class TestGoogleAIClientStreaming(unittest.TestCase):
-    @patch("tinychat.llms.google.requests.post")
-    @patch("tinychat.llms.google.SSEClient")
+    @patch("tinychat.llms.base.get_http_session")
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
-    def test_perform_stream_request_success(self, mock_api_key, mock_sse_client, mock_post):
+    def test_perform_stream_request_success(self, mock_api_key, mock_get_http_session):
         # Setting a dummy value for mock_api_key is not strictly needed here
 
-        # Mocking SSEClient and the response
+        # Mocking the response
         mock_response = Mock(spec=Response)
         mock_response.status_code = 200
-        mock_post.return_value = mock_response
-
-        # Creating mock events
-        mock_event1 = MagicMock()
-        mock_event1.data = json.dumps(
-            {"candidates": [{"content": {"parts": [{"text": "part1"}]}}]}
-        )
-        mock_event2 = MagicMock()
-        mock_event2.data = json.dumps(
-            {"candidates": [{"content": {"parts": [{"text": "part2"}]}}]}
+        mock_get_http_session.return_value.post.return_value = mock_response
+
+        # Raw SSE bytes as read from the socket
+        mock_response.iter_content.return_value = iter(
+            [
+                b'data: {"candidates": [{"content": {"parts": [{"text": "part1"}]}}]}\r\n\r\n',
+                b'data: {"candidates": [{"content": {"parts": [{"text": "part2"}]}}]}\r\n\r\n',
+            ]
         )
-        mock_event_done = MagicMock()
-        mock_event_done.data = "[DONE]"
-
-        # Setting up a test stream
-        test_stream = [mock_event1, mock_event2, mock_event_done]
-        mock_sse_client.return_value.events = MagicMock(return_value=iter(test_stream))
 
         client = GoogleAIClient(temperature = 0.0)
         messages = [{"parts": [{"text": "content"}], "role": "user"}]
@@ -41,9 +32,9 @@ class TestGoogleAIClientStreaming(unittest.TestCase):
 
         # Extracting and verifying the stream response
         responses = []
-        for event in stream.events():
-            if event.data != "[DONE]":
-                event_data = json.loads(event.data)
+        for data in stream.events():
+            if data != "[DONE]":
+                event_data = json.loads(data)
                 response_piece = event_data["candidates"][0]["content"]["parts"][0][
                     "text"
                 ]
@@ -51,15 +42,16 @@ class TestGoogleAIClientStreaming(unittest.TestCase):
 
         self.assertEqual(responses, ["part1", "part2"])
 
-    @patch("tinychat.llms.google.requests.post")
+    @patch("tinychat.llms.base.get_http_session")
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
-    def test_perform_stream_request_failure(self, mock_api_key, mock_post):
+    def test_perform_stream_request_failure(self, mock_api_key, mock_get_http_session):
         # Setting a dummy value for mock_api_key is not strictly needed here
         
         # Mocking the response with an error status code
         mock_response = Mock(spec=Response)
         mock_response.status_code = 400
-        mock_post.return_value = mock_response
+        mock_response.headers = {}
+        mock_get_http_session.return_value.post.return_value = mock_response
 
         client = GoogleAIClient(temperature = 0.0)
         messages = [{"parts": [{"text": "content"}], "role": "user"}]
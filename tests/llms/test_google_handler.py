@@ -1,6 +1,6 @@
 import json
 import unittest
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import MagicMock, patch
 
 from tinychat.llms.google import GoogleAIHandler, GoogleAIClient
 
@@ -11,32 +11,28 @@ class TestGoogleGeminiHandlerStreaming(unittest.TestCase):
     def test_stream_response(self, mock_api_key, mock_perform_stream_request):
         # Setting a dummy value for mock_api_key is not strictly needed here
 
-        # Create a mock SSEClient with a mock events method
-        mock_sse_client = MagicMock()
+        # Create a mock SSEStream yielding the data of each event
+        mock_sse_stream = MagicMock()
         mock_stream = iter(
             [
-                Mock(
-                    data=json.dumps(
-                        {
-                            "candidates": [
-                                {"content": {"parts": [{"text": "response part 1"}]}}
-                            ]
-                        }
-                    )
+                json.dumps(
+                    {
+                        "candidates": [
+                            {"content": {"parts": [{"text": "response part 1"}]}}
+                        ]
+                    }
                 ),
-                Mock(
-                    data=json.dumps(
-                        {
-                            "candidates": [
-                                {"content": {"parts": [{"text": "response part 2"}]}}
-                            ]
-                        }
-                    )
+                json.dumps(
+                    {
+                        "candidates": [
+                            {"content": {"parts": [{"text": "response part 2"}]}}
+                        ]
+                    }
                 ),
             ]
         )
-        mock_sse_client.events.return_value = mock_stream
-        mock_perform_stream_request.return_value = mock_sse_client
+        mock_sse_stream.events.return_value = mock_stream
+        mock_perform_stream_request.return_value = mock_sse_stream
 
         handler = GoogleAIHandler()
         generator = handler.stream_response("hello")
@@ -51,4 +47,6 @@ class TestGoogleGeminiHandlerStreaming(unittest.TestCase):
             {"parts": [{"text": "hello"}], "role": "user"},
             {"parts": [{"text": "response part 1response part 2"}], "role": "model"},
         ]
-        self.assertEqual(handler._messages, expected_messages)
+        self.assertEqual(
+            handler._messages.to_wire(handler.message_format), expected_messages
+        )
@@ -1,7 +1,25 @@
+import json
+import socket
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
-from tinychat.llms.base import BaseLLMClient
+from tinychat.llms.base import (
+    ASSISTANT_ROLE,
+    USER_ROLE,
+    BaseLLMClient,
+    Conversation,
+    RawJSON,
+    PooledHTTPConnectionPool,
+    PooledHTTPSConnectionPool,
+    chat_completions_message,
+    close_http_session,
+    encode_json_body,
+    estimate_tokens,
+    get_http_session,
+    pop_connect_time,
+)
+from tinychat.llms.cohere import cohere_message
+from tinychat.llms.google import google_message
 from tinychat.settings import SECRETS_FILE_PATH
 
 
@@ -32,3 +50,152 @@ class TestBaseLLMClient(unittest.TestCase):
         }
         self.assertEqual(client.default_headers(), expected_headers)
 
+
+class TestHTTPSession(unittest.TestCase):
+
+    def tearDown(self):
+        close_http_session()
+
+    @patch('tinychat.llms.base.get_secret')
+    def test_session_is_shared_between_clients(self, mock_get_secret):
+        mock_get_secret.return_value = 'some-api-key'
+        first = BaseLLMClient(api_key_name='test_api_key_name')
+        second = BaseLLMClient(api_key_name='test_api_key_name')
+        self.assertIs(first.session, second.session)
+        self.assertIs(first.session, get_http_session())
+
+    def test_session_uses_pooled_connection_pools(self):
+        adapter = get_http_session().get_adapter("https://api.openai.com")
+        pool = adapter.poolmanager.connection_from_url("https://api.openai.com")
+        self.assertIsInstance(pool, PooledHTTPSConnectionPool)
+
+    @patch('urllib3.connectionpool.is_connection_dropped', return_value=False)
+    @patch('tinychat.llms.base.time.monotonic')
+    def test_idle_connections_are_evicted(self, mock_monotonic, mock_dropped):
+        pool = PooledHTTPSConnectionPool("example.com", maxsize=1)
+        conn = pool._get_conn()
+        conn.close = MagicMock()
+        mock_monotonic.return_value = 100.0
+        pool._put_conn(conn)
+        mock_monotonic.return_value = 110.0
+        self.assertIs(pool._get_conn(), conn)
+        conn.close.assert_not_called()
+        pool._put_conn(conn)
+        mock_monotonic.return_value = 1000.0
+        self.assertIs(pool._get_conn(), conn)
+        conn.close.assert_called_once()
+
+    def test_connect_time_is_measured(self):
+        listener = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(listener.close)
+        pool = PooledHTTPConnectionPool('127.0.0.1', listener.getsockname()[1])
+        conn = pool._get_conn()
+        pop_connect_time()
+        conn.connect()
+        conn.close()
+        self.assertGreater(pop_connect_time(), 0.0)
+        self.assertEqual(pop_connect_time(), 0.0)
+
+
+class TestConversation(unittest.TestCase):
+
+    def setUp(self):
+        self.conversation = Conversation()
+        self.conversation.append(USER_ROLE, "hello")
+        self.conversation.append(ASSISTANT_ROLE, "hi!")
+
+    def test_wire_formats(self):
+        self.assertEqual(
+            self.conversation.to_wire(google_message),
+            [
+                {"parts": [{"text": "hello"}], "role": "user"},
+                {"parts": [{"text": "hi!"}], "role": "model"},
+            ],
+        )
+        self.assertEqual(
+            self.conversation.to_wire(cohere_message),
+            [
+                {"role": "User", "message": "hello"},
+                {"role": "Chatbot", "message": "hi!"},
+            ],
+        )
+
+    def test_wire_format_is_memoized_and_shares_the_text(self):
+        first = self.conversation.to_wire(google_message)
+        second = self.conversation.to_wire(google_message)
+        self.assertIs(first[0], second[0])
+        self.assertIs(first[0]["parts"][0]["text"], self.conversation[0].content)
+
+    def test_export(self):
+        self.conversation.append(USER_ROLE, "bye")
+        self.assertEqual(self.conversation.export(), "You: helloLLM: hi!\n\nYou: bye")
+
+    def test_encode_matches_json_dumps(self):
+        self.assertEqual(
+            json.loads(bytes(self.conversation.encode(google_message))),
+            self.conversation.to_wire(google_message),
+        )
+
+    def test_messages_are_encoded_once(self):
+        self.conversation.encode(chat_completions_message)
+        self.conversation.append(USER_ROLE, "caf\u00e9")
+        with patch("tinychat.llms.base.json.dumps", wraps=json.dumps) as mock_dumps:
+            encoded = self.conversation.encode(chat_completions_message)
+            mock_dumps.assert_called_once_with({"role": "user", "content": "caf\u00e9"})
+        self.assertIsInstance(encoded, RawJSON)
+        self.assertEqual(
+            json.loads(bytes(encoded)),
+            self.conversation.to_wire(chat_completions_message),
+        )
+
+    def test_encode_json_body_splices_raw_json(self):
+        messages = RawJSON([b"[", b'{"a": 1}', b"]"])
+        body = encode_json_body({"model": "gpt-4o", "messages": messages, "stream": True})
+        self.assertEqual(
+            body, b'{"model":"gpt-4o","messages":[{"a": 1}],"stream":true}'
+        )
+
+
+class TestContextWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.conversation = Conversation()
+        for turn in range(5):
+            self.conversation.append(USER_ROLE, f"question {turn} " + "x" * 400)
+            self.conversation.append(ASSISTANT_ROLE, f"answer {turn} " + "y" * 400)
+        self.conversation.append(USER_ROLE, "last question")
+        self.message_tokens = self.conversation[0].tokens
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens("a" * 400), 101)
+        self.assertEqual(estimate_tokens("\u00e9" * 30), 21)
+
+    def test_everything_fits(self):
+        messages, trimmed = self.conversation.window(None)
+        self.assertEqual(len(messages), 11)
+        self.assertEqual(trimmed, 0)
+        messages, trimmed = self.conversation.window(100_000)
+        self.assertEqual(len(messages), 11)
+        self.assertEqual(trimmed, 0)
+
+    def test_first_exchange_is_pinned_and_recent_messages_kept(self):
+        budget = self.message_tokens * 5 + self.conversation[-1].tokens
+        messages, trimmed = self.conversation.window(budget)
+        contents = [message.content.split(" ")[:2] for message in messages]
+        self.assertEqual(
+            contents,
+            [
+                ["question", "0"],
+                ["answer", "0"],
+                ["question", "4"],
+                ["answer", "4"],
+                ["last", "question"],
+            ],
+        )
+        self.assertEqual(trimmed, 6)
+
+    def test_last_message_is_always_sent(self):
+        messages, trimmed = self.conversation.window(1)
+        self.assertEqual(messages[-1].content, "last question")
+        self.assertEqual(messages[0].role, USER_ROLE)
+        self.assertEqual(trimmed, 8)
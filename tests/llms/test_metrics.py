@@ -0,0 +1,131 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tinychat.llms.metrics import MetricsRecorder, TurnMetrics, percentile
+from tinychat.llms.openai import OpenAIClient, OpenAIHandler
+from tinychat.llms.streams import SSEStream
+
+
+def sse(*contents):
+    return [
+        f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}\n\n".encode()
+        for c in contents
+    ] + [b"data: [DONE]\n\n"]
+
+
+class TestTurnMetrics(unittest.TestCase):
+    @patch("tinychat.llms.metrics.time.monotonic")
+    def test_timings(self, mock_monotonic):
+        mock_monotonic.side_effect = [10.0, 10.5, 11.0, 11.1, 11.4, 12.0]
+        metrics = TurnMetrics("model")
+        metrics.response_started(connect=0.2)
+        for token in ["a", "bb", "ccc"]:
+            metrics.token_received(token)
+        stream = SSEStream([])
+        stream.first_chunk_at = 10.8
+        stream.bytes_received = 123
+        metrics.finish(stream)
+
+        self.assertEqual(metrics.connect, 0.2)
+        self.assertEqual(metrics.headers, 0.5)
+        self.assertAlmostEqual(metrics.first_byte, 0.8)
+        self.assertEqual(metrics.first_token, 1.0)
+        self.assertEqual(metrics.total, 2.0)
+        self.assertEqual((metrics.tokens, metrics.chars), (3, 6))
+        self.assertEqual(metrics.bytes_received, 123)
+        self.assertAlmostEqual(metrics.gap_max, 0.3)
+        self.assertAlmostEqual(metrics.tokens_per_second, 2 / 0.4)
+
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(percentile(values, 0.5), 50.0)
+        self.assertEqual(percentile(values, 0.99), 99.0)
+        self.assertEqual(percentile([3.0], 0.9), 3.0)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+
+class TestMetricsRecorder(unittest.TestCase):
+    def make_turn(self, model, total, error=None):
+        turn = TurnMetrics(model)
+        turn.total = total
+        turn.tokens = 10
+        turn.error = error
+        return turn
+
+    def test_ring_is_bounded(self):
+        recorder = MetricsRecorder(size=3)
+        for total in range(5):
+            recorder.record(self.make_turn("m", float(total)))
+        self.assertEqual([turn.total for turn in recorder.turns()], [2.0, 3.0, 4.0])
+
+    def test_summary_by_model(self):
+        recorder = MetricsRecorder()
+        for total in range(1, 11):
+            recorder.record(self.make_turn("fast", total / 10))
+        recorder.record(self.make_turn("slow", 5.0))
+        recorder.record(self.make_turn("slow", 0.1, error="ValueError"))
+
+        summary = recorder.summary()
+        self.assertEqual(summary["fast"]["turns"], 10)
+        self.assertEqual(summary["fast"]["tokens"], 100)
+        self.assertEqual(summary["fast"]["total"]["p50"], 0.5)
+        self.assertEqual(summary["fast"]["total"]["p90"], 0.9)
+        # failed responses are counted but left out of the latencies
+        self.assertEqual(summary["slow"]["errors"], 1)
+        self.assertEqual(summary["slow"]["total"]["p50"], 5.0)
+        self.assertEqual(summary["slow"]["total"]["count"], 1)
+
+    def test_prometheus(self):
+        recorder = MetricsRecorder()
+        turn = self.make_turn('say "hi"', 2.0)
+        turn.cache_read_tokens = 1024
+        recorder.record(turn)
+        text = recorder.prometheus()
+        self.assertIn("# TYPE tinychat_total_seconds summary", text)
+        self.assertIn(
+            'tinychat_total_seconds{model="say \\"hi\\"",quantile="0.5"} 2.0', text
+        )
+        self.assertIn('tinychat_turns_total{model="say \\"hi\\""} 1', text)
+        self.assertIn(
+            'tinychat_cache_read_tokens_total{model="say \\"hi\\""} 1024', text
+        )
+        self.assertTrue(text.endswith("\n"))
+
+
+class TestHandlerMetrics(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("tinychat.llms.base.turn_metrics", MetricsRecorder())
+        self.recorder = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(OpenAIClient, "perform_stream_request")
+    @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
+    def test_stream_response_is_recorded(self, mock_api_key, mock_request):
+        mock_request.return_value = SSEStream(sse("Hello", " world"))
+        handler = OpenAIHandler(model_name="test_model")
+        self.assertEqual(list(handler.stream_response("hi")), ["Hello", " world"])
+
+        [turn] = self.recorder.turns()
+        self.assertEqual(turn.model, "test_model")
+        self.assertEqual((turn.tokens, turn.chars), (2, 11))
+        self.assertEqual(turn.bytes_received, sum(map(len, sse("Hello", " world"))))
+        self.assertIsNone(turn.error)
+        self.assertIsNotNone(turn.first_byte)
+        self.assertLessEqual(turn.first_token, turn.total)
+
+    @patch.object(OpenAIClient, "perform_stream_request")
+    @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
+    def test_failed_request_is_recorded(self, mock_api_key, mock_request):
+        mock_request.side_effect = ValueError("Server responded with error: 500")
+        handler = OpenAIHandler(model_name="test_model")
+        with self.assertRaises(ValueError):
+            list(handler.stream_response("hi"))
+
+        [turn] = self.recorder.turns()
+        self.assertEqual(turn.error, "ValueError")
+        self.assertEqual(turn.tokens, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
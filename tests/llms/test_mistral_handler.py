@@ -1,6 +1,6 @@
 import json
 import unittest
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import MagicMock, patch
 
 from tinychat.llms.mistral import MistralClient, MistralHandler
 
@@ -10,26 +10,18 @@ class TestMistralHandlerStreaming(unittest.TestCase):
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
     def test_stream_response(self, mock_api_key, mock_perform_stream_request):
         # Setting a dummy value for mock_api_key is not strictly needed here
-        
-        # Create a mock SSEClient with a mock events method
-        mock_sse_client = MagicMock()
+
+        # Create a mock SSEStream yielding the data of each event
+        mock_sse_stream = MagicMock()
         mock_stream = iter(
             [
-                Mock(
-                    data=json.dumps(
-                        {"choices": [{"delta": {"content": "response part 1"}}]}
-                    )
-                ),
-                Mock(
-                    data=json.dumps(
-                        {"choices": [{"delta": {"content": "response part 2"}}]}
-                    )
-                ),
-                Mock(data="[DONE]"),
+                json.dumps({"choices": [{"delta": {"content": "response part 1"}}]}),
+                json.dumps({"choices": [{"delta": {"content": "response part 2"}}]}),
+                "[DONE]",
             ]
         )
-        mock_sse_client.events.return_value = mock_stream
-        mock_perform_stream_request.return_value = mock_sse_client
+        mock_sse_stream.events.return_value = mock_stream
+        mock_perform_stream_request.return_value = mock_sse_stream
 
         handler = MistralHandler(model_name="test_model")
         generator = handler.stream_response("hello")
@@ -41,7 +33,7 @@ class TestMistralHandlerStreaming(unittest.TestCase):
 
         self.assertEqual(responses, ["response part 1", "response part 2"])
         self.assertEqual(
-            handler._messages,
+            handler._messages.to_wire(handler.message_format),
             [
                 {"role": "user", "content": "hello"},
                 {"role": "assistant", "content": "response part 1response part 2"},
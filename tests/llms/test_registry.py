@@ -0,0 +1,57 @@
+import subprocess
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tinychat.llms import registry
+from tinychat.llms.openai import OpenAIHandler
+
+
+class TestRegistry(unittest.TestCase):
+    def test_handler_class(self):
+        self.assertIs(registry.handler_class("openai"), OpenAIHandler)
+        for provider in registry.PROVIDERS:
+            self.assertTrue(callable(registry.handler_class(provider)))
+        with self.assertRaises(KeyError):
+            registry.handler_class("unknown")
+
+    def test_providers_are_imported_on_first_use(self):
+        code = (
+            "import sys, tinychat.backend, tinychat.llms.registry as registry\n"
+            "print(sorted(m for m in sys.modules if m.startswith("
+            "('tinychat.llms.', 'requests', 'tkinter'))))\n"
+            "registry.handler_class('cohere')\n"
+            "print('tinychat.llms.cohere' in sys.modules, 'requests' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        before, after = result.stdout.splitlines()
+        # Only the modules without requests
+        self.assertEqual(
+            before,
+            "['tinychat.llms.conversation', 'tinychat.llms.metrics', "
+            "'tinychat.llms.registry', 'tinychat.llms.retry', 'tinychat.llms.streams']",
+        )
+        self.assertEqual(after, "True True")
+
+    @patch("tinychat.llms.registry.MODEL_ENTRY_POINTS_ENABLED", True)
+    def test_entry_point_models(self):
+        entry_point = MagicMock()
+        entry_point.name = "My Model"
+        with patch(
+            "importlib.metadata.entry_points", return_value=[entry_point]
+        ) as mock_entry_points:
+            models = registry.entry_point_models()
+        mock_entry_points.assert_called_once_with(group="tinychat.models")
+        self.assertEqual(models, {"My Model": entry_point.load})
+        entry_point.load.assert_not_called()
+
+    def test_entry_point_models_disabled(self):
+        with patch("importlib.metadata.entry_points") as mock_entry_points:
+            self.assertEqual(registry.entry_point_models(), {})
+        mock_entry_points.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+import time
+import unittest
+from email.utils import formatdate
+from unittest.mock import Mock, patch
+
+import requests
+
+from tinychat.llms.base import BaseLLMClient, Canceller, RequestCancelled
+from tinychat.llms.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ProviderError,
+    backoff_delay,
+    circuit_breaker,
+    parse_retry_after,
+    reset_circuit_breakers,
+)
+
+
+def make_response(status_code, headers=None):
+    response = Mock(spec=requests.Response)
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    return response
+
+
+class TestRetryHelpers(unittest.TestCase):
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertEqual(parse_retry_after("0.5"), 0.5)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        in_a_minute = parse_retry_after(formatdate(usegmt=True))
+        self.assertLess(in_a_minute, 1.0)
+
+    def test_backoff_delay(self):
+        for attempt in range(10):
+            delay = backoff_delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(8.0, 0.5 * 2**attempt))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker("openai", failures=2, reset_timeout=10)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.before_request()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        with self.assertRaises(CircuitOpenError) as context:
+            self.breaker.before_request()
+        self.assertEqual(context.exception.provider, "openai")
+        self.assertIsNone(context.exception.status)
+
+    @patch("tinychat.llms.retry.time.monotonic")
+    def test_half_open_trial(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        mock_monotonic.return_value = 111.0
+        # A single trial request goes through
+        self.breaker.before_request()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+        # Its failure opens the circuit again
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+        mock_monotonic.return_value = 122.0
+        self.breaker.before_request()
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open)
+        self.breaker.before_request()
+
+    @patch("tinychat.llms.retry.time.monotonic")
+    def test_released_trial(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        mock_monotonic.return_value = 111.0
+        trial = self.breaker.before_request()
+        self.breaker.release_trial(trial)
+        # Neither a success nor a failure, the next request is the trial
+        next_trial = self.breaker.before_request()
+        self.assertTrue(self.breaker.is_open)
+        self.breaker.record_failure()
+        mock_monotonic.return_value = 122.0
+        self.breaker.before_request()
+        # A recorded trial is not released again, with the new one in flight
+        self.breaker.release_trial(next_trial)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+
+
+class TestPostStream(unittest.TestCase):
+    def setUp(self):
+        reset_circuit_breakers()
+        self.addCleanup(reset_circuit_breakers)
+        with patch("tinychat.llms.base.get_secret", return_value="key"):
+            self.client = BaseLLMClient("API_KEY")
+        self.client.PROVIDER = "test"
+        session_patcher = patch("tinychat.llms.base.get_http_session")
+        self.post = session_patcher.start().return_value.post
+        self.addCleanup(session_patcher.stop)
+        sleep_patcher = patch("tinychat.llms.base.time.sleep")
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def post_stream(self):
+        return self.client.post_stream("http://test", {}, b"{}")
+
+    def test_retry_after_is_honored(self):
+        ok = make_response(200)
+        self.post.side_effect = [
+            make_response(429, {"Retry-After": "2"}),
+            make_response(529, {"retry-after-ms": "1500"}),
+            ok,
+        ]
+        self.assertIs(self.post_stream(), ok)
+        self.assertEqual([c.args[0] for c in self.sleep.call_args_list], [2.0, 1.5])
+
+    def test_fatal_status_is_not_retried(self):
+        self.post.return_value = make_response(400, {"x-request-id": "req_1"})
+        with self.assertRaises(ProviderError) as context:
+            self.post_stream()
+        error = context.exception
+        self.assertIsInstance(error, ValueError)
+        self.assertEqual(str(error), "Server responded with an error. Status Code: 400")
+        self.assertEqual((error.status, error.provider), (400, "test"))
+        self.assertEqual(error.request_id, "req_1")
+        self.assertEqual(self.post.call_count, 1)
+        self.post.return_value.close.assert_called_once()
+
+    def test_retries_are_limited(self):
+        self.post.return_value = make_response(503)
+        with self.assertRaises(ProviderError) as context:
+            self.post_stream()
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(self.post.call_count, 4)
+
+    def test_long_retry_after_fails_at_once(self):
+        self.post.return_value = make_response(429, {"Retry-After": "3600"})
+        with self.assertRaises(ProviderError) as context:
+            self.post_stream()
+        self.assertEqual(context.exception.retry_after, 3600)
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_connection_errors_are_retried(self):
+        ok = make_response(200)
+        self.post.side_effect = [requests.ConnectionError("reset"), ok]
+        self.assertIs(self.post_stream(), ok)
+        self.sleep.assert_called_once()
+
+    def test_open_circuit_fails_fast(self):
+        self.post.return_value = make_response(503)
+        with self.assertRaises(ProviderError):
+            self.post_stream()
+        self.assertEqual(self.post.call_count, 4)
+        self.post.reset_mock()
+        # The fifth failure in a row opens the circuit, the 503 is reported
+        with self.assertRaises(ProviderError) as context:
+            self.post_stream()
+        self.assertNotIsInstance(context.exception, CircuitOpenError)
+        self.assertEqual(self.post.call_count, 1)
+        self.post.reset_mock()
+        with self.assertRaises(CircuitOpenError):
+            self.post_stream()
+        self.post.assert_not_called()
+
+    def test_cancelled_trial_is_released(self):
+        breaker = circuit_breaker("test")
+        # Half open
+        breaker.opened_at = time.monotonic() - breaker.reset_timeout - 1
+        canceller = Canceller()
+
+        def post(*args, **kwargs):
+            canceller.cancel()
+            raise requests.ConnectionError("shut down")
+
+        self.post.side_effect = post
+        with self.assertRaises(RequestCancelled), canceller.active():
+            self.post_stream()
+        self.assertTrue(breaker.is_open)
+        # The next request is let through as the trial
+        ok = make_response(200)
+        self.post.side_effect = None
+        self.post.return_value = ok
+        self.assertIs(self.post_stream(), ok)
+        self.assertFalse(breaker.is_open)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import Mock
+
+from requests.models import Response
+
+from tinychat.llms.streams import NDJSONStream, SSEStream
+
+
+class TestSSEStream(unittest.TestCase):
+
+    def events(self, chunks):
+        return list(SSEStream(iter(chunks)).events())
+
+    def test_single_line_events(self):
+        chunks = [b"data: one\n\ndata: two\n\n", b"data:three\n\n"]
+        self.assertEqual(self.events(chunks), ["one", "two", "three"])
+
+    def test_events_split_across_chunks(self):
+        payload = b'data: {"text": "caf\xc3\xa9"}\n\ndata: [DONE]\n\n'
+        chunks = [payload[i : i + 1] for i in range(len(payload))]
+        self.assertEqual(self.events(chunks), ['{"text": "café"}', "[DONE]"])
+
+    def test_crlf_and_cr_line_endings(self):
+        chunks = [b"data: one\r\n\r", b"\ndata: two\r\rdata: three\n\n"]
+        self.assertEqual(self.events(chunks), ["one", "two", "three"])
+
+    def test_multiline_data_and_other_fields(self):
+        chunks = [
+            b": keep-alive comment\n\n",
+            b"event: message_start\nid: 1\ndata: first\ndata:  second\n\n",
+            b"retry: 1000\n\n",
+            b"\ndata\n\n",
+        ]
+        self.assertEqual(self.events(chunks), ["first\n second", ""])
+
+    def test_unterminated_event_is_discarded(self):
+        self.assertEqual(self.events([b"data: one\n\ndata: tw"]), ["one"])
+
+    def test_reads_response_chunks_as_they_arrive(self):
+        response = Mock(spec=Response)
+        response.iter_content.return_value = iter([b"data: one\n\n"])
+        stream = SSEStream(response)
+        self.assertEqual(list(stream.events()), ["one"])
+        response.iter_content.assert_called_once_with(chunk_size=None)
+        self.assertEqual(stream.bytes_received, 11)
+        stream.close()
+        response.close.assert_called_once()
+
+
+class TestNDJSONStream(unittest.TestCase):
+
+    def test_events_split_across_chunks_are_not_lost(self):
+        payload = (
+            b'{"event_type": "text-generation", "text": "caf\xc3\xa9"}\n\n'
+            b'{"event_type": "stream-end", "response": {"text": "caf\xc3\xa9"}}\n'
+        )
+        for chunk_size in (1, 7, 64, len(payload)):
+            chunks = [
+                payload[i : i + chunk_size] for i in range(0, len(payload), chunk_size)
+            ]
+            stream = NDJSONStream(iter(chunks))
+            events = list(stream.events())
+            self.assertEqual(
+                events,
+                [
+                    {"event_type": "text-generation", "text": "café"},
+                    {"event_type": "stream-end", "response": {"text": "café"}},
+                ],
+            )
+            self.assertEqual(len(stream.event_times), 2)
+            self.assertEqual(stream.bytes_received, len(payload))
+
+    def test_last_event_without_newline(self):
+        stream = NDJSONStream(iter([b'{"a": 1}\n{"b"', b": 2}"]))
+        self.assertEqual(list(stream.events()), [{"a": 1}, {"b": 2}])
+
+    def test_invalid_line_raises(self):
+        stream = NDJSONStream(iter([b'{"a": 1}\n{"b": \n']))
+        with self.assertRaises(ValueError):
+            list(stream.events())
@@ -0,0 +1,121 @@
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from benchmarks.bench_e2e import HANDLERS
+from benchmarks.mock_provider import MockProviderServer, providers_redirected_to
+from tinychat.llms.base import (
+    ASSISTANT_ROLE,
+    USER_ROLE,
+    Watchdog,
+    close_http_session,
+    get_http_session,
+)
+from tinychat.llms.retry import (
+    StreamTimeoutError,
+    circuit_breaker,
+    reset_circuit_breakers,
+)
+
+
+class TestStreamTimeouts(unittest.TestCase):
+    """Stalled responses of the mock provider, with short timeouts."""
+
+    def tearDown(self):
+        close_http_session()
+        reset_circuit_breakers()
+
+    @patch("tinychat.llms.base.STREAM_IDLE_TIMEOUT", 0.3)
+    def test_stall_in_the_middle_of_the_body(self):
+        server = MockProviderServer(tokens=50, stall=5)
+        with server, providers_redirected_to(server.url):
+            handler = HANDLERS["anthropic"]()
+            received = []
+            started = time.monotonic()
+            with self.assertRaises(StreamTimeoutError) as context:
+                for piece in handler.stream_response("hello"):
+                    received.append(piece)
+        self.assertLess(time.monotonic() - started, 2)
+        error = context.exception
+        self.assertEqual(error.phase, StreamTimeoutError.IDLE)
+        self.assertEqual(error.provider, "anthropic")
+        self.assertEqual(error.tokens, len(received))
+        self.assertGreater(error.tokens, 0)
+        self.assertGreater(error.bytes_received, 0)
+        self.assertIn(f"after {error.tokens} tokens", str(error))
+        self.assertEqual(handler.last_metrics.error, "StreamTimeoutError")
+        # The partial answer is kept, as for a cancelled response
+        messages = [(m.role, m.content) for m in handler.conversation]
+        self.assertEqual(
+            messages, [(USER_ROLE, "hello"), (ASSISTANT_ROLE, "".join(received))]
+        )
+
+    @patch("tinychat.llms.base.FIRST_TOKEN_TIMEOUT", 0.3)
+    def test_no_first_token(self):
+        server = MockProviderServer(tokens=10, latency=5)
+        with server, providers_redirected_to(server.url):
+            handler = HANDLERS["cohere"]()
+            started = time.monotonic()
+            with self.assertRaises(StreamTimeoutError) as context:
+                list(handler.stream_response("hello"))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(context.exception.phase, StreamTimeoutError.FIRST_TOKEN)
+        self.assertEqual(context.exception.tokens, 0)
+        self.assertEqual(len(handler.conversation), 0)
+
+    @patch("tinychat.llms.base.Canceller.sleep")
+    @patch("tinychat.llms.base.get_http_session")
+    def test_connect_timeout(self, mock_get_http_session, mock_sleep):
+        mock_post = mock_get_http_session.return_value.post
+        mock_post.side_effect = requests.ConnectTimeout("timed out")
+        with patch("tinychat.llms.base.get_secret", return_value="key"):
+            handler = HANDLERS["openai"]()
+        with self.assertRaises(StreamTimeoutError) as context:
+            list(handler.stream_response("hello"))
+        self.assertEqual(context.exception.phase, StreamTimeoutError.CONNECT)
+        # Not retried, the error is about the one attempt
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(circuit_breaker("openai").consecutive_failures, 1)
+        self.assertEqual(mock_post.call_args.kwargs["timeout"], (10.0, 60.0))
+
+    @patch("tinychat.llms.base.HTTP_CONNECT_TIMEOUT", 0.2)
+    def test_prewarm_handshake_timeout(self):
+        # Accepts the connections, but never answers the TLS handshake
+        listener = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(listener.close)
+        url = f"https://127.0.0.1:{listener.getsockname()[1]}/v1/chat/completions"
+        started = time.monotonic()
+        with self.assertRaises(Exception):
+            get_http_session().get_adapter(url).prewarm(url)
+        self.assertLess(time.monotonic() - started, 1)
+
+
+class TestWatchdog(unittest.TestCase):
+    def test_call_later(self):
+        watchdog = Watchdog()
+        called = []
+        done = threading.Event()
+        watchdog.call_later(0.1, lambda: (called.append("late"), done.set()))
+        watchdog.call_later(0.05, called.append, "early")
+        cancelled = watchdog.call_later(0.01, called.append, "cancelled")
+        watchdog.cancel(cancelled)
+        self.assertTrue(done.wait(1))
+        self.assertEqual(called, ["early", "late"])
+
+    def test_cancelled_timers_are_dropped(self):
+        watchdog = Watchdog()
+        threads = threading.active_count()
+        timers = [watchdog.call_later(60, print) for _ in range(100)]
+        # A single thread for all the timers
+        self.assertEqual(threading.active_count(), threads + 1)
+        for timer in timers:
+            watchdog.cancel(timer)
+        self.assertLessEqual(len(watchdog._timers), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
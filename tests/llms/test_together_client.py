@@ -9,30 +9,26 @@ from tinychat.llms.together import TogetherClient
 
 class TestTogetherClientStreaming(unittest.TestCase):
 
-    @patch("tinychat.llms.together.requests.post")
-    @patch("tinychat.llms.together.SSEClient")
+    @patch("tinychat.llms.base.get_http_session")
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
     def test_perform_stream_request_success(
-        self, mock_api_key, mock_sse_client, mock_post
+        self, mock_api_key, mock_get_http_session
     ):
         # Setting a dummy value for mock_api_key is not strictly needed here
 
-        # Mocking SSEClient and the response
+        # Mocking the response
         mock_response = Mock(spec=Response)
         mock_response.status_code = 200
-        mock_post.return_value = mock_response
+        mock_get_http_session.return_value.post.return_value = mock_response
 
-        # Creating mock events
-        mock_event1 = MagicMock()
-        mock_event1.data = json.dumps({"choices": [{"delta": {"content": "part1"}}]})
-        mock_event2 = MagicMock()
-        mock_event2.data = json.dumps({"choices": [{"delta": {"content": "part2"}}]})
-        mock_event_done = MagicMock()
-        mock_event_done.data = "[DONE]"
-
-        # Setting up a test stream
-        test_stream = [mock_event1, mock_event2, mock_event_done]
-        mock_sse_client.return_value.events = MagicMock(return_value=iter(test_stream))
+        # Raw SSE bytes as read from the socket, with an event split across chunks
+        mock_response.iter_content.return_value = iter(
+            [
+                b'data: {"choices": [{"delta": {"content": "part1"}}]}\n\n',
+                b'data: {"choices": [{"delta": {"content": "pa',
+                b'rt2"}}]}\n\ndata: [DONE]\n\n',
+            ]
+        )
 
         client = TogetherClient(model_name="test_model", temperature = 0.0)
         messages = [{"role": "user", "content": "hello"}]
@@ -40,9 +36,9 @@ class TestTogetherClientStreaming(unittest.TestCase):
 
         # Extracting and verifying the stream response
         responses = []
-        for event in stream.events():
-            if event.data != "[DONE]":
-                event_data = json.loads(event.data)
+        for data in stream.events():
+            if data != "[DONE]":
+                event_data = json.loads(data)
                 if "choices" in event_data and len(event_data["choices"]) > 0:
                     response_content = event_data["choices"][0]["delta"].get(
                         "content", ""
@@ -51,15 +47,16 @@ class TestTogetherClientStreaming(unittest.TestCase):
 
         self.assertEqual(responses, ["part1", "part2"])
 
-    @patch("tinychat.llms.together.requests.post")
+    @patch("tinychat.llms.base.get_http_session")
     @patch("tinychat.llms.base.BaseLLMClient.api_key", new_callable=MagicMock)
-    def test_perform_stream_request_failure(self, mock_api_key, mock_post):
+    def test_perform_stream_request_failure(self, mock_api_key, mock_get_http_session):
         # Setting a dummy value for mock_api_key is not strictly needed here
 
         # Mocking the response with an error status code
         mock_response = Mock(spec=Response)
         mock_response.status_code = 400
-        mock_post.return_value = mock_response
+        mock_response.headers = {}
+        mock_get_http_session.return_value.post.return_value = mock_response
 
         client = TogetherClient(model_name="test_model", temperature = 0.0)
         messages = [{"role": "user", "content": "hello"}]
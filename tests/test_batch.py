@@ -0,0 +1,174 @@
+import _thread
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from benchmarks.mock_provider import MockProviderServer, providers_redirected_to
+from benchmarks.recordings import sample_tokens
+from tests.fakes import FakeLLM
+from tinychat.batch import BatchRunner, completed_ids, main, read_prompts
+from tinychat.llms.base import close_http_session
+
+
+class CountedLLM(FakeLLM):
+    def __init__(self, provider, counter):
+        super().__init__(delay=0.05, provider=provider)
+        self.counter = counter
+
+    def stream_reply(self):
+        self.counter.enter(self.provider)
+        try:
+            yield from super().stream_reply()
+        finally:
+            self.counter.exit(self.provider)
+
+
+class ConcurrencyCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.peak = {}
+
+    def enter(self, provider):
+        with self.lock:
+            self.running[provider] = self.running.get(provider, 0) + 1
+            self.peak[provider] = max(
+                self.peak.get(provider, 0), self.running[provider]
+            )
+
+    def exit(self, provider):
+        with self.lock:
+            self.running[provider] -= 1
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.prompts_path = os.path.join(self.temp_dir.name, "prompts.jsonl")
+        self.output_path = os.path.join(self.temp_dir.name, "output.jsonl")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        close_http_session()
+
+    def write_prompts(self, items):
+        with open(self.prompts_path, "w") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+
+    def read_results(self):
+        with open(self.output_path) as f:
+            return {result["id"]: result for result in map(json.loads, f)}
+
+    def test_read_prompts(self):
+        self.write_prompts(
+            [{"prompt": "hi"}, {"id": "b", "prompt": "yo", "model": "M"}]
+        )
+        self.assertEqual(
+            list(read_prompts(self.prompts_path, "GPT-4o")),
+            [
+                {"id": 1, "model": "GPT-4o", "prompt": "hi"},
+                {"id": "b", "model": "M", "prompt": "yo"},
+            ],
+        )
+        with self.assertRaisesRegex(ValueError, "prompts.jsonl:1: no model"):
+            list(read_prompts(self.prompts_path, None))
+        self.write_prompts([{"text": "hi"}])
+        with self.assertRaisesRegex(ValueError, "prompts.jsonl:1: expected"):
+            list(read_prompts(self.prompts_path, "GPT-4o"))
+
+    def test_concurrency_per_provider(self):
+        counter = ConcurrencyCounter()
+        backend = MagicMock()
+        providers = {"A": "openai", "B": "mistral"}
+        backend.create_llm.side_effect = lambda model: CountedLLM(
+            providers[model], counter
+        )
+        prompts = [
+            {"id": i, "model": "AB"[i % 2], "prompt": f"p{i}"} for i in range(20)
+        ]
+        output = io.StringIO()
+        runner = BatchRunner(
+            backend, output, concurrency=2, provider_concurrency={"mistral": 5}
+        )
+        runner.run(iter(prompts))
+        self.assertEqual(runner.answered, 20)
+        self.assertEqual(counter.peak, {"openai": 2, "mistral": 5})
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(
+            sorted((r["id"], r["response"]) for r in results),
+            [(i, f"Re: p{i}") for i in range(20)],
+        )
+        # A handler per running prompt, reused by the next ones
+        self.assertLessEqual(backend.create_llm.call_count, 7)
+
+    def test_interrupt_cancels_the_running_prompts(self):
+        backend = MagicMock()
+        backend.create_llm.side_effect = lambda model: FakeLLM(delay=3)
+        prompts = [{"id": i, "model": "A", "prompt": f"p{i}"} for i in range(3)]
+        output = io.StringIO()
+        runner = BatchRunner(backend, output, concurrency=3)
+        # All the prompts are sent by then
+        threading.Timer(0.2, _thread.interrupt_main).start()
+        started = time.monotonic()
+        with self.assertRaises(KeyboardInterrupt):
+            runner.run(iter(prompts))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(output.getvalue(), "")
+
+    def test_prompt_after_the_stop_releases_its_handler(self):
+        backend = MagicMock()
+        backend.create_llm.side_effect = lambda model: FakeLLM()
+        output = io.StringIO()
+        runner = BatchRunner(backend, output)
+        runner._stopped.set()
+        runner._answer({"id": 1, "model": "A", "prompt": "p1"})
+        self.assertEqual(output.getvalue(), "")
+        # Given back to the pool, reused by the next prompt
+        runner.handlers.acquire("A")
+        self.assertEqual(backend.create_llm.call_count, 1)
+
+    def test_completed_ids(self):
+        with open(self.output_path, "w") as f:
+            f.write(json.dumps({"id": 1, "error": None}) + "\n")
+            f.write(json.dumps({"id": 2, "error": "ProviderError: 500"}) + "\n")
+            f.write('{"id": 3, "err')
+        self.assertEqual(completed_ids(self.output_path), {1})
+        with open(self.output_path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(completed_ids("missing.jsonl"), set())
+
+    @patch("tinychat.backend.backend.ARCHIVE_ENABLED", False)
+    @patch("tinychat.backend.backend.get_secret", return_value="0.5")
+    def test_run_and_resume(self, mock_get_secret):
+        self.write_prompts(
+            [
+                {"id": "a", "prompt": "hello"},
+                {"id": "b", "prompt": "hello", "model": "GPT-4o"},
+                {"id": "c", "prompt": "hello", "model": "GPT-5"},
+            ]
+        )
+        with open(self.output_path, "w") as f:
+            f.write(json.dumps({"id": "a", "response": "done", "error": None}) + "\n")
+        server = MockProviderServer(tokens=10)
+        argv = [self.prompts_path, self.output_path, "--model", "Mistral Large"]
+        with server, providers_redirected_to(server.url):
+            main(argv)
+        results = self.read_results()
+        self.assertEqual(results["a"]["response"], "done")
+        self.assertEqual(results["b"]["response"], "".join(sample_tokens(10)))
+        self.assertEqual(
+            results["b"]["metrics"]["chars"], len(results["b"]["response"])
+        )
+        self.assertIsNone(results["b"]["error"])
+        self.assertEqual(results["c"]["error"], "KeyError: 'Invalid Model Name GPT-5'")
+        self.assertEqual(server.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import requests
+
+from benchmarks.mock_provider import MockProviderServer, providers_redirected_to
+from benchmarks.recordings import sample_tokens
+from tinychat.backend import Backend
+from tinychat.gateway import Gateway, HTTPError, fill_conversation, host_headers
+from tinychat.llms.base import (
+    ASSISTANT_ROLE,
+    USER_ROLE,
+    Conversation,
+    get_http_session,
+    set_http_pool_maxsize,
+)
+from tinychat.llms.retry import reset_circuit_breakers
+from tinychat.settings import HTTP_POOL_MAXSIZE
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+class TestFillConversation(unittest.TestCase):
+    def test_messages(self):
+        conversation = Conversation()
+        fill_conversation(
+            conversation,
+            [
+                {"role": "system", "content": "Be brief."},
+                {"role": "user", "content": [{"type": "text", "text": "hi"}]},
+                {"role": "assistant", "content": "hello"},
+                {"role": "user", "content": "how are"},
+                {"role": "user", "content": "you?"},
+            ],
+        )
+        self.assertEqual(
+            [(m.role, m.content) for m in conversation],
+            [
+                (USER_ROLE, "Be brief.\n\nhi"),
+                (ASSISTANT_ROLE, "hello"),
+                (USER_ROLE, "how are\n\nyou?"),
+            ],
+        )
+
+    def test_invalid_messages(self):
+        for messages in [
+            [],
+            [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "?"}],
+            [{"role": "tool", "content": "hi"}],
+            [{"role": "user", "content": 42}],
+        ]:
+            with self.subTest(messages=messages):
+                with self.assertRaises(HTTPError) as context:
+                    fill_conversation(Conversation(), messages)
+                self.assertEqual(context.exception.status, 400)
+
+
+class TestHostHeaders(unittest.TestCase):
+    def test_host_headers(self):
+        self.assertEqual(
+            host_headers("127.0.0.1", 8080),
+            {"127.0.0.1:8080", "localhost:8080", "[::1]:8080"},
+        )
+        self.assertEqual(host_headers("::1", 80), host_headers("localhost", 80))
+        self.assertIn("localhost", host_headers("::1", 80))
+        self.assertEqual(host_headers("192.168.1.2", 8080), {"192.168.1.2:8080"})
+        self.assertIsNone(host_headers("0.0.0.0", 8080))
+
+
+class TestGateway(unittest.TestCase):
+    """The gateway in a thread, answering with the mock provider."""
+
+    @patch("tinychat.backend.backend.ARCHIVE_ENABLED", False)
+    def setUp(self):
+        # The temperature, and the system prompt of the Anthropic models
+        patcher = patch("tinychat.backend.backend.get_secret", return_value="0.5")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gateway = Gateway(Backend(), max_streams=128)
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(self.gateway.start("127.0.0.1", 0))
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/v1"
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.gateway.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        set_http_pool_maxsize(HTTP_POOL_MAXSIZE)
+        reset_circuit_breakers()
+
+    def post(self, data, **kwargs):
+        return requests.post(f"{self.url}/chat/completions", json=data, **kwargs)
+
+    def test_models(self):
+        response = requests.get(f"{self.url}/models")
+        self.assertEqual(response.status_code, 200)
+        models = [model["id"] for model in response.json()["data"]]
+        self.assertIn("GPT-4o", models)
+        self.assertNotIn("Language Model ", models)
+
+    def test_completion(self):
+        server = MockProviderServer(tokens=20)
+        with server, providers_redirected_to(server.url):
+            response = self.post({"model": "Mistral Large", "messages": MESSAGES})
+        self.assertEqual(response.status_code, 200)
+        completion = response.json()
+        self.assertEqual(completion["object"], "chat.completion")
+        self.assertEqual(completion["model"], "Mistral Large")
+        self.assertEqual(
+            completion["choices"][0]["message"],
+            {"role": "assistant", "content": "".join(sample_tokens(20))},
+        )
+        self.assertGreater(completion["usage"]["total_tokens"], 0)
+
+    def test_stream(self):
+        server = MockProviderServer(tokens=20)
+        with server, providers_redirected_to(server.url):
+            response = self.post(
+                {"model": "Claude 3.5 Sonnet", "messages": MESSAGES, "stream": True},
+                stream=True,
+            )
+            self.assertEqual(
+                response.headers["Content-Type"], "text/event-stream; charset=utf-8"
+            )
+            events = [
+                line[len("data: ") :]
+                for line in response.iter_lines(decode_unicode=True)
+                if line
+            ]
+        self.assertEqual(events[-1], "[DONE]")
+        chunks = [json.loads(event) for event in events[:-1]]
+        self.assertEqual(chunks[0]["choices"][0]["delta"]["role"], "assistant")
+        self.assertEqual(
+            "".join(
+                chunk["choices"][0]["delta"].get("content", "") for chunk in chunks
+            ),
+            "".join(sample_tokens(20)),
+        )
+        self.assertEqual(chunks[-1]["choices"][0]["finish_reason"], "stop")
+        self.assertEqual(len({chunk["id"] for chunk in chunks}), 1)
+
+    def test_errors(self):
+        server = MockProviderServer(tokens=5, failures=[401])
+        with server, providers_redirected_to(server.url):
+            unknown = self.post({"model": "GPT-5", "messages": MESSAGES})
+            upstream = self.post({"model": "GPT-4o", "messages": MESSAGES})
+            invalid = self.post({"model": "GPT-4o", "messages": []})
+        self.assertEqual(unknown.status_code, 404)
+        self.assertEqual(unknown.json()["error"]["code"], "model_not_found")
+        self.assertEqual(upstream.status_code, 502)
+        self.assertIn("401", upstream.json()["error"]["message"])
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(requests.get(f"{self.url}/other").status_code, 404)
+
+    def test_api_key(self):
+        self.gateway.api_key = "secret"
+        self.assertEqual(requests.get(f"{self.url}/models").status_code, 401)
+        response = requests.get(
+            f"{self.url}/models", headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_browser_requests(self):
+        data = json.dumps({"model": "GPT-4o", "messages": MESSAGES})
+        cases = [
+            ({"Content-Type": "text/plain"}, 415),
+            ({"Content-Type": "application/json", "Host": "evil.example"}, 403),
+            (
+                {"Content-Type": "application/json", "Origin": "https://evil.example"},
+                403,
+            ),
+        ]
+        for headers, status in cases:
+            with self.subTest(headers=headers):
+                response = requests.post(
+                    f"{self.url}/chat/completions", data=data, headers=headers
+                )
+                self.assertEqual(response.status_code, status)
+        response = requests.get(
+            f"{self.url}/models", headers={"Host": "evil.example:8080"}
+        )
+        self.assertEqual(response.status_code, 403)
+        port = self.url.split(":")[2].split("/")[0]
+        response = requests.get(
+            f"{self.url}/models", headers={"Host": f"localhost:{port}"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_concurrent_streams(self):
+        streams = 100
+        server = MockProviderServer(tokens=5, latency=0.3)
+
+        def stream(index):
+            response = self.post(
+                {"model": "GPT-4o", "messages": MESSAGES, "stream": True}, stream=True
+            )
+            events = [line[len("data: ") :] for line in response.iter_lines() if line]
+            self.assertEqual(events[-1], b"[DONE]")
+            return "".join(
+                json.loads(event)["choices"][0]["delta"].get("content", "")
+                for event in events[:-1]
+            )
+
+        with server, providers_redirected_to(server.url):
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=streams) as executor:
+                responses = list(executor.map(stream, range(streams)))
+            elapsed = time.monotonic() - started
+        self.assertEqual(responses, ["".join(sample_tokens(5))] * streams)
+        # At the same time, not one after the other
+        self.assertLess(elapsed, streams * 0.3 / 4)
+        self.assertEqual(server.requests, streams)
+        # The upstream connections are kept for the next streams
+        adapter = get_http_session().get_adapter(server.url)
+        pool = adapter.poolmanager.connection_from_url(server.url).pool
+        kept = sum(conn is not None for conn in pool.queue)
+        self.assertGreater(kept, HTTP_POOL_MAXSIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tinychat.ui.renderer import StreamRenderer
+
+
+class TestStreamRenderer(unittest.TestCase):
+    def setUp(self):
+        self.root = MagicMock()
+        self.root.after.side_effect = ["after#1", "after#2"]
+        self.textbox = MagicMock()
+        self.textbox.yview.return_value = (0.0, 1.0)
+        self.renderer = StreamRenderer(self.root, self.textbox)
+
+    def test_stop_cancels_the_next_frame(self):
+        self.renderer.start()
+        self.renderer._on_frame()
+        self.renderer.stop()
+        self.root.after_cancel.assert_called_once_with("after#2")
+        self.renderer.stop()
+        self.assertEqual(self.root.after_cancel.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+from tinychat.ui.transcript import Transcript, format_messages
+
+
+class TestTranscript(unittest.TestCase):
+    def setUp(self):
+        # The history the turns are read back from, one message per turn
+        self.history = []
+        self.transcript = Transcript(window_chars=100, load_turn=self.load_turn)
+
+    def load_turn(self, source):
+        start, stop = source
+        return "".join(self.history[start:stop])
+
+    def add_turns(self, count, size=30):
+        for i in range(count):
+            text = str(i % 10) * (size - 1) + "\n"
+            self.history.append(text)
+            self.transcript.append(text)
+            self.transcript.end_turn((len(self.history) - 1, len(self.history)))
+
+    def test_end_turn(self):
+        self.transcript.append("You: hi")
+        self.transcript.append("\n\n\nLLM: hello")
+        self.assertEqual(self.transcript.end_turn(), 0)
+        self.assertEqual(self.transcript.lengths, [20])
+        self.assertEqual(self.transcript.text(0), "You: hi\n\n\nLLM: hello")
+        self.assertEqual(self.transcript.shown_chars, 20)
+
+    def test_only_the_turns_without_source_are_kept(self):
+        self.add_turns(3)
+        self.transcript.append("[notice]")
+        self.transcript.end_turn()
+        self.assertEqual(self.transcript._texts, {3: "[notice]"})
+        self.assertEqual(self.transcript.text(1), self.history[1])
+
+    def test_trim_waits_for_twice_the_window(self):
+        self.add_turns(6)
+        self.assertEqual(self.transcript.trim(), 0)
+        self.add_turns(1)
+        # 210 chars, hidden down to the window
+        self.assertEqual(self.transcript.trim(), 4)
+        self.assertEqual(self.transcript.first, 4)
+        self.assertEqual(self.transcript.shown_chars, 90)
+
+    def test_trim_keeps_the_last_turn(self):
+        self.add_turns(2, size=500)
+        self.transcript.append("streaming")
+        self.assertEqual(self.transcript.trim(), 1)
+        self.assertEqual(self.transcript.first, 1)
+        self.assertEqual(self.transcript.shown_chars, 509)
+
+    def test_page_in(self):
+        self.add_turns(10)
+        self.transcript.trim()
+        self.assertEqual(self.transcript.first, 7)
+        page = self.transcript.page_in()
+        self.assertEqual(page, self.history[5:7])
+        self.assertEqual(self.transcript.first, 5)
+        self.assertEqual(self.transcript.shown_chars, 150)
+        self.transcript.page_in()
+        self.transcript.page_in()
+        self.transcript.page_in()
+        self.assertEqual(self.transcript.first, 0)
+        self.assertEqual(self.transcript.page_in(), [])
+
+    def test_page_in_from_the_history(self):
+        # Read back as the history has it, not as it was streamed
+        self.history.append(format_messages([("user", "hi"), ("assistant", "hel")]))
+        self.transcript.append("You: hi\n\n\nLLM: hel\n\n[Stopped]\n\n\n")
+        self.transcript.end_turn((0, 1))
+        self.add_turns(7)
+        self.transcript.trim()
+        while self.transcript.first:
+            page = self.transcript.page_in()
+        self.assertEqual(page[0], "You: hi\n\n\nLLM: hel\n\n\n")
+        self.assertEqual(self.transcript.lengths[0], len(page[0]))
+
+    def test_clear(self):
+        self.add_turns(10)
+        self.transcript.trim()
+        self.transcript.append("open")
+        self.transcript.clear()
+        self.assertEqual(len(self.transcript), 0)
+        self.assertEqual(self.transcript.first, 0)
+        self.assertEqual(self.transcript.shown_chars, 0)
+        self.assertEqual(self.transcript.end_turn(), 0)
+        self.assertEqual(self.transcript.text(0), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import queue
+import threading
+import unittest
+from unittest.mock import patch
+
+from tinychat.ui.worker import PromptWorker
+
+
+class TestPromptWorker(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+        self.release = threading.Event()
+        self.idle = threading.Event()
+        self.threads = set()
+        self.worker = PromptWorker(self.handle, maxsize=2, on_idle=self.idle.set)
+
+    def handle(self, prompt):
+        self.threads.add(threading.current_thread().name)
+        self.release.wait(5)
+        self.handled.append(prompt)
+
+    def test_prompts_are_handled_in_order_by_one_thread(self):
+        self.worker.submit("first")
+        self.worker.submit("second")
+        self.worker.submit("third")
+        self.release.set()
+        self.assertTrue(self.idle.wait(5))
+        self.assertEqual(self.handled, ["first", "second", "third"])
+        self.assertEqual(self.threads, {"tinychat-prompts"})
+
+    def test_queue_is_bounded(self):
+        self.worker.submit("first")
+        # The first prompt is being handled, the next two wait
+        while self.worker.queued:
+            pass
+        self.worker.submit("second")
+        self.worker.submit("third")
+        self.assertEqual(self.worker.queued, 2)
+        with self.assertRaises(queue.Full):
+            self.worker.submit("fourth")
+        self.release.set()
+
+    def test_clear(self):
+        self.worker.submit("first")
+        while self.worker.queued:
+            pass
+        self.worker.submit("second")
+        self.worker.submit("third")
+        self.assertEqual(self.worker.clear(), ["second", "third"])
+        self.release.set()
+        self.assertTrue(self.idle.wait(5))
+        self.assertEqual(self.handled, ["first"])
+
+    def test_errors_do_not_stop_the_worker(self):
+        done = threading.Event()
+
+        def handle(prompt):
+            if prompt == "fail":
+                raise ValueError(prompt)
+            self.handled.append(prompt)
+            done.set()
+
+        worker = PromptWorker(handle, maxsize=2)
+        with patch("sys.excepthook") as mock_excepthook:
+            worker.submit("fail")
+            worker.submit("ok")
+            self.assertTrue(done.wait(5))
+        self.assertEqual(self.handled, ["ok"])
+        mock_excepthook.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tinychat.utils.secrets import ConfigStore
+
+
+class TestConfigStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "tinychat.json")
+        self.store = ConfigStore(self.file_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_missing_file_is_created(self):
+        self.assertEqual(self.store.get("OPENAI_API_KEY"), "")
+        with open(self.file_path) as file:
+            self.assertEqual(json.load(file), {})
+
+    def test_file_is_parsed_only_when_it_changes(self):
+        self.store.update({"OPENAI_API_KEY": "key-1"})
+        with patch.object(
+            ConfigStore, "_read_file", wraps=self.store._read_file
+        ) as mock_read_file:
+            for _ in range(5):
+                self.assertEqual(self.store.get("OPENAI_API_KEY"), "key-1")
+            mock_read_file.assert_not_called()
+
+            # Another process rewrites the file
+            with open(self.file_path, "w") as file:
+                json.dump({"OPENAI_API_KEY": "key-2-from-elsewhere"}, file)
+            self.assertEqual(self.store.get("OPENAI_API_KEY"), "key-2-from-elsewhere")
+            mock_read_file.assert_called_once()
+
+    def test_update_writes_all_values_at_once(self):
+        self.store.update({"OPENAI_API_KEY": "key"})
+        with patch.object(
+            ConfigStore, "_write_file", wraps=self.store._write_file
+        ) as mock_write_file:
+            self.store.update({"MISTRAL_API_KEY": "other-key", "temperature": 0.3})
+            mock_write_file.assert_called_once()
+        with open(self.file_path) as file:
+            self.assertEqual(
+                json.load(file),
+                {
+                    "OPENAI_API_KEY": "key",
+                    "MISTRAL_API_KEY": "other-key",
+                    "temperature": 0.3,
+                },
+            )
+
+    def test_update_merges_changes_from_other_processes(self):
+        self.store.update({"OPENAI_API_KEY": "key"})
+        other_store = ConfigStore(self.file_path)
+        other_store.update({"COHERE_API_KEY": "cohere-key"})
+        self.store.update({"temperature": 0.5})
+        self.assertEqual(
+            self.store.load(),
+            {
+                "OPENAI_API_KEY": "key",
+                "COHERE_API_KEY": "cohere-key",
+                "temperature": 0.5,
+            },
+        )
+        self.assertEqual(
+            [name for name in os.listdir(self.temp_dir.name) if name.endswith(".tmp")],
+            [],
+        )
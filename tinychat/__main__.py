@@ -1,14 +1,49 @@
-import customtkinter
+import os
+import sys
+import time
 
-from tinychat.backend import Backend
-from tinychat.ui.chat import ChatApp
+# Set to a file path to write the time (time.time) of the first paint of the
+# window there and quit, see benchmarks/bench_startup.py
+STARTUP_PROBE_ENV = "TINYCHAT_STARTUP_PROBE"
 
-customtkinter.set_default_color_theme("green")  # Themes: "blue" (standard), "green", "dark-blue"
-customtkinter.set_appearance_mode("dark")
 
+def create_app():
+    import customtkinter
 
+    from tinychat.backend import Backend
+    from tinychat.ui.chat import ChatApp
+
+    customtkinter.set_default_color_theme("green")  # Themes: "blue" (standard), "green", "dark-blue"
+    customtkinter.set_appearance_mode("dark")
 
-if __name__ == "__main__":
     backend = Backend()
-    tinychat = ChatApp(backend=backend)
+    return ChatApp(backend=backend)
+
+
+def main() -> None:
+    if sys.argv[1:2] == ["batch"]:
+        from tinychat.batch import main as batch_main
+
+        batch_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["serve"]:
+        from tinychat.gateway import main as gateway_main
+
+        gateway_main(sys.argv[2:])
+        return
+    tinychat = create_app()
+    probe_path = os.environ.get(STARTUP_PROBE_ENV)
+    if probe_path:
+
+        def on_first_paint():
+            tinychat.update_idletasks()
+            with open(probe_path, "w") as probe:
+                probe.write(str(time.time()))
+            tinychat.destroy()
+
+        tinychat.after_idle(on_first_paint)
     tinychat.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Optional
+
+from tinychat.settings import ARCHIVE_BATCH_SIZE, ARCHIVE_FLUSH_INTERVAL
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL REFERENCES conversations (id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_conversation_id ON messages (conversation_id, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content, content='messages', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content)
+    VALUES ('delete', old.id, old.content);
+END;
+"""
+
+# Length of the conversation titles, taken from the first message
+TITLE_LENGTH = 80
+
+# Queued to write the pending messages without waiting for the batch to fill
+_FLUSH = ("flush",)
+# Queued to stop the writer
+_CLOSE = ("close",)
+
+
+def fts_query(text: str) -> str:
+    """Match all the words of text, without interpreting the FTS5 syntax."""
+    words = text.split()
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+class ConversationArchive:
+    """
+    Archive of all the conversations in a SQLite database, with a full-text
+    index of the messages.
+
+    Writes are queued and done by a background thread, which groups all the
+    messages queued within ARCHIVE_FLUSH_INTERVAL seconds (up to
+    ARCHIVE_BATCH_SIZE) in one transaction, so that the callers never wait for
+    the disk. Reads use their own connection; the database is in WAL mode, so
+    they are not blocked by the writer.
+
+    :param file_path: The path of the SQLite database.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        writer_db = sqlite3.connect(file_path, check_same_thread=False)
+        writer_db.execute("PRAGMA journal_mode=WAL")
+        writer_db.executescript(SCHEMA)
+        self._reader = sqlite3.connect(file_path, check_same_thread=False)
+        self._reader_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_loop, args=(writer_db,), daemon=True
+        )
+        self._writer.start()
+
+    @staticmethod
+    def new_conversation_id() -> str:
+        """Id of a new conversation, stored along with its first message."""
+        return uuid.uuid4().hex
+
+    def add_message(
+        self, conversation_id: str, model: str, role: str, content: str
+    ) -> None:
+        """Queue a message to be stored. Thread-safe, does not wait."""
+        self._queue.put((conversation_id, model, role, content, time.time()))
+
+    def flush(self) -> None:
+        """Wait until all the queued messages are stored."""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(_CLOSE)
+        self._writer.join()
+        with self._reader_lock:
+            self._reader.close()
+
+    def _write_loop(self, db: sqlite3.Connection) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + ARCHIVE_FLUSH_INTERVAL
+            while batch[-1] not in (_FLUSH, _CLOSE) and len(batch) < ARCHIVE_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            messages = [item for item in batch if item not in (_FLUSH, _CLOSE)]
+            try:
+                if messages:
+                    self._write_batch(db, messages)
+            except sqlite3.Error:
+                # Keep archiving the next messages
+                traceback.print_exc()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is _CLOSE:
+                db.close()
+                return
+
+    @staticmethod
+    def _write_batch(db: sqlite3.Connection, messages: list[tuple]) -> None:
+        with db:
+            for conversation_id, model, role, content, created_at in messages:
+                db.execute(
+                    "INSERT OR IGNORE INTO conversations VALUES (?, ?, ?, ?, ?)",
+                    (
+                        conversation_id,
+                        model,
+                        " ".join(content.split())[:TITLE_LENGTH],
+                        created_at,
+                        created_at,
+                    ),
+                )
+                db.execute(
+                    "UPDATE conversations SET updated_at = ? WHERE id = ?",
+                    (created_at, conversation_id),
+                )
+                db.execute(
+                    "INSERT INTO messages (conversation_id, role, content, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (conversation_id, role, content, created_at),
+                )
+
+    def _read(self, sql: str, parameters: tuple) -> list[dict]:
+        with self._reader_lock:
+            cursor = self._reader.execute(sql, parameters)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def list_conversations(self, offset: int = 0, limit: int = 50) -> list[dict]:
+        """Return a page of the conversations, the most recent first."""
+        return self._read(
+            "SELECT id, model, title, created_at, updated_at FROM conversations"
+            " ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
+
+    def load_messages(
+        self, conversation_id: str, offset: int = 0, limit: int = 50
+    ) -> list[dict]:
+        """Return a page of the messages of a conversation, in order."""
+        return self._read(
+            "SELECT role, content, created_at FROM messages"
+            " WHERE conversation_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (conversation_id, limit, offset),
+        )
+
+    def search(self, text: str, limit: int = 50) -> list[dict]:
+        """
+        Return the messages containing all the words of text, most recent
+        first, with their conversation and a snippet around the words.
+
+        Ordering by rowid lets FTS5 stop after limit matches, instead of
+        ranking every match as ORDER BY rank does.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        return self._read(
+            "SELECT messages.conversation_id, conversations.title,"
+            " conversations.model, messages.role,"
+            " snippet(messages_fts, 0, '[', ']', '...', 12) AS snippet"
+            " FROM messages_fts"
+            " JOIN messages ON messages.id = messages_fts.rowid"
+            " JOIN conversations ON conversations.id = messages.conversation_id"
+            " WHERE messages_fts MATCH ? ORDER BY messages_fts.rowid DESC LIMIT ?",
+            (query, limit),
+        )
+
+    def count_messages(self, conversation_id: Optional[str] = None) -> int:
+        if conversation_id is None:
+            rows = self._read("SELECT COUNT(*) AS count FROM messages", ())
+        else:
+            rows = self._read(
+                "SELECT COUNT(*) AS count FROM messages WHERE conversation_id = ?",
+                (conversation_id,),
+            )
+        return rows[0]["count"]
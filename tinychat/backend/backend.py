@@ -1,48 +1,349 @@
-from typing import Optional
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Callable, Generator, Iterable, Optional
 
-from tkinter import filedialog
-
-from tinychat.llms.anthropic import AnthropicAIHandler
-from tinychat.llms.base import LLMProtocol
-from tinychat.llms.cohere import CohereHandler
-from tinychat.llms.google import GoogleAIHandler
-from tinychat.llms.mistral import MistralHandler
-from tinychat.llms.openai import OpenAIHandler
-from tinychat.llms.together import TogetherHandler
+from tinychat.backend.archive import ConversationArchive
+from tinychat.backend.cache import ResponseCache
+from tinychat.backend.race import Race
+from tinychat.backend.sessions import Session, SessionRegistry
+from tinychat.llms.conversation import ASSISTANT_ROLE, USER_ROLE
+from tinychat.llms.metrics import TurnMetrics, turn_metrics
+from tinychat.llms.registry import entry_point_models, handler_class
+from tinychat.llms.retry import RequestCancelled, StreamTimeoutError
+from tinychat.settings import (
+    ANTHROPIC_SYSTEM_PROMPT_NAME,
+    ARCHIVE_ENABLED,
+    ARCHIVE_FILE_PATH,
+    FANOUT_MAX_WORKERS,
+    PREWARM_MAX_WORKERS,
+    RACE_BACKUP_MODEL,
+    RACE_DEADLINE,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_FILE_PATH,
+    RESPONSE_CACHE_REALTIME,
+    RESPONSE_TOKENS_RESERVE,
+)
 from tinychat.utils.secrets import get_secret, set_secret
 
+if TYPE_CHECKING:
+    from tinychat.llms.base import LLMProtocol
+
+# Title of the model menu, selecting no model
+NO_MODEL = "Language Model "
+
 
 class Backend:
-    def __init__(self) -> None:
+    """
+    The models of the app and the conversations with them.
+
+    :param archive: Whether to keep the conversations in the archive, if
+        ARCHIVE_ENABLED (not for the batch runs and the gateway).
+    """
+
+    def __init__(self, archive: bool = True) -> None:
         self.temperature: float = self.get_default_temperature()
         self._models = {
-            "Language Model ": lambda: None,
-            "GPT-4o": lambda: OpenAIHandler("gpt-4o", self.temperature),
-            "GPT-4 Turbo": lambda: OpenAIHandler("gpt-4-turbo-preview", self.temperature),
-            "Claude 3.5 Sonnet": lambda: AnthropicAIHandler("claude-3-5-sonnet-20240620", self.temperature),
-            "Claude 3 Opus": lambda: AnthropicAIHandler("claude-3-opus-20240229", self.temperature),
-            "Llama 3.1 405B": lambda: TogetherHandler("meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo", self.temperature),
-            "Llama 3.1 70B": lambda: TogetherHandler("meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo", self.temperature),
-            "Llama 3.1 8B": lambda: TogetherHandler("meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo", self.temperature),
-            "Gemini Pro 1.5": lambda: GoogleAIHandler(self.temperature),
-            "Mistral Large": lambda: MistralHandler("mistral-large-latest", self.temperature),
-            "Mistral Codestral": lambda: MistralHandler("codestral-latest", self.temperature),
-            "Cohere Command R": lambda: CohereHandler(self.temperature),
+            NO_MODEL: lambda: None,
+            "GPT-4o": lambda: handler_class("openai")("gpt-4o", self.temperature),
+            "GPT-4 Turbo": lambda: handler_class("openai")("gpt-4-turbo-preview", self.temperature),
+            "Claude 3.5 Sonnet": lambda: handler_class("anthropic")("claude-3-5-sonnet-20240620", self.temperature, get_secret(ANTHROPIC_SYSTEM_PROMPT_NAME)),
+            "Claude 3 Opus": lambda: handler_class("anthropic")("claude-3-opus-20240229", self.temperature, get_secret(ANTHROPIC_SYSTEM_PROMPT_NAME)),
+            "Llama 3.1 405B": lambda: handler_class("together")("meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo", self.temperature),
+            "Llama 3.1 70B": lambda: handler_class("together")("meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo", self.temperature),
+            "Llama 3.1 8B": lambda: handler_class("together")("meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo", self.temperature),
+            "Gemini Pro 1.5": lambda: handler_class("google")(self.temperature),
+            "Mistral Large": lambda: handler_class("mistral")("mistral-large-latest", self.temperature),
+            "Mistral Codestral": lambda: handler_class("mistral")("codestral-latest", self.temperature),
+            "Cohere Command R": lambda: handler_class("cohere")(self.temperature),
         }
-        self._llm: Optional[LLMProtocol] = None
+        for model_name, load_factory in entry_point_models().items():
+            self._models[model_name] = lambda load=load_factory: load()(self.temperature)
+        # Context window of each model, in tokens
+        self._context_windows = {
+            "GPT-4o": 128_000,
+            "GPT-4 Turbo": 128_000,
+            "Claude 3.5 Sonnet": 200_000,
+            "Claude 3 Opus": 200_000,
+            "Llama 3.1 405B": 128_000,
+            "Llama 3.1 70B": 128_000,
+            "Llama 3.1 8B": 128_000,
+            "Gemini Pro 1.5": 1_000_000,
+            "Mistral Large": 128_000,
+            "Mistral Codestral": 32_000,
+            "Cohere Command R": 128_000,
+        }
+        self._llm: Optional["LLMProtocol"] = None
+        self._model_name: Optional[str] = None
+        # Handlers of the models selected so far, reused by the next selections
+        # and by the sessions with the same model
+        self._handlers: dict[str, "LLMProtocol"] = {}
+        # The conversations open, and the one in use
+        self.sessions = SessionRegistry()
+        self._session: Optional[Session] = None
+        # Models answering side by side in fan-out mode, each with its own history
+        self._fanout: dict[str, "LLMProtocol"] = {}
+        self._fanout_executor = ThreadPoolExecutor(
+            max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="tinychat-fanout"
+        )
+        # Connections opened at a time ahead of the first requests
+        self._prewarms = threading.BoundedSemaphore(PREWARM_MAX_WORKERS)
+        # Backup model of race mode, sharing the history of the selected model
+        self._race_backup: Optional["LLMProtocol"] = None
+        self.race_deadline = RACE_DEADLINE
+        # Name of the model which answered the last turn in race mode
+        self.race_winner: Optional[str] = None
+        self._race_model_name = RACE_BACKUP_MODEL
+        self.response_cache: Optional[ResponseCache] = None
+        if RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                RESPONSE_CACHE_FILE_PATH, realtime=RESPONSE_CACHE_REALTIME
+            )
+        self.archive: Optional[ConversationArchive] = None
+        if archive and ARCHIVE_ENABLED:
+            self.archive = ConversationArchive(ARCHIVE_FILE_PATH)
+        # Archive id of the conversation of each session, and fan-out handler
+        self._archive_ids: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
 
     def available_models(self) -> list:
         return list(self._models.keys())
 
-    def set_model(self, model_name: str) -> None:
+    def create_llm(self, model_name: str) -> Optional["LLMProtocol"]:
         if model_name not in self.available_models():
             raise KeyError(f"Invalid Model Name {model_name}")
         try:
-            self._llm = self._models[model_name]()
+            llm = self._models[model_name]()
         except ValueError as e:
             raise ValueError(
                 f"Initialization Error. Have you set the API Key for {model_name}? {e}"
             )
+        if llm is not None:
+            llm.name = model_name
+            llm.context_budget = self.context_budget(model_name)
+            llm.response_cache = self.response_cache
+        return llm
+
+    def set_model(self, model_name: str) -> None:
+        """
+        Select model_name, with a new session. The conversation left stays
+        open, see switch_session, unless nothing was sent in it.
+
+        Its handler is created on first selection and then reused, with its
+        history reset, and a connection to its provider is opened in the
+        background, so that the first request skips the handshakes.
+        """
+        llm = self._handlers.get(model_name)
+        if llm is None:
+            llm = self._handler(model_name)
+        else:
+            llm.reset()
+        self._leave_session()
+        if llm is not None:
+            self._session = self.sessions.create(model_name, llm.conversation)
+        self._select(model_name, llm)
+
+    def new_chat(self) -> None:
+        """Start a new conversation with the selected model."""
+        if self._model_name is not None:
+            self.set_model(self._model_name)
+
+    def switch_session(self, session_id: str) -> str:
+        """
+        Continue the conversation of the session session_id, with its model,
+        and return the model name. Raises KeyError for an unknown session.
+        """
+        session = self.sessions.get(session_id)
+        llm = self._handler(session.model_name)
+        assert llm is not None and session.conversation is not None
+        llm.conversation = session.conversation
+        llm.trimmed_messages = 0
+        if session is not self._session:
+            self._leave_session()
+        self._session = session
+        self._select(session.model_name, llm)
+        return session.model_name
+
+    def close_session(self, session_id: str) -> None:
+        """Drop the session session_id, the one in use is replaced by a new one."""
+        self.sessions.remove(session_id)
+        if self._session is not None and self._session.id == session_id:
+            self._session = None
+            self.new_chat()
+
+    def session_id(self) -> Optional[str]:
+        """Id of the session in use."""
+        return None if self._session is None else self._session.id
+
+    def open_sessions(self) -> list[tuple[str, str, str]]:
+        """
+        Return the id, model name and title (the beginning of the first
+        prompt) of the sessions, the most recently used first.
+        """
+        return [
+            (session.id, session.model_name, session.title)
+            for session in self.sessions.sessions()
+        ]
+
+    def messages(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        model_name: Optional[str] = None,
+    ) -> list[tuple[str, str]]:
+        """
+        Return the role and content of the messages of the session in use, or
+        of the fan-out model model_name, from start to stop.
+        """
+        llm = self._llm if model_name is None else self._fanout.get(model_name)
+        if llm is None:
+            return []
+        return [
+            (message.role, message.content)
+            for message in llm.conversation[start:stop]
+        ]
+
+    def message_count(self, model_name: Optional[str] = None) -> int:
+        """Number of messages of the session in use, or of model_name in fan-out."""
+        llm = self._llm if model_name is None else self._fanout.get(model_name)
+        if llm is None:
+            return 0
+        return len(llm.conversation)
+
+    def _leave_session(self) -> None:
+        # Not kept if nothing was sent in it (empty histories are not evicted)
+        session = self._session
+        if session is not None and session.conversation is not None:
+            if not session.conversation:
+                self.sessions.remove(session.id)
+        self._session = None
+
+    def _handler(self, model_name: str) -> Optional["LLMProtocol"]:
+        llm = self._handlers.get(model_name)
+        if llm is None:
+            llm = self.create_llm(model_name)
+            if llm is not None:
+                self._handlers[model_name] = llm
+        return llm
+
+    def _select(self, model_name: str, llm: Optional["LLMProtocol"]) -> None:
+        # The other handlers let go of the histories of the sessions left, so
+        # that those evicted from memory are freed
+        for other in self._handlers.values():
+            if other is not llm:
+                other.reset()
+        self._llm = llm
+        self._model_name = model_name
+        self._share_race_history()
+        if llm is not None:
+            self._prewarm(llm)
+
+    def reload_settings(self) -> None:
+        """
+        Read the temperature again, and drop the handlers, which have read the
+        API keys: the next selection (or new chat) creates a new one.
+        """
+        self.temperature = self.get_default_temperature()
+        self._handlers = {}
+        self._race_backup = None
+        self._share_race_history()
+
+    def _prewarm(self, llm: "LLMProtocol") -> None:
+        # On daemon threads of their own, so that a slow handshake neither
+        # holds the threads of the responses nor the exit of the app
+        threading.Thread(
+            target=self._prewarm_connection,
+            args=(llm,),
+            name="tinychat-prewarm",
+            daemon=True,
+        ).start()
+
+    def _prewarm_connection(self, llm: "LLMProtocol") -> None:
+        with self._prewarms:
+            try:
+                llm.prewarm()
+            except Exception:
+                # The first request connects instead, and reports the error
+                pass
+
+    def set_race_model(self, model_name: Optional[str]) -> None:
+        """
+        Race mode: when the selected model sends no token within race_deadline
+        seconds, or fails first, the turn is sent to model_name as well. The
+        first model to answer wins, the other one is cancelled, and only the
+        response of the winner is added to the shared history. None leaves
+        race mode.
+        """
+        if model_name and model_name not in self.available_models():
+            raise KeyError(f"Invalid Model Name {model_name}")
+        self._race_model_name = model_name or ""
+        self._race_backup = None
+        self._share_race_history()
+
+    def race_model(self) -> Optional[str]:
+        return self._race_model_name or None
+
+    def _share_race_history(self) -> None:
+        if not self._race_model_name or self._llm is None:
+            self._race_backup = None
+            return
+        if self._race_backup is None:
+            self._race_backup = self.create_llm(self._race_model_name)
+            if self._race_backup is not None:
+                self._prewarm(self._race_backup)
+        if self._race_backup is not None:
+            self._race_backup.conversation = self._llm.conversation
+
+    def set_response_cache(self, response_cache: Optional[ResponseCache]) -> None:
+        """Use response_cache for all the models (None: no caching)."""
+        self.response_cache = response_cache
+        for llm in [self._llm, *self._fanout.values()]:
+            if llm is not None:
+                llm.response_cache = response_cache
+
+    def set_fanout_models(self, model_names: list[str]) -> None:
+        """
+        Select the models answering each prompt in fan-out mode, every one with
+        a new history. An empty list leaves fan-out mode.
+        """
+        fanout = {}
+        for model_name in model_names:
+            llm = self.create_llm(model_name)
+            if llm is not None:
+                fanout[model_name] = llm
+                self._prewarm(llm)
+        self._fanout = fanout
+
+    def fanout_models(self) -> list[str]:
+        return list(self._fanout.keys())
+
+    def context_budget(self, model_name: str) -> Optional[int]:
+        """
+        Return the max number of tokens of history to send to model_name,
+        leaving room for the response in its context window.
+        """
+        context_window = self._context_windows.get(model_name)
+        if context_window is None:
+            return None
+        return context_window - RESPONSE_TOKENS_RESERVE
+
+    def trimmed_messages(self) -> int:
+        """Number of messages left out of the last request to fit the context."""
+        if self._llm is None:
+            return 0
+        return self._llm.trimmed_messages
+
+    def stats(self) -> dict:
+        """
+        Return the latency and throughput percentiles of the last responses,
+        by model: connection, headers, first byte and first token times, total
+        time, tokens per second and inter-token gaps.
+        """
+        return turn_metrics.summary()
+
+    def stats_prometheus(self) -> str:
+        """Return stats() in the Prometheus text exposition format."""
+        return turn_metrics.prometheus()
 
     def get_default_temperature(self):
         """
@@ -60,17 +361,139 @@ class Backend:
     def get_stream_response(self, user_input: str):
         if self._llm is None:
             raise ValueError("No Language Model Has Been Selected.")
-        return self._llm.stream_response(user_input)
+        self.race_winner = None
+        if self._race_backup is not None:
+            race = Race(
+                self._llm, self._race_backup, self.race_deadline, self._fanout_executor
+            )
+            return self._stream_and_archive(
+                self._llm,
+                user_input,
+                self._race_response(user_input, race),
+                self._session,
+                race,
+            )
+        return self._stream_and_archive(self._llm, user_input, session=self._session)
 
-    def export_conversation(self):
+    def _race_response(self, user_input: str, race: Race) -> Generator[str, None, None]:
+        assert self._llm is not None
+        conversation = self._llm.conversation
+        conversation.append(USER_ROLE, user_input)
+        response = []
+        try:
+            for piece in race.stream():
+                response.append(piece)
+                yield piece
+        except (RequestCancelled, StreamTimeoutError):
+            conversation.end_cancelled_turn("".join(response))
+            raise
+        self.race_winner = race.winner.name  # type: ignore
+        conversation.append(ASSISTANT_ROLE, "".join(response))
+
+    def _stream_and_archive(
+        self,
+        llm: "LLMProtocol",
+        user_input: str,
+        pieces: Optional[Iterable[str]] = None,
+        session: Optional[Session] = None,
+        race: Optional[Race] = None,
+    ) -> Generator[str, None, None]:
+        """
+        Stream the response of llm to user_input (or pieces, the response
+        obtained otherwise, by the winner of race if any) and add the turn to
+        the archive. The part received of a cancelled or timed out response is
+        archived too, as it is kept in the history.
+
+        The history of session, if any, is kept in memory meanwhile.
+        """
+        if pieces is None:
+            pieces = llm.stream_response(user_input)
+        pinned = nullcontext() if session is None else self.sessions.pinned(session)
+        with pinned:
+            if self.archive is None:
+                yield from pieces
+                return
+            response = []
+            try:
+                for piece in pieces:
+                    response.append(piece)
+                    yield piece
+            except (RequestCancelled, StreamTimeoutError):
+                if response:
+                    self._archive_turn(
+                        llm, user_input, "".join(response), session, race
+                    )
+                raise
+            self._archive_turn(llm, user_input, "".join(response), session, race)
+
+    def _archive_turn(
+        self,
+        llm: "LLMProtocol",
+        user_input: str,
+        response: str,
+        session: Optional[Session] = None,
+        race: Optional[Race] = None,
+    ) -> None:
+        assert self.archive is not None
+        # Under the name of the model which answered
+        model_name = llm.name
+        if race is not None and race.winner is not None:
+            model_name = race.winner.name
+        # The handler is shared by the sessions with its model
+        key = llm if session is None else session
+        conversation_id = self._archive_ids.get(key)
+        if conversation_id is None:
+            conversation_id = self.archive.new_conversation_id()
+            self._archive_ids[key] = conversation_id
+        self.archive.add_message(conversation_id, model_name, USER_ROLE, user_input)
+        self.archive.add_message(conversation_id, model_name, ASSISTANT_ROLE, response)
+
+    def cancel(self) -> None:
+        """
+        Stop the responses being streamed, by the selected model (and its race
+        backup) and by the fan-out models. The part received of each response is
+        kept, and the streams raise RequestCancelled. Thread-safe.
+        """
+        for llm in [self._llm, self._race_backup, *self._fanout.values()]:
+            if llm is not None:
+                llm.cancel()
+
+    def get_fanout_responses(
+        self, user_input: str, on_piece: Callable[[str, str], None]
+    ) -> dict[str, "Future[Optional[TurnMetrics]]"]:
+        """
+        Stream user_input to all the fan-out models at the same time, on a pool
+        of FANOUT_MAX_WORKERS threads.
+
+        on_piece(model_name, piece) is called from the worker threads as the
+        responses are received. Returns a future per model, resolving to the
+        metrics of its response or raising its error.
+        """
+        if not self._fanout:
+            raise ValueError("No Language Models Have Been Selected.")
+        # Cancellable while they wait for a thread
+        for llm in self._fanout.values():
+            llm.queue_turn()
+        return {
+            model_name: self._fanout_executor.submit(
+                self._stream_fanout_response, model_name, llm, user_input, on_piece
+            )
+            for model_name, llm in self._fanout.items()
+        }
+
+    def _stream_fanout_response(
+        self,
+        model_name: str,
+        llm: "LLMProtocol",
+        user_input: str,
+        on_piece: Callable[[str, str], None],
+    ) -> Optional[TurnMetrics]:
+        for piece in self._stream_and_archive(llm, user_input):
+            on_piece(model_name, piece)
+        return llm.last_metrics
+
+    def export_conversation(self, file_path: str) -> None:
         if self._llm is None:
             return
-        new_file = filedialog.asksaveasfilename(
-            initialfile="Untitled.txt",
-            defaultextension=".txt",
-            filetypes=[("Text File", "*.txt")],
-        )
-        if not new_file:
-            return
-        with open(new_file, "w") as f:
+        with open(file_path, "w") as f:
             f.write(self._llm.export_conversation())
@@ -0,0 +1,109 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+from tinychat.settings import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL
+
+if TYPE_CHECKING:
+    from tinychat.llms.base import CachedResponse
+
+
+class ResponseCache:
+    """
+    Persistent cache of complete responses, stored in a SQLite file.
+
+    Responses are keyed by the handlers (see BaseLLMHandler.cache_key) on the
+    model, the request parameters and a hash of the history. Entries older than
+    ttl seconds are not returned, and the least recently used entries are
+    evicted when the responses take more than max_bytes. The connection is
+    shared by the threads of the backend.
+
+    :param file_path: The path of the SQLite file (":memory:" for no file).
+    :param realtime: Replay the responses at the pace they were received.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        realtime: bool = False,
+    ) -> None:
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.realtime = realtime
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(file_path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at"
+                " ON responses (accessed_at)"
+            )
+
+    def get(self, key: str) -> Optional["CachedResponse"]:
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return [(offset, piece) for offset, piece in json.loads(row[0])]
+
+    def put(self, key: str, model: str, response: "CachedResponse") -> None:
+        encoded = json.dumps(response)
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, encoded, size, now, now),
+            )
+            self._db.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used responses beyond max_bytes."""
+        total = self._db.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+        if not total or total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        keys = []
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
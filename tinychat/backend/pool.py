@@ -0,0 +1,47 @@
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from tinychat.backend.backend import Backend
+    from tinychat.llms.base import LLMProtocol
+
+
+class HandlerPool:
+    """
+    Handlers of the models of a backend, for many independent conversations
+    at a time.
+
+    acquire() returns a handler with a new history, used by one conversation
+    only until it is given back with release(). Then it is reused by the
+    next conversation with the same model, so that the clients (and the API
+    keys they read) are created once per conversation running at the same
+    time, not once per conversation.
+
+    :param backend: The backend creating the handlers.
+    """
+
+    def __init__(self, backend: "Backend") -> None:
+        self.backend = backend
+        # Handlers not in use, by model
+        self._idle: dict[str, list["LLMProtocol"]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, model_name: str) -> "LLMProtocol":
+        """
+        Return a handler of model_name with a new history. Raises KeyError for
+        an invalid model name, ValueError if its API key is missing.
+        """
+        with self._lock:
+            idle = self._idle.get(model_name)
+            llm = idle.pop() if idle else None
+        if llm is None:
+            llm = self.backend.create_llm(model_name)
+            if llm is None:
+                raise KeyError(f"Invalid Model Name {model_name}")
+        llm.reset()
+        return llm
+
+    def release(self, model_name: str, llm: "LLMProtocol") -> None:
+        """Give back a handler returned by acquire(model_name)."""
+        with self._lock:
+            self._idle.setdefault(model_name, []).append(llm)
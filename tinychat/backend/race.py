@@ -0,0 +1,121 @@
+import queue
+import time
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, Generator, Optional
+
+from tinychat.llms.retry import RequestCancelled
+
+if TYPE_CHECKING:
+    from tinychat.llms.base import LLMProtocol
+
+# Queued by a racer when its response is complete
+_END = object()
+
+
+class Race:
+    """
+    A hedged request: the response to the history is asked to the primary
+    model and, if no token arrives within deadline seconds (or the primary
+    fails first), to the backup model as well.
+
+    The first model producing a token (or a complete empty response) wins:
+    stream() yields its response, while the other one is cancelled, which
+    closes its connection. Both models must share the same history, and the
+    response is not added to it (see BaseLLMHandler.stream_reply).
+
+    :param primary: The handler of the primary model.
+    :param backup: The handler of the backup model.
+    :param deadline: Seconds to wait for the first token of the primary.
+    :param executor: Runs the requests, one thread per model.
+    """
+
+    def __init__(
+        self,
+        primary: "LLMProtocol",
+        backup: "LLMProtocol",
+        deadline: float,
+        executor: Executor,
+    ) -> None:
+        self.primary = primary
+        self.backup = backup
+        self.deadline = deadline
+        self.winner: Optional["LLMProtocol"] = None
+        self._executor = executor
+        self._racers: list["LLMProtocol"] = []
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    def _start(self, llm: "LLMProtocol") -> None:
+        self._racers.append(llm)
+        # Cancellable while it waits for a thread
+        llm.queue_turn()
+        self._executor.submit(self._run, llm)
+
+    def _run(self, llm: "LLMProtocol") -> None:
+        pieces = llm.stream_reply()
+        try:
+            for piece in pieces:
+                if self.winner is not None and self.winner is not llm:
+                    # Lost, closing the generator closes the connection
+                    pieces.close()
+                    return
+                self._queue.put((llm, piece))
+        except Exception as e:
+            self._queue.put((llm, e))
+            return
+        self._queue.put((llm, _END))
+
+    def stream(self) -> Generator[str, None, None]:
+        """
+        Yield the response of the winner. If both models fail before the first
+        token, the error of the primary is raised.
+        """
+        self._start(self.primary)
+        try:
+            piece = self._first_piece()
+            self._cancel_losers()
+            while piece is not _END:
+                yield piece
+                piece = self._next_piece()
+        except BaseException:
+            # Failed, or closed before the end
+            for llm in self._racers:
+                llm.cancel()
+            raise
+
+    def _first_piece(self):
+        backup_at = time.monotonic() + self.deadline
+        errors: dict["LLMProtocol", Exception] = {}
+        while True:
+            timeout = None
+            if self.backup not in self._racers:
+                timeout = max(0.0, backup_at - time.monotonic())
+            try:
+                llm, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._start(self.backup)
+                continue
+            if not isinstance(item, Exception):
+                self.winner = llm
+                return item
+            if isinstance(item, RequestCancelled):
+                # Stopped, not worth asking the backup
+                raise item
+            errors[llm] = item
+            if self.backup not in self._racers:
+                self._start(self.backup)
+            elif len(errors) == len(self._racers):
+                raise errors[self.primary]
+
+    def _next_piece(self):
+        while True:
+            llm, item = self._queue.get()
+            if llm is not self.winner:
+                continue
+            if isinstance(item, Exception):
+                raise item
+            return item
+
+    def _cancel_losers(self) -> None:
+        for llm in self._racers:
+            if llm is not self.winner:
+                llm.cancel()
@@ -0,0 +1,193 @@
+import json
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from tinychat.llms.conversation import Conversation
+from tinychat.settings import SESSIONS_FILE_PATH, SESSIONS_MAX_RESIDENT_CHARS
+
+# Characters of the first prompt shown as the title of a session
+TITLE_LENGTH = 40
+
+
+class Session:
+    """
+    A conversation with a model, addressed by its id. The history is None
+    while the session is evicted from memory.
+    """
+
+    def __init__(
+        self, session_id: str, model_name: str, conversation: Conversation
+    ) -> None:
+        self.id = session_id
+        self.model_name = model_name
+        self.conversation: Optional[Conversation] = conversation
+        # Responses being streamed into the history, which keep it in memory
+        self.pins = 0
+        self._title = ""
+
+    @property
+    def title(self) -> str:
+        """The beginning of the first prompt, empty before it is sent."""
+        if not self._title and self.conversation:
+            first_line = self.conversation[0].content.strip().split("\n")[0]
+            self._title = first_line[:TITLE_LENGTH]
+        return self._title
+
+    def size(self) -> int:
+        """Characters of the history in memory."""
+        if self.conversation is None:
+            return 0
+        return sum(len(message.content) for message in self.conversation)
+
+
+class SessionRegistry:
+    """
+    The conversations open at a time, each with its model.
+
+    The histories are kept in memory up to max_chars characters in all: past
+    that, the histories of the least recently used sessions are evicted to a
+    SQLite file, and read back when the session is used again. The session in
+    use, and those with a response being streamed, are never evicted.
+
+    The file is opened on the first eviction. By default it is a temporary
+    file private to the process, deleted when it exits; in a file shared with
+    other processes, only the rows of this registry are read and deleted.
+
+    :param file_path: The path of the SQLite file ("" for a temporary file,
+        ":memory:" for no file).
+    :param max_chars: Characters of the histories kept in memory.
+    """
+
+    def __init__(
+        self,
+        file_path: str = SESSIONS_FILE_PATH,
+        max_chars: int = SESSIONS_MAX_RESIDENT_CHARS,
+    ) -> None:
+        self.file_path = file_path
+        self.max_chars = max_chars
+        # By use, the least recently used first
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, model_name: str, conversation: Conversation) -> Session:
+        """Add a session with model_name and its history, as the one in use."""
+        session = Session(uuid.uuid4().hex, model_name, conversation)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict(keep=session)
+        return session
+
+    def get(self, session_id: str) -> Session:
+        """
+        Return the session session_id, with its history in memory, as the one
+        in use. Raises KeyError for an unknown id, or a history missing from
+        the file, in which case the session is dropped.
+        """
+        with self._lock:
+            session = self._sessions[session_id]
+            if session.conversation is None:
+                try:
+                    session.conversation = self._load(session_id)
+                except KeyError:
+                    del self._sessions[session_id]
+                    raise KeyError(
+                        f"The history of the chat {session.title!r} was lost"
+                    ) from None
+            self._sessions.move_to_end(session_id)
+            self._evict(keep=session)
+        return session
+
+    def sessions(self) -> list[Session]:
+        """The sessions, the most recently used first."""
+        with self._lock:
+            return list(reversed(self._sessions.values()))
+
+    def remove(self, session_id: str) -> None:
+        """Drop the session session_id, if any."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None and session.conversation is None:
+                with self._connection() as db:
+                    db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    @contextmanager
+    def pinned(self, session: Session) -> Iterator[None]:
+        """Keep the history of session in memory, while it is being written."""
+        with self._lock:
+            session.pins += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                session.pins -= 1
+
+    def close(self) -> None:
+        """Delete the evicted histories, and close the file."""
+        with self._lock:
+            if self._db is not None:
+                evicted = [
+                    (session.id,)
+                    for session in self._sessions.values()
+                    if session.conversation is None
+                ]
+                with self._db:
+                    self._db.executemany("DELETE FROM sessions WHERE id = ?", evicted)
+                self._db.close()
+                self._db = None
+
+    def _evict(self, keep: Session) -> None:
+        resident = [s for s in self._sessions.values() if s.conversation is not None]
+        size = sum(session.size() for session in resident)
+        for session in resident:
+            if size <= self.max_chars:
+                break
+            if session is keep or session.pins or not session.conversation:
+                continue
+            size -= session.size()
+            self._store(session)
+
+    def _store(self, session: Session) -> None:
+        assert session.conversation is not None
+        # The title is taken from the history, keep it
+        session.title
+        messages = [[message.role, message.content] for message in session.conversation]
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?)",
+                (session.id, json.dumps(messages)),
+            )
+        session.conversation = None
+
+    def _load(self, session_id: str) -> Conversation:
+        with self._connection() as db:
+            row = db.execute(
+                "SELECT messages FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(session_id)
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        (encoded,) = row
+        conversation = Conversation()
+        for role, content in json.loads(encoded):
+            conversation.append(role, content)
+        return conversation
+
+    def _connection(self) -> sqlite3.Connection:
+        # The ids are random, the rows of other processes are never touched
+        if self._db is None:
+            self._db = sqlite3.connect(self.file_path, check_same_thread=False)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    " id TEXT PRIMARY KEY,"
+                    " messages TEXT NOT NULL)"
+                )
+        return self._db
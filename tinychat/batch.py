@@ -0,0 +1,306 @@
+"""
+Headless batch runs of prompts, without the window.
+
+Usage: python -m tinychat batch PROMPTS OUTPUT [--model NAME]
+       [--concurrency N] [--provider-concurrency PROVIDER=N]
+       [--temperature T] [--max-pending N]
+
+PROMPTS is a JSONL file, one JSON object per line with the "prompt", and
+optionally an "id" (by default the line number) and a "model" (one of
+Backend.available_models, by default --model). Each prompt is answered in a
+new conversation. The file is read as the prompts are sent, so it can be of
+any size.
+
+The results are appended to the OUTPUT JSONL file as they are completed,
+each with the id, model, response, error and the metrics of the response
+(see TurnMetrics.as_dict, null if it was replayed from the response cache).
+OUTPUT is also the checkpoint of the run: when a run is started again, the
+prompts whose id already has a result without error are skipped.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import IO, TYPE_CHECKING, Iterator, Optional
+
+from tinychat.backend.pool import HandlerPool
+from tinychat.llms.retry import RequestCancelled
+from tinychat.settings import BATCH_CONCURRENCY, BATCH_MAX_PENDING
+
+if TYPE_CHECKING:
+    from tinychat.backend import Backend
+    from tinychat.llms.base import LLMProtocol
+
+
+def read_prompts(file_path: str, default_model: Optional[str]) -> Iterator[dict]:
+    """Yield the prompts of a JSONL file, as {"id", "model", "prompt"}."""
+    with open(file_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                prompt = item["prompt"]
+            except (ValueError, KeyError, TypeError):
+                raise ValueError(
+                    f"{file_path}:{line_number}: expected a JSON object with a prompt"
+                )
+            model = item.get("model", default_model)
+            if not model:
+                raise ValueError(
+                    f"{file_path}:{line_number}: no model, set it or pass --model"
+                )
+            yield {"id": item.get("id", line_number), "model": model, "prompt": prompt}
+
+
+def completed_ids(file_path: str) -> set:
+    """
+    Return the ids of the results without error of an output file, and
+    drop its last line if it was left incomplete by an interrupted run.
+    """
+    ids = set()
+    if not os.path.exists(file_path):
+        return ids
+    with open(file_path, "rb+") as f:
+        complete_size = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            complete_size += len(line)
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get("error") is None:
+                ids.add(result["id"])
+        f.truncate(complete_size)
+    return ids
+
+
+class BatchRunner:
+    """
+    Send prompts to the models of a Backend, at most `concurrency` at a time
+    per provider, and write the results to output as they are completed.
+
+    :param backend: The backend creating the handlers of the models.
+    :param output: The file the results are written to, one JSON per line.
+    :param concurrency: Requests streaming at the same time to each provider.
+    :param provider_concurrency: The concurrency of some providers, by name
+        (as in tinychat.llms.registry).
+    :param max_pending: Max number of prompts sent or waiting to be.
+    """
+
+    def __init__(
+        self,
+        backend: "Backend",
+        output: IO[str],
+        concurrency: int = BATCH_CONCURRENCY,
+        provider_concurrency: Optional[dict[str, int]] = None,
+        max_pending: int = BATCH_MAX_PENDING,
+    ) -> None:
+        self.backend = backend
+        self.handlers = HandlerPool(backend)
+        self.output = output
+        self.concurrency = concurrency
+        self.provider_concurrency = provider_concurrency or {}
+        self.answered = 0
+        self.failed = 0
+        self.skipped = 0
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._executors: dict[str, ThreadPoolExecutor] = {}
+        # Provider of each model, to pick its executor
+        self._providers: dict[str, str] = {}
+        self._running: set["LLMProtocol"] = set()
+        self._futures: set[Future] = set()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, prompts: Iterator[dict], skip_ids: frozenset = frozenset()) -> None:
+        """
+        Answer the prompts, except those whose id is in skip_ids. On
+        KeyboardInterrupt the responses being streamed are cancelled, and
+        not written to output.
+        """
+        try:
+            try:
+                for item in prompts:
+                    if item["id"] in skip_ids:
+                        self.skipped += 1
+                        continue
+                    self._pending.acquire()
+                    self._submit(item)
+            except Exception:
+                # An invalid prompt, the ones sent before it are answered
+                self._wait()
+                raise
+            # Not in executor.shutdown(wait=True), which an interrupt would
+            # leave without cancelling the responses
+            self._wait()
+        except KeyboardInterrupt:
+            self._stopped.set()
+            with self._lock:
+                for llm in self._running:
+                    llm.cancel()
+            self._shutdown()
+            # Cancelled, they end at once
+            self._wait()
+            raise
+        finally:
+            self._shutdown()
+
+    def _wait(self) -> None:
+        with self._lock:
+            futures = set(self._futures)
+        while futures:
+            # With a timeout, so that Ctrl-C is handled on Windows as well
+            _, futures = wait(futures, timeout=0.1)
+
+    def _shutdown(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, item: dict) -> None:
+        try:
+            provider = self._provider(item["model"])
+        except (KeyError, ValueError) as e:
+            self._write(item, error=e)
+            self._pending.release()
+            return
+        executor = self._executors.get(provider)
+        if executor is None:
+            executor = self._executors[provider] = ThreadPoolExecutor(
+                max_workers=self.provider_concurrency.get(provider, self.concurrency),
+                thread_name_prefix=f"tinychat-batch-{provider}",
+            )
+        future = executor.submit(self._answer, item)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+        self._pending.release()
+
+    def _provider(self, model_name: str) -> str:
+        provider = self._providers.get(model_name)
+        if provider is None:
+            llm = self.handlers.acquire(model_name)
+            provider = getattr(llm, "provider", "") or model_name
+            self._providers[model_name] = provider
+            self.handlers.release(model_name, llm)
+        return provider
+
+    def _answer(self, item: dict) -> None:
+        try:
+            llm = self.handlers.acquire(item["model"])
+        except (KeyError, ValueError) as e:
+            self._write(item, error=e)
+            return
+        with self._lock:
+            stopped = self._stopped.is_set()
+            if not stopped:
+                self._running.add(llm)
+        if stopped:
+            self.handlers.release(item["model"], llm)
+            return
+        try:
+            response = "".join(llm.stream_response(item["prompt"]))
+        except RequestCancelled:
+            # Interrupted run, answered again when it is resumed
+            return
+        except Exception as e:
+            self._write(item, error=e, llm=llm)
+        else:
+            self._write(item, response=response, llm=llm)
+        finally:
+            with self._lock:
+                self._running.discard(llm)
+            self.handlers.release(item["model"], llm)
+
+    def _write(
+        self,
+        item: dict,
+        response: Optional[str] = None,
+        error: Optional[Exception] = None,
+        llm: Optional["LLMProtocol"] = None,
+    ) -> None:
+        metrics = None
+        if llm is not None and llm.last_metrics is not None:
+            metrics = llm.last_metrics.as_dict()
+        result = {
+            "id": item["id"],
+            "model": item["model"],
+            "response": response,
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+            "metrics": metrics,
+        }
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.output.write(line)
+            self.output.flush()
+            if error is None:
+                self.answered += 1
+            else:
+                self.failed += 1
+
+
+def provider_concurrency_arg(value: str) -> tuple[str, int]:
+    provider, _, concurrency = value.partition("=")
+    try:
+        return provider, int(concurrency)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected PROVIDER=N, got {value}")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m tinychat batch", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("prompts", help="JSONL file of the prompts")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--model", help="model of the prompts without one")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument(
+        "--provider-concurrency",
+        type=provider_concurrency_arg,
+        action="append",
+        default=[],
+        metavar="PROVIDER=N",
+    )
+    parser.add_argument("--temperature", type=float)
+    parser.add_argument("--max-pending", type=int, default=BATCH_MAX_PENDING)
+    args = parser.parse_args(argv)
+
+    from tinychat.backend import Backend
+
+    backend = Backend(archive=False)
+    if args.temperature is not None:
+        backend.temperature = args.temperature
+    skip_ids = frozenset(completed_ids(args.output))
+    started = time.monotonic()
+    with open(args.output, "a", encoding="utf-8") as output:
+        runner = BatchRunner(
+            backend,
+            output,
+            concurrency=args.concurrency,
+            provider_concurrency=dict(args.provider_concurrency),
+            max_pending=args.max_pending,
+        )
+        try:
+            runner.run(read_prompts(args.prompts, args.model), skip_ids)
+        except KeyboardInterrupt:
+            print("Interrupted, run again to resume.", file=sys.stderr)
+            sys.exit(130)
+        except ValueError as e:
+            sys.exit(str(e))
+        finally:
+            print(
+                f"{runner.answered} answered, {runner.failed} failed, "
+                f"{runner.skipped} skipped in {time.monotonic() - started:.1f}s",
+                file=sys.stderr,
+            )
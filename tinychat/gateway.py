@@ -0,0 +1,553 @@
+"""
+OpenAI-compatible gateway to the models of tinychat, for the other tools of
+this machine.
+
+Usage: python -m tinychat serve [--host HOST] [--port N] [--max-streams N]
+
+Serves, over HTTP/1.1 with keep-alive:
+
+    GET  /v1/models              the models, by their names in the menu
+    POST /v1/chat/completions    the response to the messages, streamed as
+                                 server-sent events with "stream": true
+
+Each request is answered in a conversation of its own, made of its messages
+(see HandlerPool), with the API keys and the temperature set in tinychat.
+The other parameters of the requests are ignored.
+
+The requests of web pages are refused: those with an Origin header, a Host
+header other than the address served (against DNS rebinding), or a body
+other than application/json (which a page can send without CORS).
+
+The client connections are served by a single asyncio loop, so that one
+process holds hundreds of streams at once. The handlers are blocking: each
+upstream stream runs on one of max_streams threads, and hands its pieces to
+the loop as they are received, over the pooled connections of the shared
+requests session.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import AsyncIterator, Optional
+from urllib.parse import urlsplit
+
+from tinychat.backend.backend import NO_MODEL, Backend
+from tinychat.backend.pool import HandlerPool
+from tinychat.llms.base import (
+    ASSISTANT_ROLE,
+    USER_ROLE,
+    Conversation,
+    LLMProtocol,
+    estimate_tokens,
+    set_http_pool_maxsize,
+)
+from tinychat.llms.retry import CircuitOpenError, ProviderError, StreamTimeoutError
+from tinychat.settings import (
+    GATEWAY_API_KEY,
+    GATEWAY_HOST,
+    GATEWAY_MAX_BODY_BYTES,
+    GATEWAY_MAX_STREAMS,
+    GATEWAY_PORT,
+    HTTP_POOL_MAXSIZE,
+)
+
+SYSTEM_ROLES = ("system", "developer")
+
+# The names of the loopback addresses, in the Host header
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+# Addresses of all the interfaces, which take any Host header
+ANY_HOSTS = ("", "0.0.0.0", "::")
+
+# Queued by a stream when its response is complete
+_END = object()
+
+
+class HTTPError(Exception):
+    """
+    An error answered to the client, in the format of the OpenAI API.
+
+    :param status: The HTTP status code.
+    :param message: The error message.
+    :param error_type: The type of the error, as in the OpenAI API.
+    :param code: The code of the error, if any.
+    """
+
+    def __init__(
+        self,
+        status: int,
+        message: str,
+        error_type: str = "invalid_request_error",
+        code: Optional[str] = None,
+    ) -> None:
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+        self.code = code
+
+    def as_dict(self) -> dict:
+        return {
+            "error": {"message": str(self), "type": self.error_type, "code": self.code}
+        }
+
+
+def upstream_error(error: Exception) -> HTTPError:
+    """Return the error answered for an error of the provider."""
+    if isinstance(error, StreamTimeoutError):
+        return HTTPError(504, str(error), "server_error", "timeout")
+    if isinstance(error, CircuitOpenError):
+        return HTTPError(503, str(error), "server_error", "provider_unavailable")
+    if isinstance(error, ProviderError) and error.status == 429:
+        return HTTPError(429, str(error), "rate_limit_error", "rate_limit_exceeded")
+    return HTTPError(502, str(error), "server_error", "upstream_error")
+
+
+def message_text(content) -> str:
+    """Return the text of the content of a message: a string or text parts."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "")
+            for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    raise HTTPError(400, "The content of a message must be a string or a list.")
+
+
+def fill_conversation(conversation: Conversation, messages) -> None:
+    """
+    Add the messages of a request to an empty conversation.
+
+    System messages are put at the start of the next user message, as not all
+    the providers take them, and consecutive messages with the same role are
+    joined, as not all the providers take them either. The last message must
+    be from the user.
+    """
+    if not isinstance(messages, list) or not messages:
+        raise HTTPError(400, "messages must be a non empty list.")
+    system: list[str] = []
+    turns: list[list[str]] = []
+    for message in messages:
+        if not isinstance(message, dict):
+            raise HTTPError(400, "Each message must be an object.")
+        role = message.get("role")
+        text = message_text(message.get("content"))
+        if role in SYSTEM_ROLES:
+            system.append(text)
+            continue
+        if role not in (USER_ROLE, ASSISTANT_ROLE):
+            raise HTTPError(400, f"Unsupported message role: {role}.")
+        if role == USER_ROLE and system:
+            text = "\n\n".join(system + [text])
+            system = []
+        if turns and turns[-1][0] == role:
+            turns[-1][1] += "\n\n" + text
+        else:
+            turns.append([role, text])
+    if not turns or turns[-1][0] != USER_ROLE:
+        raise HTTPError(400, "The last message must be from the user.")
+    for role, text in turns:
+        conversation.append(role, text)
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[tuple[str, str, dict, bytes]]:
+    """
+    Read a request and return its method, path, headers (lowercase names)
+    and body, or None if the client closed the connection.
+    """
+    try:
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line.")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n"):
+                break
+            if not line:
+                return None
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+    except ValueError:
+        # A line longer than the limit of the reader
+        raise HTTPError(431, "Request line or header too long.")
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HTTPError(411, "Chunked request bodies are not supported.")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length.")
+    if length > GATEWAY_MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large.")
+    body = await reader.readexactly(length)
+    return method, urlsplit(target).path, headers, body
+
+
+def host_headers(host: str, port: int) -> Optional[frozenset[str]]:
+    """
+    Return the Host headers of the requests to host and port, or None for any
+    when all the interfaces are served.
+    """
+    if host in ANY_HOSTS:
+        return None
+    names = {f"[{host}]" if ":" in host else host}
+    if names & set(LOOPBACK_HOSTS):
+        names = set(LOOPBACK_HOSTS)
+    headers = {f"{name}:{port}" for name in names}
+    if port == 80:
+        headers |= names
+    return frozenset(headers)
+
+
+def check_not_from_browser(
+    method: str, headers: dict, hosts: Optional[frozenset[str]]
+) -> None:
+    """Raise HTTPError for a request which a web page may have sent."""
+    if "origin" in headers:
+        raise HTTPError(403, "Requests from web pages are not allowed.")
+    if hosts is not None and headers.get("host", "").lower() not in hosts:
+        raise HTTPError(403, "Invalid Host header.")
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    if method == "POST" and content_type != "application/json":
+        raise HTTPError(415, "The Content-Type must be application/json.")
+
+
+def response_head(status: int, headers: dict) -> bytes:
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def sse_chunk(data: str) -> bytes:
+    """An event of a server-sent events stream, as a chunk of the body."""
+    event = f"data: {data}\n\n".encode("utf-8")
+    return b"%x\r\n%s\r\n" % (len(event), event)
+
+
+class Gateway:
+    """
+    OpenAI-compatible HTTP server answering with the models of a backend.
+
+    :param backend: The backend creating the handlers of the models.
+    :param max_streams: Max number of upstream streams at the same time.
+    :param api_key: The bearer token the clients must send, if not empty.
+    """
+
+    def __init__(
+        self,
+        backend: Backend,
+        max_streams: int = GATEWAY_MAX_STREAMS,
+        api_key: str = GATEWAY_API_KEY,
+    ) -> None:
+        self.backend = backend
+        self.handlers = HandlerPool(backend)
+        self.api_key = api_key
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_streams, thread_name_prefix="tinychat-gateway"
+        )
+        # A keep-alive connection for each stream to the same provider
+        set_http_pool_maxsize(max(HTTP_POOL_MAXSIZE, max_streams))
+        self._server: Optional[asyncio.AbstractServer] = None
+        # The Host headers accepted, None for any, see host_headers
+        self._hosts: Optional[frozenset[str]] = None
+        # The task serving each open connection, by its writer
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def models(self) -> list[str]:
+        return [name for name in self.backend.available_models() if name != NO_MODEL]
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        # The port picked by the system, for port 0
+        port = self._server.sockets[0].getsockname()[1]
+        self._hosts = host_headers(host, port)
+        return self._server
+
+    async def close(self) -> None:
+        """Stop accepting connections, and close the open ones."""
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.gather(*self._connections.values(), return_exceptions=True)
+
+    def serve(self, host: str, port: int) -> None:
+        """Serve until interrupted."""
+
+        async def serve_forever():
+            server = await self.start(host, port)
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(serve_forever())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _serve_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._connections[writer] = asyncio.current_task()  # type: ignore
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, e.as_dict(), False)
+                    return
+                if request is None:
+                    return
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    keep_alive = await self._respond(
+                        writer, method, path, headers, body, keep_alive
+                    )
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, e.as_dict(), keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The client went away
+            pass
+        finally:
+            del self._connections[writer]
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        method: str,
+        path: str,
+        headers: dict,
+        body: bytes,
+        keep_alive: bool,
+    ) -> bool:
+        """Answer a request and return whether the connection can be kept."""
+        check_not_from_browser(method, headers, self._hosts)
+        if self.api_key and headers.get("authorization") != f"Bearer {self.api_key}":
+            raise HTTPError(401, "Invalid API key.", code="invalid_api_key")
+        if path == "/v1/models":
+            if method != "GET":
+                raise HTTPError(405, f"Method {method} not allowed.")
+            models = [
+                {"id": name, "object": "model", "created": 0, "owned_by": "tinychat"}
+                for name in self.models()
+            ]
+            await self._send_json(
+                writer, 200, {"object": "list", "data": models}, keep_alive
+            )
+            return keep_alive
+        if path == "/v1/chat/completions":
+            if method != "POST":
+                raise HTTPError(405, f"Method {method} not allowed.")
+            return await self._chat_completions(writer, body, keep_alive)
+        raise HTTPError(404, f"Unknown path {path}.")
+
+    async def _chat_completions(
+        self, writer: asyncio.StreamWriter, body: bytes, keep_alive: bool
+    ) -> bool:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "The body must be JSON.")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "The body must be a JSON object.")
+        model = data.get("model")
+        if model not in self.models():
+            raise HTTPError(
+                404, f"The model {model} does not exist.", code="model_not_found"
+            )
+        loop = asyncio.get_running_loop()
+        try:
+            llm = await loop.run_in_executor(
+                self._executor, self.handlers.acquire, model
+            )
+        except ValueError as e:
+            raise HTTPError(500, str(e), "server_error")
+        try:
+            fill_conversation(llm.conversation, data.get("messages"))
+        except HTTPError:
+            self.handlers.release(model, llm)
+            raise
+        completion = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": model,
+        }
+        pieces = self._stream(model, llm)
+        try:
+            # Before the headers, so that the errors have their status
+            try:
+                first = await pieces.__anext__()
+            except StopAsyncIteration:
+                first = ""
+            except Exception as e:
+                raise upstream_error(e)
+            if data.get("stream"):
+                return await self._send_stream(writer, completion, first, pieces)
+            response = [first]
+            try:
+                async for piece in pieces:
+                    response.append(piece)
+            except Exception as e:
+                raise upstream_error(e)
+            await self._send_completion(
+                writer, completion, llm, "".join(response), keep_alive
+            )
+            return keep_alive
+        finally:
+            await pieces.aclose()
+
+    async def _stream(self, model: str, llm: LLMProtocol) -> AsyncIterator[str]:
+        """
+        Yield the pieces of the response of llm, streamed on a thread of the
+        executor. The handler is released once its thread is done, and
+        cancelled if the generator is closed before the end.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def put(item) -> None:
+            with contextlib.suppress(RuntimeError):
+                # The loop is closed, the server is stopping
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        def run() -> None:
+            try:
+                for piece in llm.stream_reply():
+                    put(piece)
+            except Exception as e:
+                put(e)
+                return
+            put(_END)
+
+        # Cancellable while it waits for a thread
+        llm.queue_turn()
+        future = loop.run_in_executor(self._executor, run)
+        future.add_done_callback(lambda future: self.handlers.release(model, llm))
+        done = False
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    done = True
+                    return
+                if isinstance(item, Exception):
+                    done = True
+                    raise item
+                yield item
+        finally:
+            if not done:
+                llm.cancel()
+
+    async def _send_stream(
+        self,
+        writer: asyncio.StreamWriter,
+        completion: dict,
+        first: str,
+        pieces: AsyncIterator[str],
+    ) -> bool:
+        """Stream the response as server-sent events, in a chunked body."""
+        headers = {
+            "Content-Type": "text/event-stream; charset=utf-8",
+            "Cache-Control": "no-cache",
+            "Transfer-Encoding": "chunked",
+        }
+        writer.write(response_head(200, headers))
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> bytes:
+            event = dict(
+                completion,
+                object="chat.completion.chunk",
+                choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            )
+            return sse_chunk(json.dumps(event, ensure_ascii=False))
+
+        writer.write(chunk({"role": ASSISTANT_ROLE, "content": first}))
+        await writer.drain()
+        keep_alive = True
+        try:
+            async for piece in pieces:
+                writer.write(chunk({"content": piece}))
+                await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # Too late for an error status, the error ends the stream
+            writer.write(sse_chunk(json.dumps(upstream_error(e).as_dict())))
+            keep_alive = False
+        else:
+            writer.write(chunk({}, "stop"))
+        writer.write(sse_chunk("[DONE]") + b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+    async def _send_completion(
+        self,
+        writer: asyncio.StreamWriter,
+        completion: dict,
+        llm: LLMProtocol,
+        response: str,
+        keep_alive: bool,
+    ) -> None:
+        # Estimated, the providers' counts are not read from the streams
+        prompt_tokens = sum(message.tokens for message in llm.conversation)
+        completion_tokens = estimate_tokens(response)
+        data = dict(
+            completion,
+            object="chat.completion",
+            choices=[
+                {
+                    "index": 0,
+                    "message": {"role": ASSISTANT_ROLE, "content": response},
+                    "finish_reason": "stop",
+                }
+            ],
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+        await self._send_json(writer, 200, data, keep_alive)
+
+    async def _send_json(
+        self, writer: asyncio.StreamWriter, status: int, data: dict, keep_alive: bool
+    ) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Length": len(body),
+            "Connection": "keep-alive" if keep_alive else "close",
+        }
+        writer.write(response_head(status, headers) + body)
+        await writer.drain()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m tinychat serve", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--host", default=GATEWAY_HOST)
+    parser.add_argument("--port", type=int, default=GATEWAY_PORT)
+    parser.add_argument("--max-streams", type=int, default=GATEWAY_MAX_STREAMS)
+    args = parser.parse_args(argv)
+
+    gateway = Gateway(Backend(archive=False), max_streams=args.max_streams)
+    print(f"Serving the models on http://{args.host}:{args.port}/v1")
+    gateway.serve(args.host, args.port)
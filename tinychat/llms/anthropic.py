@@ -1,10 +1,17 @@
 import json
 from typing import Generator
 
-import requests
-from sseclient import SSEClient
-
-from tinychat.llms.base import BaseLLMClient
+from tinychat.llms.base import (
+    BaseLLMClient,
+    BaseLLMHandler,
+    encode_json_body,
+    encode_messages,
+    Message,
+    RawJSON,
+    USER_ROLE,
+)
+from tinychat.llms.metrics import TurnMetrics
+from tinychat.llms.streams import SSEStream
 from tinychat.settings import ANTHROPIC_API_KEY_NAME
 
 
@@ -16,23 +23,32 @@ class AnthropicAIClient(BaseLLMClient):
     :param model_name: The name of the model to be used for chat requests.
     """
 
+    PROVIDER = "anthropic"
+
     ANTHROPIC_MESSAGES_API_URL = "https://api.anthropic.com/v1/messages"
 
-    def __init__(self, model_name: str, temperature: float) -> None:
+    def __init__(
+        self, model_name: str, temperature: float, system_prompt: str = ""
+    ) -> None:
         super().__init__(api_key_name=ANTHROPIC_API_KEY_NAME)
         self.model_name = model_name
         self.temperature = temperature
+        self.system_prompt = system_prompt
 
     def anthropic_headers(self):
         return {
             "Accept": "application/json",
             "Content-Type": "application/json",
             "anthropic-version": "2023-06-01",
-            "anthropic-beta": "messages-2023-12-15",
+            "anthropic-beta": "messages-2023-12-15,prompt-caching-2024-07-31",
             "x-api-key": self.api_key,
         }
 
-    def perform_stream_request(self, messages: list[dict]) -> SSEClient:
+    @property
+    def api_url(self) -> str:
+        return self.ANTHROPIC_MESSAGES_API_URL
+
+    def perform_stream_request(self, messages: RawJSON) -> SSEStream:
         # info: https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events
         data = {
             "model": self.model_name,
@@ -41,60 +57,86 @@ class AnthropicAIClient(BaseLLMClient):
             "stream": True,
             "max_tokens": 2048,
         }
-        response = requests.post(
+        if self.system_prompt:
+            # The system prompt comes first in the prompt, so it is always cached
+            data["system"] = [
+                {
+                    "type": "text",
+                    "text": self.system_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        response = self.post_stream(
             self.ANTHROPIC_MESSAGES_API_URL,
-            headers=self.anthropic_headers(),  # type: ignore
-            json=data,
-            stream=True,
+            self.anthropic_headers(),
+            encode_json_body(data),
         )
-        if response.status_code != 200:
-            raise ValueError(
-                f"Server responded with an error. Status Code: {response.status_code}"
-            )
-        return SSEClient(event_source=response)  # type: ignore
+        return SSEStream(response)
+
+
+def anthropic_cached_message(message: Message) -> dict:
+    """Message ending the prompt prefix to cache (a cache breakpoint)."""
+    return {
+        "role": message.role,
+        "content": [
+            {
+                "type": "text",
+                "text": message.content,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ],
+    }
 
 
-class AnthropicAIHandler:
+class AnthropicAIHandler(BaseLLMHandler):
     """
     Handler class to interact with the Anthropic models.
 
     Returns chat responses and stores the chat history.
+
+    The conversation prefix is cached by Anthropic: a cache breakpoint is put
+    on the last user message, which writes the prefix, and one on the previous
+    user message, where the prefix written by the previous turn is read.
+    Token usage of the last response, including cache_creation_input_tokens and
+    cache_read_input_tokens, is stored in last_usage.
+    info: https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching
     """
 
-    def __init__(self, model_name: str, temperature: float = 0.0):
-        self._messages = []
-        self._client = AnthropicAIClient(model_name, temperature)
-
-    def export_conversation(self) -> str:
-        string_conversation = ""
-        for message in self._messages:
-            if message["role"] == "user":
-                if string_conversation != "":
-                    string_conversation += "\n\n"
-                string_conversation += f"You: {message['content']}"
-            else:
-                string_conversation += f"LLM: {message['content']}"
-        return string_conversation
-
-    def stream_response(self, user_input: str) -> Generator[str, None, None]:
-        """
-        Yield stream responses from the client as they are received.
-
-        This method sends the user input to the client and then yields each piece
-        of the language model's response as it is received in real-time. After the
-        streaming is complete, it updates the message list with the user input and
-        the full language model response.
-
-        :param user_input: The input string from the user to be sent to the model.
-        :return: A generator yielding the model's response in streamed parts.
-        """
-        self._messages.append({"role": "user", "content": user_input})
-        stream = self._client.perform_stream_request(self._messages)
-        lm_response = ""
-        for event in stream.events():  # type: ignore
-            event_data = json.loads(event.data)
+    # Anthropic allows up to 4 breakpoints, one is taken by the system prompt
+    CACHE_BREAKPOINTS = 2
+
+    def __init__(
+        self, model_name: str, temperature: float = 0.0, system_prompt: str = ""
+    ):
+        super().__init__(AnthropicAIClient(model_name, temperature, system_prompt))
+        self.last_usage: dict = {}
+
+    def perform_stream_request(self):
+        self.last_usage = {}
+        messages = self.context_window()
+        user_indexes = [
+            index for index, message in enumerate(messages) if message.role == USER_ROLE
+        ]
+        breakpoints = {
+            index: anthropic_cached_message
+            for index in user_indexes[-self.CACHE_BREAKPOINTS :]
+        }
+        return self._client.perform_stream_request(
+            encode_messages(messages, self.message_format, breakpoints)
+        )
+
+    def iter_response_pieces(self, stream) -> Generator[str, None, None]:
+        for data in stream.events():
+            event_data = json.loads(data)
             if event_data["type"] == "content_block_delta":
-                response_piece = event_data["delta"]["text"]
-                lm_response += response_piece
-                yield response_piece
-        self._messages.append({"role": "assistant", "content": lm_response})
+                yield event_data["delta"]["text"]
+            elif event_data["type"] == "message_start":
+                self.last_usage = dict(event_data["message"].get("usage", {}))
+            elif event_data["type"] == "message_delta":
+                self.last_usage.update(event_data.get("usage", {}))
+
+    def add_usage(self, metrics: TurnMetrics) -> None:
+        metrics.cache_read_tokens = self.last_usage.get("cache_read_input_tokens")
+        metrics.cache_creation_tokens = self.last_usage.get(
+            "cache_creation_input_tokens"
+        )
@@ -1,21 +1,439 @@
-from typing import Generator, Protocol
+import contextlib
+import hashlib
+import heapq
+import itertools
+import json
+import socket
+import threading
+import time
+from typing import Callable, Generator, Iterator, Optional, Protocol
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ReadTimeoutError
+
+# Also imported from here by the provider modules
+from tinychat.llms.conversation import (
+    ASSISTANT_ROLE,
+    USER_ROLE,
+    Conversation,
+    Message,
+    RawJSON,
+    WireFormat,
+    chat_completions_message,
+    encode_json_body,
+    encode_messages,
+    estimate_tokens,
+)
+from tinychat.llms.metrics import TurnMetrics, turn_metrics
+from tinychat.llms.streams import ByteStream
+from tinychat.llms.retry import (
+    CircuitOpenError,
+    ProviderError,
+    RequestCancelled,
+    StreamTimeoutError,
+    backoff_delay,
+    circuit_breaker,
+    parse_retry_after,
+)
 from tinychat.utils.secrets import get_secret
-from tinychat.settings import SECRETS_FILE_PATH
+from tinychat.settings import (
+    FIRST_TOKEN_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_IDLE_TIMEOUT,
+    HTTP_POOL_MAXSIZE,
+    HTTP_RETRY_AFTER_MAX,
+    SECRETS_FILE_PATH,
+    STREAM_IDLE_TIMEOUT,
+)
 
 
 class LLMProtocol(Protocol):
     """A protocol for language model handlers."""
 
+    name: str
+    context_budget: Optional[int]
+    trimmed_messages: int
+    last_metrics: Optional[TurnMetrics]
+    response_cache: Optional["ResponseCacheProtocol"]
+    # The history, shared by the handlers racing each other
+    conversation: "Conversation"
+
     def stream_response(self, user_input: str) -> Generator[str, None, None]:
         """Get a stream response from the language model API."""
         ...
 
+    def stream_reply(self) -> Generator[str, None, None]:
+        """Stream the response to the history, without adding it."""
+        ...
+
+    def cancel(self) -> None:
+        """Cancel the response being streamed, from any thread."""
+        ...
+
+    def queue_turn(self) -> None:
+        """Make cancel() apply to the next response, before it is started."""
+        ...
+
+    def reset(self) -> None:
+        """Start a new conversation, keeping the client."""
+        ...
+
+    def prewarm(self) -> None:
+        """Open a connection to the provider ahead of the first request."""
+        ...
+
     def export_conversation(self) -> str:
         """Return the conversation as string."""
         ...
 
 
+# A cached response: the pieces with their offsets (seconds) from the request
+CachedResponse = list[tuple[float, str]]
+
+
+class ResponseCacheProtocol(Protocol):
+    """A protocol for the caches of complete responses."""
+
+    # Replay the cached responses at the pace they were received
+    realtime: bool
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Return the cached response or None."""
+        ...
+
+    def put(self, key: str, model: str, response: CachedResponse) -> None:
+        """Store a complete response of model."""
+        ...
+
+
+_connect_timing = threading.local()
+
+
+def pop_connect_time() -> float:
+    """
+    Return the seconds spent by this thread opening connections (TCP and TLS
+    handshakes) since the last call.
+    """
+    connect_time = getattr(_connect_timing, "seconds", 0.0)
+    _connect_timing.seconds = 0.0
+    return connect_time
+
+
+def shutdown_connection(conn) -> None:
+    """
+    Shut down the socket of an HTTP connection, waking up the threads blocked
+    reading from it (they get an error or the end of the stream).
+    """
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return
+    try:
+        # socket.socket's, as SSLSocket.shutdown drops the TLS state under the
+        # feet of the reading thread
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+_cancel_scope = threading.local()
+
+
+class Canceller:
+    """
+    Cancels a request from another thread.
+
+    The connection taken from the pools while active() is attached to the
+    canceller, and cancel() shuts down its socket: this interrupts the request
+    at any point, waiting for the headers as well as in the middle of the
+    body, and the connection is not reused. release() detaches it, once the
+    request is over and the connection may go back to the pool.
+    """
+
+    def __init__(self) -> None:
+        self._cancelled = threading.Event()
+        # The timeout which cancelled the request, see time_out()
+        self.timed_out: Optional[str] = None
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @contextlib.contextmanager
+    def active(self) -> Iterator[None]:
+        """Attach the connections used by this thread in the block."""
+        _cancel_scope.canceller = self
+        try:
+            yield
+        finally:
+            _cancel_scope.canceller = None
+
+    def attach(self, conn) -> None:
+        with self._lock:
+            self._connection = conn
+            cancelled = self.cancelled
+        if cancelled:
+            shutdown_connection(conn)
+
+    def release(self) -> None:
+        with self._lock:
+            self._connection = None
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled.set()
+            conn = self._connection
+        if conn is not None:
+            shutdown_connection(conn)
+
+    def time_out(self, phase: str) -> None:
+        """Cancel because of a timeout, see StreamTimeoutError."""
+        self.timed_out = phase
+        self.cancel()
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep, waking up at once if cancelled."""
+        self._cancelled.wait(seconds)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise RequestCancelled("The request was cancelled.")
+
+
+def active_canceller() -> Optional[Canceller]:
+    return getattr(_cancel_scope, "canceller", None)
+
+
+class Watchdog:
+    """
+    Calls functions after a delay, on a single daemon thread shared by all the
+    responses, so that arming the timeout of a response does not start a
+    thread of its own.
+    """
+
+    def __init__(self) -> None:
+        # Heap of [deadline, order, function, args], function None if cancelled
+        self._timers: list[list] = []
+        self._cancelled = 0
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def call_later(self, delay: float, function: Callable, *args) -> list:
+        """Call function(*args) in delay seconds, unless cancel() is called."""
+        timer = [time.monotonic() + delay, next(self._order), function, args]
+        with self._condition:
+            heapq.heappush(self._timers, timer)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="tinychat-watchdog", daemon=True
+                )
+                self._thread.start()
+            elif self._timers[0] is timer:
+                self._condition.notify()
+        return timer
+
+    def cancel(self, timer: list) -> None:
+        with self._condition:
+            if timer[2] is None:
+                # Called or cancelled already
+                return
+            timer[2] = None
+            self._cancelled += 1
+            # The cancelled timers are dropped once they are most of the heap
+            if self._cancelled > len(self._timers) // 2:
+                self._timers = [t for t in self._timers if t[2] is not None]
+                heapq.heapify(self._timers)
+                self._cancelled = 0
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    if self._timers and self._timers[0][0] <= now:
+                        timer = heapq.heappop(self._timers)
+                        function, args = timer[2], timer[3]
+                        if function is not None:
+                            timer[2] = None
+                            break
+                        self._cancelled -= 1
+                    else:
+                        timeout = self._timers[0][0] - now if self._timers else None
+                        self._condition.wait(timeout)
+            try:
+                function(*args)
+            except Exception:
+                pass
+
+
+# The timeouts of the responses, see BaseLLMHandler.stream_reply
+_watchdog = Watchdog()
+
+
+def is_read_timeout(error: BaseException) -> bool:
+    """
+    Whether error is a socket read timing out: requests raises ReadTimeout
+    while waiting for the headers, and a ConnectionError wrapping urllib3's
+    ReadTimeoutError while reading the body.
+    """
+    if isinstance(error, requests.ReadTimeout):
+        return True
+    return isinstance(error, requests.ConnectionError) and any(
+        isinstance(arg, ReadTimeoutError) for arg in error.args
+    )
+
+
+class TimedConnectMixin:
+    """
+    Connection mixin adding the duration of connect() to pop_connect_time.
+    The connections made for a cancelled request are shut down at once.
+    """
+
+    def connect(self):
+        started = time.monotonic()
+        try:
+            super().connect()  # type: ignore
+        finally:
+            elapsed = time.monotonic() - started
+            _connect_timing.seconds = getattr(_connect_timing, "seconds", 0.0) + elapsed
+        canceller = active_canceller()
+        if canceller is not None and canceller.cancelled:
+            shutdown_connection(self)
+
+
+class TimedHTTPConnection(TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class IdleEvictionMixin:
+    """
+    Connection pool mixin that drops keep-alive connections left idle for
+    longer than HTTP_POOL_IDLE_TIMEOUT seconds, instead of handing out sockets
+    that the provider has most likely already closed on its side.
+    """
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)  # type: ignore
+        released_at = getattr(conn, "released_at", None)
+        if released_at is not None:
+            if time.monotonic() - released_at > HTTP_POOL_IDLE_TIMEOUT:
+                conn.close()
+        canceller = active_canceller()
+        if canceller is not None:
+            canceller.attach(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn.released_at = time.monotonic()
+        super()._put_conn(conn)  # type: ignore
+
+
+class PooledHTTPConnectionPool(IdleEvictionMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class PooledHTTPSConnectionPool(IdleEvictionMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter keeping one keep-alive pool per host, with idle eviction,
+    timing of the connection handshakes and cancellation of the requests.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": PooledHTTPConnectionPool,
+            "https": PooledHTTPSConnectionPool,
+        }
+
+    def prewarm(self, url: str) -> None:
+        """
+        Open a connection to the host of url (DNS, TCP and TLS handshakes) and
+        leave it idle in its pool for the next request. Nothing is done if the
+        pool already holds an open connection. The handshakes must complete
+        within HTTP_CONNECT_TIMEOUT seconds.
+        """
+        pool = self.poolmanager.connection_from_url(url)
+        conn = pool._get_conn()
+        try:
+            if conn.sock is None:
+                # The pool has no timeout, the requests set theirs
+                conn.timeout = HTTP_CONNECT_TIMEOUT
+                conn.connect()
+        except Exception:
+            conn.close()
+            raise
+        finally:
+            pool._put_conn(conn)
+            # Not the handshakes of a request
+            pop_connect_time()
+
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+# Keep-alive connections kept per host, see set_http_pool_maxsize
+_http_pool_maxsize = HTTP_POOL_MAXSIZE
+
+
+def get_http_session() -> requests.Session:
+    """
+    Return the process-wide requests session shared by all the LLM clients.
+
+    The session is created on first use and then reused across chat turns,
+    handlers and "New Chat" resets, so that consecutive requests to the same
+    provider skip the TCP and TLS handshakes.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            adapter = PooledHTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=_http_pool_maxsize,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+def set_http_pool_maxsize(maxsize: int) -> None:
+    """
+    Keep up to maxsize connections per host, for as many requests streaming at
+    once to the same provider: past the pool size, the connections released
+    are closed instead of reused. The current session is closed, and a new one
+    created on next use.
+    """
+    global _http_pool_maxsize
+    close_http_session()
+    with _http_session_lock:
+        _http_pool_maxsize = maxsize
+
+
+def close_http_session() -> None:
+    """Close all pooled connections. A new session is created on next use."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+
+
 class BaseLLMClient:
     """
     A base client class for interacting with Language Model APIs.
@@ -23,6 +441,13 @@ class BaseLLMClient:
     :param api_key: The API key used for authenticating with the API.
     """
 
+    # Provider name, as in tinychat.llms.registry (one circuit breaker each)
+    PROVIDER = ""
+    # Message of the ProviderError raised for an error status
+    ERROR_MESSAGE = "Server responded with an error. Status Code: {status}"
+    # Response headers holding the id given to the request by the provider
+    REQUEST_ID_HEADERS = ("x-request-id", "request-id")
+
     def __init__(self, api_key_name: str) -> None:
         self.api_key = api_key_name
 
@@ -37,9 +462,395 @@ class BaseLLMClient:
             raise ValueError(f"{api_key_name} was not found in {SECRETS_FILE_PATH}.")
         self._api_key = api_key
 
+    @property
+    def session(self) -> requests.Session:
+        return get_http_session()
+
+    def generation_params(self) -> dict:
+        """Parameters of the requests: the public attributes of the client."""
+        return {k: v for k, v in vars(self).items() if not k.startswith("_")}
+
+    @property
+    def api_url(self) -> str:
+        """URL of the requests, whose host prewarm() connects to."""
+        return ""
+
+    def prewarm(self) -> None:
+        """
+        Open a pooled connection to the host of api_url, so that the next
+        request does not wait for the handshakes.
+        """
+        url = self.api_url
+        if not url:
+            return
+        adapter = self.session.get_adapter(url)
+        if isinstance(adapter, PooledHTTPAdapter):
+            adapter.prewarm(url)
+
+    def post_stream(self, url: str, headers: dict, body: bytes) -> requests.Response:
+        """
+        POST a streaming request and return the response, once it is a 200.
+
+        Transient errors are retried up to HTTP_MAX_RETRIES times, after the
+        Retry-After of the response or a jittered backoff (see
+        tinychat.llms.retry). Other error statuses raise a ProviderError at
+        once. While the circuit breaker of the provider is open, the request
+        is not sent and CircuitOpenError is raised. Within Canceller.active(),
+        a cancellation stops the retries and raises RequestCancelled.
+
+        The connection must open within HTTP_CONNECT_TIMEOUT seconds, and the
+        socket reads (the headers, then each chunk of the body) time out after
+        STREAM_IDLE_TIMEOUT seconds. These timeouts are not retried.
+        """
+        breaker = circuit_breaker(self.PROVIDER)
+        canceller = active_canceller()
+        sleep = time.sleep if canceller is None else canceller.sleep
+        last_error: Optional[Exception] = None
+        for attempt in itertools.count():
+            if canceller is not None:
+                canceller.raise_if_cancelled()
+            try:
+                trial = breaker.before_request()
+            except CircuitOpenError:
+                # The retries opened the circuit, report what happened
+                if last_error is not None:
+                    raise last_error
+                raise
+            try:
+                try:
+                    response = self.session.post(
+                        url,
+                        headers=headers,
+                        data=body,
+                        stream=True,
+                        timeout=(HTTP_CONNECT_TIMEOUT, STREAM_IDLE_TIMEOUT),
+                    )
+                except (requests.ConnectTimeout, requests.ReadTimeout):
+                    # No connection or no headers in time, too slow to be worth
+                    # retrying (ConnectTimeout is also a ConnectionError)
+                    breaker.record_failure()
+                    raise
+                except requests.ConnectionError as e:
+                    if canceller is not None and canceller.cancelled:
+                        raise RequestCancelled("The request was cancelled.") from e
+                    breaker.record_failure()
+                    if attempt >= HTTP_MAX_RETRIES:
+                        raise
+                    last_error = e
+                    sleep(backoff_delay(attempt))
+                    continue
+                if response.status_code == 200:
+                    breaker.record_success()
+                    return response
+                error = self.response_error(response)
+                response.close()
+                if not error.retryable:
+                    # Refused (bad request, wrong key...), but the provider is up
+                    breaker.record_success()
+                    raise error
+                breaker.record_failure()
+                retry_after = error.retry_after
+                if attempt >= HTTP_MAX_RETRIES or (retry_after or 0) > HTTP_RETRY_AFTER_MAX:
+                    raise error
+                last_error = error
+                sleep(backoff_delay(attempt) if retry_after is None else retry_after)
+            finally:
+                if trial is not None:
+                    # Not recorded if cancelled, let the next request be the trial
+                    breaker.release_trial(trial)
+        raise AssertionError("unreachable")
+
+    def response_error(self, response: requests.Response) -> ProviderError:
+        """Return the error of a response with an error status."""
+        headers = response.headers
+        request_id = None
+        for header in self.REQUEST_ID_HEADERS:
+            if header in headers:
+                request_id = headers[header]
+                break
+        retry_after = parse_retry_after(headers.get("retry-after"))
+        retry_after_ms = parse_retry_after(headers.get("retry-after-ms"))
+        if retry_after_ms is not None:
+            retry_after = retry_after_ms / 1000
+        return ProviderError(
+            self.ERROR_MESSAGE.format(status=response.status_code),
+            provider=self.PROVIDER,
+            status=response.status_code,
+            request_id=request_id,
+            retry_after=retry_after,
+        )
+
     def default_headers(self):
         return {
             "Accept": "application/json",
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
+
+
+class BaseLLMHandler:
+    """
+    Base class of the handlers interacting with the language models.
+
+    Returns chat responses and stores the chat history in a Conversation.
+    Subclasses build the request from the history and extract the response
+    pieces from the events of the stream.
+
+    :param client: The client used to perform the requests.
+    """
+
+    # Provider representation of a Message, see Message.to_wire
+    message_format: WireFormat = staticmethod(chat_completions_message)  # type: ignore
+
+    def __init__(self, client) -> None:
+        self._messages = Conversation()
+        self._client = client
+        # Name under which the metrics of the responses are recorded
+        self.name: str = getattr(client, "model_name", type(self).__name__)
+        # Max number of tokens of the history sent with each request (None: all)
+        self.context_budget: Optional[int] = None
+        # Number of messages left out of the last request to fit context_budget
+        self.trimmed_messages = 0
+        # Latency and throughput of the last response (None if it was cached)
+        self.last_metrics: Optional[TurnMetrics] = None
+        # Cache of the complete responses, opt-in
+        self.response_cache: Optional[ResponseCacheProtocol] = None
+        # Canceller of the request of the response being streamed
+        self._canceller: Optional[Canceller] = None
+        # Canceller of the response queued to be streamed, see queue_turn()
+        self._queued_canceller: Optional[Canceller] = None
+
+    @property
+    def provider(self) -> str:
+        """The provider name, as in tinychat.llms.registry."""
+        return getattr(self._client, "PROVIDER", "")
+
+    @property
+    def conversation(self) -> Conversation:
+        """The history, which can be shared with handlers of other models."""
+        return self._messages
+
+    @conversation.setter
+    def conversation(self, conversation: Conversation) -> None:
+        self._messages = conversation
+
+    def export_conversation(self) -> str:
+        return self._messages.export()
+
+    def reset(self) -> None:
+        """
+        Start a new conversation. The client, and the pooled connections to
+        the provider, are kept for the next requests.
+        """
+        self._messages = Conversation()
+        self.trimmed_messages = 0
+        self.last_metrics = None
+
+    def prewarm(self) -> None:
+        """Open a connection to the provider ahead of the first request."""
+        self._client.prewarm()
+
+    def context_window(self) -> list[Message]:
+        """Return the messages of the history to send with the next request."""
+        messages, self.trimmed_messages = self._messages.window(self.context_budget)
+        return messages
+
+    def perform_stream_request(self):
+        return self._client.perform_stream_request(
+            encode_messages(self.context_window(), self.message_format)
+        )
+
+    def iter_response_pieces(self, stream) -> Generator[str, None, None]:
+        raise NotImplementedError
+
+    def add_usage(self, metrics: TurnMetrics) -> None:
+        """Add the usage reported by the provider for the response to metrics."""
+
+    def cache_key(self) -> str:
+        """Key of the response to the current history in the response cache."""
+        key = [self.name, self._client.generation_params(), self._messages.digest()]
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def replay_response(
+        self,
+        response: CachedResponse,
+        realtime: bool,
+        canceller: Optional[Canceller] = None,
+    ) -> Generator[str, None, None]:
+        self.last_metrics = None
+        if canceller is None:
+            canceller = Canceller()
+        started = time.monotonic()
+        for offset, response_piece in response:
+            if realtime:
+                delay = started + offset - time.monotonic()
+                if delay > 0:
+                    canceller.sleep(delay)
+            canceller.raise_if_cancelled()
+            yield response_piece
+
+    def stream_error(
+        self,
+        error: BaseException,
+        canceller: Canceller,
+        metrics: TurnMetrics,
+        stream: Optional[ByteStream],
+    ) -> BaseException:
+        """
+        Return the error to raise for an error of stream_reply: the timeouts
+        and the cancellations are reported as such, whatever the exception
+        raised by the interrupted request.
+        """
+        if isinstance(error, GeneratorExit):
+            return error
+        phase = canceller.timed_out
+        if phase is None:
+            if isinstance(error, requests.ConnectTimeout):
+                phase = StreamTimeoutError.CONNECT
+            elif is_read_timeout(error):
+                phase = StreamTimeoutError.IDLE
+            elif canceller.cancelled:
+                if isinstance(error, RequestCancelled):
+                    return error
+                return RequestCancelled("The request was cancelled.")
+            else:
+                return error
+        elapsed = time.monotonic() - metrics.started_at
+        bytes_received = stream.bytes_received if stream is not None else 0
+        if phase == StreamTimeoutError.CONNECT:
+            message = (
+                f"Could not connect to {self.name} within {HTTP_CONNECT_TIMEOUT:g}s."
+            )
+        elif phase == StreamTimeoutError.FIRST_TOKEN:
+            message = (
+                f"No response from {self.name} within {FIRST_TOKEN_TIMEOUT:g}s "
+                f"({bytes_received} bytes received)."
+            )
+        else:
+            message = (
+                f"{self.name} stopped responding for {STREAM_IDLE_TIMEOUT:g}s, "
+                f"after {metrics.tokens} tokens ({bytes_received} bytes) "
+                f"in {elapsed:.1f}s."
+            )
+        return StreamTimeoutError(
+            message,
+            provider=self.provider,
+            phase=phase,
+            elapsed=elapsed,
+            tokens=metrics.tokens,
+            bytes_received=bytes_received,
+        )
+
+    def cancel(self) -> None:
+        """
+        Cancel the response being streamed, if any: its connection is shut
+        down and stream_reply raises RequestCancelled. Thread-safe.
+        """
+        canceller = self._canceller
+        if canceller is not None:
+            canceller.cancel()
+
+    def queue_turn(self) -> None:
+        """
+        Called when the next response is queued to be streamed on another
+        thread: a cancel() from now on cancels it, also before it is started,
+        and then stream_reply raises RequestCancelled without sending it.
+        """
+        self._canceller = self._queued_canceller = Canceller()
+
+    def stream_response(self, user_input: str) -> Generator[str, None, None]:
+        """
+        Yield stream responses from the client as they are received.
+
+        This method sends the user input to the client and then yields each piece
+        of the language model's response as it is received in real-time. After the
+        streaming is complete, it updates the message list with the user input and
+        the full language model response.
+
+        If the response is cancelled or times out, the part received so far is
+        kept in the history as the response (see Conversation.end_cancelled_turn).
+
+        :param user_input: The input string from the user to be sent to the model.
+        :return: A generator yielding the model's response in streamed parts.
+        """
+        # The conversation of the turn, even if reset() is called meanwhile
+        conversation = self._messages
+        conversation.append(USER_ROLE, user_input)
+        lm_response = []
+        try:
+            for response_piece in self.stream_reply():
+                lm_response.append(response_piece)
+                yield response_piece
+        except (RequestCancelled, StreamTimeoutError):
+            conversation.end_cancelled_turn("".join(lm_response))
+            raise
+        conversation.append(ASSISTANT_ROLE, "".join(lm_response))
+
+    def stream_reply(self) -> Generator[str, None, None]:
+        """
+        Yield the pieces of the response to the history as they are received,
+        without adding the response to the history.
+
+        The latency and throughput of the response are recorded in turn_metrics,
+        also when the request fails. With a response_cache, a response to the
+        same history with the same parameters is replayed from the cache. The
+        connection is closed if the generator is not run to the end, and if
+        cancel() is called RequestCancelled is raised.
+
+        StreamTimeoutError is raised if the connection cannot be opened in
+        time, if no token is received within FIRST_TOKEN_TIMEOUT seconds, or if
+        the provider stops sending for STREAM_IDLE_TIMEOUT seconds.
+        """
+        canceller = self._queued_canceller or Canceller()
+        self._canceller = canceller
+        self._queued_canceller = None
+        # Cancelled while it was queued
+        canceller.raise_if_cancelled()
+        cache = self.response_cache
+        if cache is not None:
+            cache_key = self.cache_key()
+            cached = cache.get(cache_key)
+            if cached is not None:
+                yield from self.replay_response(cached, cache.realtime, canceller)
+                return
+        metrics = TurnMetrics(self.name)
+        stream = None
+        watchdog: Optional[list] = _watchdog.call_later(
+            FIRST_TOKEN_TIMEOUT, canceller.time_out, StreamTimeoutError.FIRST_TOKEN
+        )
+        try:
+            pop_connect_time()
+            with canceller.active():
+                stream = self.perform_stream_request()
+            metrics.response_started(pop_connect_time())
+            lm_response = []
+            offsets = []
+            for response_piece in self.iter_response_pieces(stream):
+                if watchdog is not None:
+                    _watchdog.cancel(watchdog)
+                    watchdog = None
+                metrics.token_received(response_piece)
+                lm_response.append(response_piece)
+                if cache is not None:
+                    offsets.append(time.monotonic() - metrics.started_at)
+                yield response_piece
+            # A shut down connection may look like the end of the stream
+            canceller.raise_if_cancelled()
+        except BaseException as e:
+            error = self.stream_error(e, canceller, metrics, stream)
+            metrics.error = type(error).__name__
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            if watchdog is not None:
+                _watchdog.cancel(watchdog)
+            canceller.release()
+            if stream is not None:
+                stream.close()
+            self.add_usage(metrics)
+            metrics.finish(stream)
+            turn_metrics.record(metrics)
+            self.last_metrics = metrics
+        if cache is not None:
+            cache.put(cache_key, self.name, list(zip(offsets, lm_response)))
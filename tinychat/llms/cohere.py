@@ -1,9 +1,15 @@
-import json
 from typing import Generator
 
-import requests
-
-from tinychat.llms.base import BaseLLMClient
+from tinychat.llms.base import (
+    BaseLLMClient,
+    BaseLLMHandler,
+    encode_json_body,
+    encode_messages,
+    Message,
+    RawJSON,
+    USER_ROLE,
+)
+from tinychat.llms.streams import NDJSONStream
 from tinychat.settings import COHERE_API_KEY_NAME
 
 
@@ -12,85 +18,59 @@ class CohereClient(BaseLLMClient):
     Cohere chat client.
     """
 
+    PROVIDER = "cohere"
+    ERROR_MESSAGE = "Server responded with error: {status}"
+
     COHERE_CHAT_API_URL = "https://api.cohere.ai/v1/chat"
 
     def __init__(self, temperature: float) -> None:
         super().__init__(api_key_name=COHERE_API_KEY_NAME)
         self.temperature = temperature
 
+    @property
+    def api_url(self) -> str:
+        return self.COHERE_CHAT_API_URL
+
     def perform_stream_request(
-        self, user_input: str, chat_history: list[dict]
-    ) -> requests.Response:
+        self, user_input: str, chat_history: RawJSON
+    ) -> NDJSONStream:
         data = {
             "chat_history": chat_history,
             "message": user_input,
             "temperature": self.temperature,
             "stream": True,
         }
-        response = requests.post(
-            self.COHERE_CHAT_API_URL,
-            headers=self.default_headers(),
-            json=data,
-            stream=True,
+        response = self.post_stream(
+            self.COHERE_CHAT_API_URL, self.default_headers(), encode_json_body(data)
         )
-        if response.status_code != 200:
-            raise ValueError(f"Server responded with error: {response.status_code}")
-        try:
-            return response
-        except ValueError:
-            raise ValueError("Invalid response format received from server.")
+        return NDJSONStream(response)
+
 
+def cohere_message(message: Message) -> dict:
+    role = "User" if message.role == USER_ROLE else "Chatbot"
+    return {"role": role, "message": message.content}
 
-class CohereHandler:
+
+class CohereHandler(BaseLLMHandler):
     """
     Handler class to interact with the Cohere models.
 
     Returns chat responses and stores the chat history.
-
-    TODO: add chat message dataclass so that we can enforce validation of
-    message format that is needed for working client requests to the API?
     """
 
+    message_format = staticmethod(cohere_message)
+
     def __init__(self, temperature: float = 0.0):
-        self._chat_history = []
-        self._client = CohereClient(temperature)
-
-    def export_conversation(self) -> str:
-        string_conversation = ""
-        for message in self._chat_history:
-            if message["role"] == "User":
-                if string_conversation != "":
-                    string_conversation += "\n\n"
-                string_conversation += f"You: {message['message']}"
-            else:
-                string_conversation += f"LLM: {message['message']}"
-        return string_conversation
-
-    def stream_response(self, user_input: str) -> Generator[str, None, None]:
-        """
-        Yield stream responses from the client as they are received.
-
-        This method sends the user input to the client and then yields each piece
-        of the language model's response as it is received in real-time. After the
-        streaming is complete, it updates the message list with the user input and
-        the full language model response.
-
-        :param user_input: The input string from the user to be sent to the model.
-        :return: A generator yielding the model's response in streamed parts.
-        """
-        self._chat_history.append({"role": "User", "message": user_input})
-        stream = self._client.perform_stream_request(user_input, self._chat_history)
-        lm_response = ""
-        for response_piece in stream:  # type: ignore
-            try:
-                data = json.loads(response_piece.decode("utf-8"))
-            except ValueError as e:
-                # HACK. Cohere's stream last response should include the whole response but for some reasons it comes back broken
-                # Info: https://docs.cohere.com/reference/chat
-                continue
-            if not "event_type" in data.keys():
-                continue
-            if data["event_type"] == "text-generation":
-                lm_response += data["text"]
+        super().__init__(CohereClient(temperature))
+
+    def perform_stream_request(self):
+        # The last user message is sent apart from the previous chat history
+        messages = self.context_window()
+        chat_history = encode_messages(messages[:-1], self.message_format)
+        return self._client.perform_stream_request(messages[-1].content, chat_history)
+
+    def iter_response_pieces(self, stream) -> Generator[str, None, None]:
+        # Info: https://docs.cohere.com/reference/chat
+        for data in stream.events():
+            if data.get("event_type") == "text-generation":
                 yield data["text"]
-        self._chat_history.append({"role": "Chatbot", "message": lm_response})
@@ -0,0 +1,233 @@
+"""
+The history of a chat, independent of the providers, and its encodings.
+
+Kept apart from tinychat.llms.base, which imports requests, so that the app
+uses the histories without loading the HTTP machinery at startup.
+"""
+
+import hashlib
+import json
+from typing import Callable, Iterable, Iterator, Optional
+
+USER_ROLE = "user"
+ASSISTANT_ROLE = "assistant"
+
+# Tokens added to each message by the chat templates of the providers
+MESSAGE_TOKENS_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local estimate of the number of tokens of a text.
+
+    Counts about 4 characters per token for ASCII text (English and code).
+    Other text is counted by its UTF-8 size, as non ASCII characters usually
+    take more tokens each.
+    """
+    if text.isascii():
+        return len(text) // 4 + 1
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+class Message:
+    """
+    A single turn of a conversation.
+
+    The text is stored once. The provider specific representations built from
+    it are memoized per wire format; they reference the same string, so long
+    pasted documents are not duplicated. The JSON encoding of a representation
+    is memoized as well, so a message is serialized only the first time it is
+    sent.
+    """
+
+    __slots__ = ("role", "content", "_wire", "_encoded", "_tokens")
+
+    def __init__(self, role: str, content: str) -> None:
+        self.role = role
+        self.content = content
+        self._wire: Optional[dict] = None
+        self._encoded: Optional[dict] = None
+        self._tokens: Optional[int] = None
+
+    @property
+    def tokens(self) -> int:
+        """Estimated number of tokens of the message, computed once."""
+        if self._tokens is None:
+            self._tokens = estimate_tokens(self.content) + MESSAGE_TOKENS_OVERHEAD
+        return self._tokens
+
+    def to_wire(self, wire_format: "WireFormat") -> dict:
+        if self._wire is None:
+            self._wire = {}
+        wire = self._wire.get(wire_format)
+        if wire is None:
+            wire = self._wire[wire_format] = wire_format(self)
+        return wire
+
+    def encode(self, wire_format: "WireFormat") -> bytes:
+        if self._encoded is None:
+            self._encoded = {}
+        encoded = self._encoded.get(wire_format)
+        if encoded is None:
+            encoded = json.dumps(self.to_wire(wire_format)).encode("utf-8")
+            self._encoded[wire_format] = encoded
+        return encoded
+
+    def __repr__(self) -> str:
+        return f"Message(role={self.role!r}, content={self.content!r})"
+
+
+WireFormat = Callable[[Message], dict]
+
+
+def chat_completions_message(message: Message) -> dict:
+    """Message format of the OpenAI-like APIs (also Anthropic's)."""
+    return {"role": message.role, "content": message.content}
+
+
+class RawJSON:
+    """
+    Already encoded JSON, kept as a list of byte segments so that it can be
+    spliced into a request body by encode_json_body without being copied.
+    """
+
+    __slots__ = ("segments",)
+
+    def __init__(self, segments: list[bytes]) -> None:
+        self.segments = segments
+
+    def __bytes__(self) -> bytes:
+        return b"".join(self.segments)
+
+
+def encode_json_body(data: dict) -> bytes:
+    """
+    Encode a request body, splicing the RawJSON values without re-encoding them.
+    """
+    segments = [b"{"]
+    for key, value in data.items():
+        if len(segments) > 1:
+            segments.append(b",")
+        segments.append(json.dumps(key).encode("utf-8") + b":")
+        if isinstance(value, RawJSON):
+            segments.extend(value.segments)
+        else:
+            segments.append(json.dumps(value).encode("utf-8"))
+    segments.append(b"}")
+    return b"".join(segments)
+
+
+def encode_messages(
+    messages: Iterable[Message],
+    wire_format: WireFormat,
+    overrides: Optional[dict[int, WireFormat]] = None,
+) -> RawJSON:
+    """
+    Encode messages as a JSON array, reusing their memoized encodings.
+
+    :param overrides: Wire formats to use instead of wire_format, by index.
+    """
+    segments = [b"["]
+    for index, message in enumerate(messages):
+        if len(segments) > 1:
+            segments.append(b",")
+        if overrides and index in overrides:
+            segments.append(message.encode(overrides[index]))
+        else:
+            segments.append(message.encode(wire_format))
+    segments.append(b"]")
+    return RawJSON(segments)
+
+
+class Conversation:
+    """
+    Provider independent chat history, shared by all the handlers.
+    """
+
+    def __init__(self) -> None:
+        self._messages: list[Message] = []
+        # Rolling hash of the history up to each message
+        self._digests: list[bytes] = []
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def append(self, role: str, content: str) -> Message:
+        message = Message(role, content)
+        self._messages.append(message)
+        previous = self._digests[-1] if self._digests else b""
+        normalized = f"{role}\0{content.strip()}".encode("utf-8")
+        self._digests.append(hashlib.sha256(previous + normalized).digest())
+        return message
+
+    def clear(self) -> None:
+        self._messages.clear()
+        self._digests.clear()
+
+    def end_cancelled_turn(self, partial_response: str) -> None:
+        """
+        End a turn whose response was cancelled. The part of the response
+        received is kept as the response, or if there is none the user message
+        is removed, so that the roles keep alternating.
+        """
+        if partial_response:
+            self.append(ASSISTANT_ROLE, partial_response)
+        elif self._messages and self._messages[-1].role == USER_ROLE:
+            self._messages.pop()
+            self._digests.pop()
+
+    def digest(self) -> str:
+        """
+        Hash of the whole history, ignoring the whitespace around the messages.
+        Updated incrementally, so it costs one hash of the last message per turn.
+        """
+        if not self._digests:
+            return hashlib.sha256().hexdigest()
+        return self._digests[-1].hex()
+
+    def to_wire(self, wire_format: WireFormat) -> list[dict]:
+        return [message.to_wire(wire_format) for message in self._messages]
+
+    def encode(self, wire_format: WireFormat) -> RawJSON:
+        return encode_messages(self._messages, wire_format)
+
+    def window(self, token_budget: Optional[int]) -> tuple[list[Message], int]:
+        """
+        Return the messages to send within token_budget, and how many were left
+        out.
+
+        The first exchange is always kept, as it usually sets up the whole
+        conversation, then the most recent messages are added until the budget
+        is spent. The window restarts on a user message so that roles keep
+        alternating. The last message is always sent.
+        """
+        messages = self._messages
+        if token_budget is None or sum(m.tokens for m in messages) <= token_budget:
+            return list(messages), 0
+        pinned = messages[:2] if len(messages) > 2 else []
+        budget = token_budget - sum(message.tokens for message in pinned)
+        start = len(messages)
+        while start > len(pinned) and messages[start - 1].tokens <= budget:
+            budget -= messages[start - 1].tokens
+            start -= 1
+        while start < len(messages) - 1 and messages[start].role != USER_ROLE:
+            start += 1
+        start = min(start, len(messages) - 1)
+        return pinned + messages[start:], start - len(pinned)
+
+    def export(self) -> str:
+        string_conversation = ""
+        for message in self._messages:
+            if message.role == USER_ROLE:
+                if string_conversation != "":
+                    string_conversation += "\n\n"
+                string_conversation += f"You: {message.content}"
+            else:
+                string_conversation += f"LLM: {message.content}"
+        return string_conversation
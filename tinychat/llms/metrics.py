@@ -0,0 +1,244 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from tinychat.llms.streams import ByteStream
+from tinychat.settings import METRICS_RING_SIZE
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(
+        len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+class TurnMetrics:
+    """
+    Latency and throughput of a single streamed response.
+
+    All the durations are in seconds and measured from the moment the request
+    is started. Tokens are the streamed response pieces, as yielded by the
+    handlers; most providers send one token per piece.
+
+    The prompt tokens read from and written to the provider's prompt cache
+    are None for the providers which do not report them.
+
+    :param model: The name of the model answering.
+    """
+
+    __slots__ = (
+        "model",
+        "started_at",
+        "connect",
+        "headers",
+        "first_byte",
+        "first_token",
+        "total",
+        "tokens",
+        "chars",
+        "bytes_received",
+        "gap_p50",
+        "gap_p99",
+        "gap_max",
+        "error",
+        "cache_read_tokens",
+        "cache_creation_tokens",
+        "_last_token_at",
+        "_gaps",
+    )
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.started_at = time.monotonic()
+        self.connect = 0.0
+        self.headers: Optional[float] = None
+        self.first_byte: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.total = 0.0
+        self.tokens = 0
+        self.chars = 0
+        self.bytes_received = 0
+        self.gap_p50 = 0.0
+        self.gap_p99 = 0.0
+        self.gap_max = 0.0
+        self.error: Optional[str] = None
+        self.cache_read_tokens: Optional[int] = None
+        self.cache_creation_tokens: Optional[int] = None
+        self._last_token_at = 0.0
+        self._gaps: list[float] = []
+
+    def response_started(self, connect: float) -> None:
+        """Called once the response headers are received."""
+        self.connect = connect
+        self.headers = time.monotonic() - self.started_at
+
+    def token_received(self, token: str) -> None:
+        now = time.monotonic()
+        if self.first_token is None:
+            self.first_token = now - self.started_at
+        else:
+            self._gaps.append(now - self._last_token_at)
+        self._last_token_at = now
+        self.tokens += 1
+        self.chars += len(token)
+
+    def finish(self, stream: Optional[ByteStream] = None) -> None:
+        """Called when the response is over, successfully or not."""
+        self.total = time.monotonic() - self.started_at
+        if isinstance(stream, ByteStream):
+            if stream.first_chunk_at is not None:
+                self.first_byte = stream.first_chunk_at - self.started_at
+            self.bytes_received = stream.bytes_received
+        gaps = sorted(self._gaps)
+        self.gap_p50 = percentile(gaps, 0.5)
+        self.gap_p99 = percentile(gaps, 0.99)
+        self.gap_max = gaps[-1] if gaps else 0.0
+        self._gaps = []
+
+    @property
+    def tokens_per_second(self) -> float:
+        if self.first_token is None or self.tokens < 2:
+            return 0.0
+        streaming = self._last_token_at - self.started_at - self.first_token
+        return (self.tokens - 1) / streaming if streaming > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "model": self.model,
+            "connect": self.connect,
+            "headers": self.headers,
+            "first_byte": self.first_byte,
+            "first_token": self.first_token,
+            "total": self.total,
+            "tokens": self.tokens,
+            "chars": self.chars,
+            "bytes_received": self.bytes_received,
+            "tokens_per_second": self.tokens_per_second,
+            "gap_p50": self.gap_p50,
+            "gap_p99": self.gap_p99,
+            "gap_max": self.gap_max,
+            "error": self.error,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_creation_tokens": self.cache_creation_tokens,
+        }
+
+
+class MetricsRecorder:
+    """
+    Bounded in-memory ring of the metrics of the last responses, with
+    percentile summaries per model.
+
+    :param size: The number of responses kept.
+    """
+
+    # Metrics summarized with percentiles
+    LATENCIES = (
+        "connect",
+        "headers",
+        "first_byte",
+        "first_token",
+        "total",
+        "tokens_per_second",
+        "gap_p99",
+    )
+    QUANTILES = (0.5, 0.9, 0.99)
+    # Metrics summed over the responses
+    COUNTERS = (
+        "turns",
+        "errors",
+        "tokens",
+        "chars",
+        "bytes_received",
+        "cache_read_tokens",
+        "cache_creation_tokens",
+    )
+
+    def __init__(self, size: int = METRICS_RING_SIZE) -> None:
+        self._turns: deque[TurnMetrics] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, turn: TurnMetrics) -> None:
+        with self._lock:
+            self._turns.append(turn)
+
+    def turns(self) -> list[TurnMetrics]:
+        with self._lock:
+            return list(self._turns)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._turns.clear()
+
+    def summary(self) -> dict:
+        """
+        Return the percentiles of the metrics of the recorded responses, by model.
+        """
+        by_model: dict[str, list[TurnMetrics]] = {}
+        for turn in self.turns():
+            by_model.setdefault(turn.model, []).append(turn)
+        summary = {}
+        for model, turns in by_model.items():
+            completed = [turn for turn in turns if turn.error is None]
+            model_summary = {
+                "turns": len(turns),
+                "errors": len(turns) - len(completed),
+                "tokens": sum(turn.tokens for turn in turns),
+                "chars": sum(turn.chars for turn in turns),
+                "bytes_received": sum(turn.bytes_received for turn in turns),
+                "cache_read_tokens": sum(turn.cache_read_tokens or 0 for turn in turns),
+                "cache_creation_tokens": sum(
+                    turn.cache_creation_tokens or 0 for turn in turns
+                ),
+            }
+            for name in self.LATENCIES:
+                values = sorted(
+                    value
+                    for value in (getattr(turn, name) for turn in completed)
+                    if value is not None
+                )
+                model_summary[name] = {
+                    f"p{round(quantile * 100)}": percentile(values, quantile)
+                    for quantile in self.QUANTILES
+                }
+                model_summary[name]["count"] = len(values)
+                model_summary[name]["sum"] = sum(values)
+            summary[model] = model_summary
+        return summary
+
+    def prometheus(self) -> str:
+        """Return the summary in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = []
+        for name in self.LATENCIES:
+            metric = (
+                f"tinychat_{name}"
+                if name == "tokens_per_second"
+                else f"tinychat_{name}_seconds"
+            )
+            lines.append(f"# TYPE {metric} summary")
+            for model, model_summary in summary.items():
+                label = model.replace("\\", "\\\\").replace('"', '\\"')
+                values = model_summary[name]
+                for quantile in self.QUANTILES:
+                    value = values[f"p{round(quantile * 100)}"]
+                    lines.append(
+                        f'{metric}{{model="{label}",quantile="{quantile}"}} {value}'
+                    )
+                lines.append(f'{metric}_sum{{model="{label}"}} {values["sum"]}')
+                lines.append(f'{metric}_count{{model="{label}"}} {values["count"]}')
+        for name in self.COUNTERS:
+            metric = f"tinychat_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for model, model_summary in summary.items():
+                label = model.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{metric}{{model="{label}"}} {model_summary[name]}')
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of the responses of all the handlers of the process
+turn_metrics = MetricsRecorder()
@@ -1,10 +1,13 @@
 import json
 from typing import Generator
 
-import requests
-from sseclient import SSEClient
-
-from tinychat.llms.base import BaseLLMClient
+from tinychat.llms.base import (
+    BaseLLMClient,
+    BaseLLMHandler,
+    encode_json_body,
+    RawJSON,
+)
+from tinychat.llms.streams import SSEStream
 from tinychat.settings import MISTRAL_API_KEY_NAME
 
 
@@ -13,6 +16,8 @@ class MistralClient(BaseLLMClient):
     Mistral chat client.
     """
 
+    PROVIDER = "mistral"
+
     MISTRAL_COMPLETION_API_URL = "https://api.mistral.ai/v1/chat/completions"
 
     def __init__(self, model_name: str, temperature: float) -> None:
@@ -20,71 +25,36 @@ class MistralClient(BaseLLMClient):
         self.model_name = model_name
         self.temperature = temperature
 
-    def perform_stream_request(self, messages: list[dict]) -> SSEClient:
+    @property
+    def api_url(self) -> str:
+        return self.MISTRAL_COMPLETION_API_URL
+
+    def perform_stream_request(self, messages: RawJSON) -> SSEStream:
         data = {
             "model": self.model_name,
             "messages": messages,
             "temperature": self.temperature,
             "stream": True,
         }
-        response = requests.post(
-            self.MISTRAL_COMPLETION_API_URL,
-            headers=self.default_headers(),  # type: ignore
-            json=data,
-            stream=True,
+        response = self.post_stream(
+            self.MISTRAL_COMPLETION_API_URL, self.default_headers(), encode_json_body(data)
         )
-        if response.status_code != 200:
-            raise ValueError(
-                f"Server responded with an error. Status Code: {response.status_code}"
-            )
-        return SSEClient(event_source=response)  # type: ignore
+        return SSEStream(response)
 
 
-class MistralHandler:
+class MistralHandler(BaseLLMHandler):
     """
     Handler class to interact with the Mistral models via API.
 
     Returns chat responses and stores the chat history.
-
-    TODO: add chat message dataclass so that we can enforce validation of
-    message format that is needed for working client requests to the API?
     """
 
     def __init__(self, model_name: str, temperature: float = 0.0):
-        self._messages = []
-        self._client = MistralClient(model_name, temperature)
-
-    def export_conversation(self) -> str:
-        string_conversation = ""
-        for message in self._messages:
-            if message["role"] == "user":
-                if string_conversation != "":
-                    string_conversation += "\n\n"
-                string_conversation += f"You: {message['content']}"
-            else:
-                string_conversation += f"LLM: {message['content']}"
-        return string_conversation
-
-    def stream_response(self, user_input: str) -> Generator[str, None, None]:
-        """
-        Yield stream responses from the client as they are received.
-
-        This method sends the user input to the client and then yields each piece
-        of the language model's response as it is received in real-time. After the
-        streaming is complete, it updates the message list with the user input and
-        the full language model response.
+        super().__init__(MistralClient(model_name, temperature))
 
-        :param user_input: The input string from the user to be sent to the model.
-        :return: A generator yielding the model's response in streamed parts.
-        """
-        self._messages.append({"role": "user", "content": user_input})
-        stream = self._client.perform_stream_request(self._messages)
-        lm_response = ""
-        for event in stream.events():  # type: ignore
-            if event.data != "[DONE]":
-                json_load = json.loads(event.data)["choices"][0]["delta"]
+    def iter_response_pieces(self, stream) -> Generator[str, None, None]:
+        for data in stream.events():
+            if data != "[DONE]":
+                json_load = json.loads(data)["choices"][0]["delta"]
                 if "content" in json_load.keys():
-                    response_piece = json_load["content"]
-                    lm_response += response_piece
-                    yield response_piece
-        self._messages.append({"role": "assistant", "content": lm_response})
+                    yield json_load["content"]
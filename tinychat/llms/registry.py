@@ -0,0 +1,64 @@
+"""
+Registry of the provider handlers, imported on first use.
+
+Importing a provider module imports requests and the HTTP machinery, so the
+handlers are looked up by name and imported only when a model of that
+provider is selected. This keeps the startup (and a headless Backend) light.
+
+Other packages can add models to the menu with entry points in the
+"tinychat.models" group, when MODEL_ENTRY_POINTS_ENABLED is set. The name of
+an entry point is the model name shown in the menu and its object is called
+with the temperature to create the handler, e.g. in pyproject.toml:
+
+    [project.entry-points."tinychat.models"]
+    "My Model" = "my_package.handlers:create_my_model_handler"
+"""
+
+import importlib
+import threading
+from typing import Callable
+
+from tinychat.settings import MODEL_ENTRY_POINTS_ENABLED
+
+# Handler class of each provider, as "module:class"
+PROVIDERS = {
+    "anthropic": "tinychat.llms.anthropic:AnthropicAIHandler",
+    "cohere": "tinychat.llms.cohere:CohereHandler",
+    "google": "tinychat.llms.google:GoogleAIHandler",
+    "mistral": "tinychat.llms.mistral:MistralHandler",
+    "openai": "tinychat.llms.openai:OpenAIHandler",
+    "together": "tinychat.llms.together:TogetherHandler",
+}
+
+MODEL_ENTRY_POINTS_GROUP = "tinychat.models"
+
+_handler_classes: dict[str, type] = {}
+_handler_classes_lock = threading.Lock()
+
+
+def handler_class(provider: str) -> type:
+    """Return the handler class of provider, importing its module on first use."""
+    with _handler_classes_lock:
+        cls = _handler_classes.get(provider)
+        if cls is None:
+            if provider not in PROVIDERS:
+                raise KeyError(f"Unknown provider {provider}")
+            module_name, _, class_name = PROVIDERS[provider].partition(":")
+            cls = getattr(importlib.import_module(module_name), class_name)
+            _handler_classes[provider] = cls
+        return cls
+
+
+def entry_point_models() -> dict[str, Callable]:
+    """
+    Return the handler factories of the models registered by entry points, by
+    model name. The entry points are loaded when called, not here.
+    """
+    if not MODEL_ENTRY_POINTS_ENABLED:
+        return {}
+    from importlib.metadata import entry_points
+
+    return {
+        entry_point.name: entry_point.load
+        for entry_point in entry_points(group=MODEL_ENTRY_POINTS_GROUP)
+    }
@@ -0,0 +1,217 @@
+"""
+Retries of the failed requests, circuit breakers and errors of the providers
+and of the requests.
+
+Transient errors (rate limits, overloaded or unavailable servers, dropped
+connections) are retried with jittered exponential backoff, or after the
+delay asked by the server with Retry-After. Each provider has a circuit
+breaker: after CIRCUIT_BREAKER_FAILURES failed requests in a row it opens
+and the requests to that provider fail fast, until a trial request goes
+through after CIRCUIT_BREAKER_RESET_TIMEOUT seconds.
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from tinychat.settings import (
+    CIRCUIT_BREAKER_FAILURES,
+    CIRCUIT_BREAKER_RESET_TIMEOUT,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+)
+
+# Statuses worth retrying: timeouts, conflicts, rate limits and server errors
+# (529 is Anthropic's "overloaded")
+RETRYABLE_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 529})
+
+
+class ProviderError(ValueError):
+    """
+    A provider answered a request with an error status.
+
+    :param message: The error message.
+    :param provider: The provider name, as in tinychat.llms.registry.
+    :param status: The HTTP status code (None if no response was received).
+    :param request_id: The id given to the request by the provider, if any.
+    :param retry_after: The seconds to wait before retrying asked by the
+        provider, if any.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        provider: str,
+        status: Optional[int] = None,
+        request_id: Optional[str] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+        self.request_id = request_id
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in RETRYABLE_STATUSES
+
+
+class CircuitOpenError(ProviderError):
+    """The circuit breaker of the provider is open, no request was sent."""
+
+
+class StreamTimeoutError(ProviderError):
+    """
+    A streamed response timed out, and its connection was closed.
+
+    :param phase: The timeout which fired: CONNECT, FIRST_TOKEN or IDLE.
+    :param elapsed: The seconds from the request to the timeout.
+    :param tokens: The tokens received before the timeout.
+    :param bytes_received: The bytes of the body received before the timeout.
+    """
+
+    CONNECT = "connect"
+    FIRST_TOKEN = "first token"
+    IDLE = "idle"
+
+    def __init__(
+        self,
+        message: str,
+        provider: str,
+        phase: str,
+        elapsed: float,
+        tokens: int = 0,
+        bytes_received: int = 0,
+    ) -> None:
+        super().__init__(message, provider)
+        self.phase = phase
+        self.elapsed = elapsed
+        self.tokens = tokens
+        self.bytes_received = bytes_received
+
+
+class RequestCancelled(Exception):
+    """The request was cancelled with Canceller.cancel()."""
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """
+    Return the seconds of a Retry-After header, given in seconds or as an HTTP
+    date, or None if missing or invalid.
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Seconds to wait before retrying for the attempt-th time (from 0), with
+    "full jitter": uniform up to an exponentially growing cap, so that the
+    clients failed together do not retry together.
+    """
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a provider.
+
+    Closed, it lets the requests through and counts the consecutive failures.
+    After `failures` of them it opens, and before_request() raises
+    CircuitOpenError for `reset_timeout` seconds. Then a single trial request
+    is let through (half open): its success closes the circuit, its failure
+    opens it again. A trial which ends otherwise (cancelled) is released with
+    release_trial(), and the next request is the trial.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        failures: int = CIRCUIT_BREAKER_FAILURES,
+        reset_timeout: float = CIRCUIT_BREAKER_RESET_TIMEOUT,
+    ) -> None:
+        self.provider = provider
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        # Number of the last trial request, to tell it from the next ones
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def before_request(self) -> Optional[int]:
+        """
+        Raise CircuitOpenError if the request must not be sent. Return the
+        number of the trial request if the circuit is half open, else None.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return None
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining <= 0 and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self._trials += 1
+                return self._trials
+        raise CircuitOpenError(
+            f"{self.provider} is failing, requests are paused. "
+            f"Try again in {max(remaining, 1):.0f}s.",
+            provider=self.provider,
+            retry_after=max(remaining, 0.0),
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._trial_in_flight or self.consecutive_failures >= self.failures:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self, trial: int) -> None:
+        """
+        End the trial request number trial without counting it as a success
+        or a failure. Does nothing if its outcome was recorded already.
+        """
+        with self._lock:
+            if self._trials == trial:
+                self._trial_in_flight = False
+
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(provider: str) -> CircuitBreaker:
+    """Return the circuit breaker of provider, shared by all its clients."""
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(provider)
+        if breaker is None:
+            breaker = _circuit_breakers[provider] = CircuitBreaker(provider)
+        return breaker
+
+
+def reset_circuit_breakers() -> None:
+    """Close all the circuits."""
+    with _circuit_breakers_lock:
+        _circuit_breakers.clear()
@@ -0,0 +1,153 @@
+import json
+import time
+from typing import TYPE_CHECKING, Generator, Iterable, Optional, Union
+
+if TYPE_CHECKING:
+    import requests
+
+ByteSource = Union["requests.Response", Iterable[bytes]]
+
+
+class ByteStream:
+    """
+    Base class for the decoders of streamed response bodies.
+
+    :param source: A streamed requests.Response or any iterable of bytes.
+    """
+
+    def __init__(self, source: ByteSource) -> None:
+        self._source = source
+        self.bytes_received = 0
+        # Arrival time (time.monotonic) of the first chunk of the body
+        self.first_chunk_at: Optional[float] = None
+
+    def iter_chunks(self) -> Iterable[bytes]:
+        iter_content = getattr(self._source, "iter_content", None)
+        if iter_content is not None:
+            # chunk_size=None yields data as soon as it is read from the socket
+            return iter_content(chunk_size=None)
+        return self._source  # type: ignore
+
+    def close(self) -> None:
+        close = getattr(self._source, "close", None)
+        if close is not None:
+            close()
+
+
+class SSEStream(ByteStream):
+    """
+    Incremental decoder for Server-Sent Events.
+
+    Works directly on the raw byte chunks read from the socket and yields the
+    data field of each event as a string. Events made of a single `data:` line,
+    which is what every provider sends for each token, are decoded without
+    splitting the event into lines. Other fields (event, id, retry) and comments
+    are skipped, as none of the handlers need them.
+
+    info: https://html.spec.whatwg.org/multipage/server-sent-events.html
+    """
+
+    def events(self) -> Generator[str, None, None]:
+        buffer = b""
+        pending_cr = False
+        for chunk in self.iter_chunks():
+            if not chunk:
+                continue
+            if not self.bytes_received:
+                self.first_chunk_at = time.monotonic()
+                if chunk[:3] == b"\xef\xbb\xbf":
+                    chunk = chunk[3:]
+            self.bytes_received += len(chunk)
+            if pending_cr and chunk[:1] == b"\n":
+                # second half of a \r\n line ending split across two chunks
+                chunk = chunk[1:]
+            if b"\r" in chunk:
+                pending_cr = chunk[-1:] == b"\r"
+                chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            else:
+                pending_cr = False
+            buffer = buffer + chunk if buffer else chunk
+            start = 0
+            while True:
+                end = buffer.find(b"\n\n", start)
+                if end == -1:
+                    break
+                data = self.decode_event(buffer[start:end])
+                start = end + 2
+                if data is not None:
+                    yield data
+            buffer = buffer[start:]
+        # An event not terminated by a blank line is discarded, as per spec.
+
+    @staticmethod
+    def decode_event(block: bytes) -> Optional[str]:
+        """Return the data field of an event block or None if there is none."""
+        if block[:5] == b"data:" and b"\n" not in block:
+            value = block[6:] if block[5:6] == b" " else block[5:]
+            return value.decode("utf-8")
+        data_lines = []
+        for line in block.split(b"\n"):
+            if line[:5] != b"data:" and line != b"data":
+                continue
+            value = line[5:]
+            if value[:1] == b" ":
+                value = value[1:]
+            data_lines.append(value)
+        if not data_lines:
+            return None
+        return b"\n".join(data_lines).decode("utf-8")
+
+
+class NDJSONStream(ByteStream):
+    """
+    Incremental decoder for newline delimited JSON streams.
+
+    Byte chunks are split on newlines, so events spanning a chunk boundary are
+    put back together instead of being dropped. The unterminated tail of a
+    chunk is kept as a list of pieces and joined only once its line is
+    complete, so every byte is copied at most once. Each decoded event is
+    yielded as a dict, and its arrival time (time.monotonic) is recorded in
+    event_times.
+    """
+
+    def __init__(self, source: ByteSource) -> None:
+        super().__init__(source)
+        self.event_times: list[float] = []
+
+    def events(self) -> Generator[dict, None, None]:
+        decode = json.JSONDecoder().decode
+        monotonic = time.monotonic
+        event_times = self.event_times
+        pending: list[bytes] = []
+        for chunk in self.iter_chunks():
+            if not chunk:
+                continue
+            if not self.bytes_received:
+                self.first_chunk_at = monotonic()
+            self.bytes_received += len(chunk)
+            end = chunk.find(b"\n")
+            if end > 1 and end == len(chunk) - 1 and not pending:
+                # Fast path: the chunk is exactly one event, as flushed by the server
+                event_times.append(monotonic())
+                yield decode(chunk.decode("utf-8"))
+                continue
+            start = 0
+            while end != -1:
+                if pending:
+                    pending.append(chunk[start:end])
+                    line = b"".join(pending)
+                    pending = []
+                else:
+                    line = chunk[start:end]
+                if line and not line.isspace():
+                    event_times.append(monotonic())
+                    yield decode(line.decode("utf-8"))
+                start = end + 1
+                end = chunk.find(b"\n", start)
+            if start < len(chunk):
+                pending.append(chunk[start:] if start else chunk)
+        # The last event may not be followed by a newline
+        line = b"".join(pending)
+        if line and not line.isspace():
+            event_times.append(monotonic())
+            yield decode(line.decode("utf-8"))
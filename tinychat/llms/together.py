@@ -1,10 +1,13 @@
 import json
 from typing import Generator
 
-import requests
-from sseclient import SSEClient
-
-from tinychat.llms.base import BaseLLMClient
+from tinychat.llms.base import (
+    BaseLLMClient,
+    BaseLLMHandler,
+    encode_json_body,
+    RawJSON,
+)
+from tinychat.llms.streams import SSEStream
 from tinychat.settings import TOGETHER_API_KEY_NAME
 
 
@@ -16,6 +19,8 @@ class TogetherClient(BaseLLMClient):
     :param model_name: The name of the model to be used for chat requests.
     """
 
+    PROVIDER = "together"
+
     TOGHETER_COMPLETION_API_URL = "https://api.together.xyz/v1/chat/completions"
 
     def __init__(self, model_name: str, temperature: float) -> None:
@@ -23,7 +28,11 @@ class TogetherClient(BaseLLMClient):
         self.model_name = model_name
         self.temperature = temperature
 
-    def perform_stream_request(self, messages: list[dict]) -> SSEClient:
+    @property
+    def api_url(self) -> str:
+        return self.TOGHETER_COMPLETION_API_URL
+
+    def perform_stream_request(self, messages: RawJSON) -> SSEStream:
         # info: https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events
         data = {
             "model": self.model_name,
@@ -31,20 +40,13 @@ class TogetherClient(BaseLLMClient):
             "temperature": self.temperature,
             "stream": True,
         }
-        response = requests.post(
-            self.TOGHETER_COMPLETION_API_URL,
-            headers=self.default_headers(),  # type: ignore
-            json=data,
-            stream=True,
+        response = self.post_stream(
+            self.TOGHETER_COMPLETION_API_URL, self.default_headers(), encode_json_body(data)
         )
-        if response.status_code != 200:
-            raise ValueError(
-                f"Server responded with an error. Status Code: {response.status_code}"
-            )
-        return SSEClient(event_source=response)  # type: ignore
+        return SSEStream(response)
 
 
-class TogetherHandler:
+class TogetherHandler(BaseLLMHandler):
     """
     Handler class to interact with the Together models.
 
@@ -52,40 +54,11 @@ class TogetherHandler:
     """
 
     def __init__(self, model_name: str, temperature: float = 0.0):
-        self._messages = []
-        self._client = TogetherClient(model_name, temperature)
-    
-    def export_conversation(self) -> str:
-        string_conversation = ""
-        for message in self._messages:
-            if message["role"] == "user":
-                if string_conversation != "":
-                    string_conversation += "\n\n"
-                string_conversation += f"You: {message['content']}"
-            else:
-                string_conversation += f"LLM: {message['content']}"
-        return string_conversation
-
-    def stream_response(self, user_input: str) -> Generator[str, None, None]:
-        """
-        Yield stream responses from the client as they are received.
-
-        This method sends the user input to the client and then yields each piece
-        of the language model's response as it is received in real-time. After the
-        streaming is complete, it updates the message list with the user input and
-        the full language model response.
+        super().__init__(TogetherClient(model_name, temperature))
 
-        :param user_input: The input string from the user to be sent to the model.
-        :return: A generator yielding the model's response in streamed parts.
-        """
-        self._messages.append({"role": "user", "content": user_input})
-        stream = self._client.perform_stream_request(self._messages)
-        lm_response = ""
-        for event in stream.events():  # type: ignore
-            if event.data != "[DONE]":
-                json_load = json.loads(event.data)["choices"][0]["delta"]
+    def iter_response_pieces(self, stream) -> Generator[str, None, None]:
+        for data in stream.events():
+            if data != "[DONE]":
+                json_load = json.loads(data)["choices"][0]["delta"]
                 if "content" in json_load.keys():
-                    response_piece = json_load["content"]
-                    lm_response += response_piece
-                    yield response_piece
-        self._messages.append({"role": "assistant", "content": lm_response})
+                    yield json_load["content"]
@@ -20,6 +20,108 @@ MISTRAL_API_KEY_NAME = "MISTRAL_API_KEY"
 OPENAI_API_KEY_NAME = "OPENAI_API_KEY"
 TOGETHER_API_KEY_NAME = "TOGETHER_API_KEY"
 
+# Optional system prompt sent to the Anthropic models (cached by the API)
+ANTHROPIC_SYSTEM_PROMPT_NAME = "ANTHROPIC_SYSTEM_PROMPT"
+
+# Tokens of the context window left for the response when trimming the history
+RESPONSE_TOKENS_RESERVE = 4096
+
+# HTTP connection pool shared by all the LLM clients.
+# Number of hosts to keep a pool for, and keep-alive connections kept per host
+# (raised to the streams of the gateway while serving it).
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = 10
+# Pooled connections left idle longer than this (seconds) are dropped
+HTTP_POOL_IDLE_TIMEOUT = 60.0
+
+# Retries of the requests failed with a transient error (rate limits, server
+# errors, dropped connections), after a jittered exponential backoff (seconds)
+# or after the Retry-After asked by the provider
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 8.0
+# Longest Retry-After waited for, the request fails at once if asked for more
+HTTP_RETRY_AFTER_MAX = 30.0
+# Failed requests in a row after which the requests to a provider fail fast,
+# and seconds before a trial request is let through again
+CIRCUIT_BREAKER_FAILURES = 5
+CIRCUIT_BREAKER_RESET_TIMEOUT = 30.0
+# Timeouts of the streamed responses (seconds): to open a connection, without
+# receiving any byte (before the headers or between two chunks of the body),
+# and from the request to the first token of the response
+HTTP_CONNECT_TIMEOUT = 10.0
+STREAM_IDLE_TIMEOUT = 60.0
+FIRST_TOKEN_TIMEOUT = 120.0
+
+# Number of responses whose latency and throughput metrics are kept in memory
+METRICS_RING_SIZE = 1000
+
+# Max number of models streaming at the same time when comparing models
+FANOUT_MAX_WORKERS = 4
+
+# Max number of connections opened ahead of the first requests at a time
+PREWARM_MAX_WORKERS = 2
+
+# Max number of prompts waiting to be sent while a response is streamed
+PROMPT_QUEUE_MAXSIZE = 8
+
+# Headless batch runs (python -m tinychat batch): requests streaming at the same
+# time to each provider, and prompts read ahead of the running ones
+BATCH_CONCURRENCY = 4
+BATCH_MAX_PENDING = 64
+
+# OpenAI-compatible gateway to the models (python -m tinychat serve), for the
+# other tools of this machine. If GATEWAY_API_KEY is set, the clients must send
+# it as bearer token. The requests of web pages (with an Origin header, another
+# Host or a body other than JSON) are refused, see tinychat.gateway.
+# Each upstream stream runs on one of GATEWAY_MAX_STREAMS
+# threads, the client connections are served by a single asyncio loop.
+GATEWAY_HOST = "127.0.0.1"
+GATEWAY_PORT = 8080
+GATEWAY_API_KEY = ""
+GATEWAY_MAX_STREAMS = 256
+GATEWAY_MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# Race mode: if the selected model sends no token within RACE_DEADLINE seconds,
+# the turn is sent to this backup model as well, and the first to answer wins.
+# Empty to disable, see Backend.set_race_model
+RACE_BACKUP_MODEL = ""
+RACE_DEADLINE = 2.0
+
+# Opt-in persistent cache of the responses, replayed for identical requests
+# (same model, parameters and history). Useful for prompts at temperature 0.
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_FILE_PATH = "tinychat_cache.sqlite3"
+# Size of the cached responses (bytes) above which the least recently used go
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Cached responses older than this (seconds) are not used
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
+# Replay the cached responses at the pace they were received
+RESPONSE_CACHE_REALTIME = False
+
+# Add the models registered by other packages in the "tinychat.models" entry
+# points group to the menu (see tinychat/llms/registry.py)
+MODEL_ENTRY_POINTS_ENABLED = False
+
+# Archive of all the conversations, searchable from the History sidebar
+ARCHIVE_ENABLED = True
+ARCHIVE_FILE_PATH = "tinychat_archive.sqlite3"
+# Messages are written in one transaction per batch, at most every interval (s)
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_FLUSH_INTERVAL = 0.5
+# Conversations and messages loaded at a time by the sidebar
+ARCHIVE_PAGE_SIZE = 50
+
+# Conversations open at a time, see Backend.switch_session. Past this many
+# characters of history in memory, the least recently used are moved to the file
+# (by default, "", a temporary file of the process deleted when it exits)
+SESSIONS_FILE_PATH = ""
+SESSIONS_MAX_RESIDENT_CHARS = 2_000_000
+
+# Characters of the newest turns kept in the chat display (a few screens),
+# older turns are paged back in when scrolling to the top
+CHAT_DISPLAY_WINDOW_CHARS = 50_000
+
 
 import os, sys
 
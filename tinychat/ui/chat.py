@@ -1,13 +1,21 @@
+import functools
 import os
+import queue
 import threading
+from concurrent.futures import as_completed
 import tkinter as tk
-from tkinter import PhotoImage
+from tkinter import PhotoImage, filedialog
 
 import customtkinter as ctk
 
+from tinychat.llms.retry import RequestCancelled
 from tinychat.settings import FONT_FAMILY, MAIN_WINDOW_RESOLUTION, MAIN_WINDOW_TITLE
+from tinychat.settings import PROMPT_QUEUE_MAXSIZE
 from tinychat.settings import get_icon_path
-from tinychat.ui.frames import SettingsFrame
+from tinychat.ui.frames import HistoryFrame, ModelPane, SettingsFrame
+from tinychat.ui.renderer import StreamRenderer
+from tinychat.ui.transcript import format_messages
+from tinychat.ui.worker import PromptWorker
 
 
 class ChatApp(ctk.CTk):
@@ -17,7 +25,7 @@ class ChatApp(ctk.CTk):
         self.model_name = ""
 
         # Initialize font object to use with the chat text areas
-        chat_font = ctk.CTkFont(family=FONT_FAMILY, size=14)
+        self.chat_font = chat_font = ctk.CTkFont(family=FONT_FAMILY, size=14)
 
         # Initialize the backend object
         self.backend = backend
@@ -31,12 +39,33 @@ class ChatApp(ctk.CTk):
             self,
             available_models=backend.available_models(),
             on_model_select_callback=self.on_model_selection,
+            on_chat_select_callback=self.on_chat_selection,
             on_reset_callback=self.on_reset_callback,
+            on_close_chat_callback=self.on_close_chat_callback,
             on_export_callback=self.on_export_callback,
+            on_compare_callback=self.on_compare_selection,
+            on_history_callback=self.on_history_callback,
+            on_settings_saved_callback=self.backend.reload_settings,
             corner_radius=0,
             fg_color="transparent",
         )
         self.settings_frame.grid(row=0, column=0, rowspan=1, sticky="nsew")
+        if backend.archive is None:
+            self.settings_frame.history_button.grid_remove()
+
+        # Sidebar with the archived conversations, hidden until asked for
+        self.history_frame = None
+        if backend.archive is not None:
+            self.history_frame = HistoryFrame(
+                self,
+                archive=backend.archive,
+                on_show_messages_callback=self.show_archived_messages,
+                width=300,
+            )
+        # Whether the chat display shows an archived conversation
+        self.showing_archive = False
+        # Session id of each entry of the open chats menu
+        self.chats: dict[str, str] = {}
 
         # Create a progress bar to enable when getting data from the LLMs
         self.progress_bar = ctk.CTkProgressBar(
@@ -53,6 +82,22 @@ class ChatApp(ctk.CTk):
         )
         self.chat_display.grid(row=2, column=0, padx=20, pady=(10, 10), sticky="nsew")
 
+        # Render the text streamed by the LLMs once per frame
+        self.renderer = StreamRenderer(self, self.chat_display, load_turn=self.load_turn)
+        self.renderer.start()
+
+        # Sends the prompts one at a time, the next ones wait in its queue
+        self.prompt_worker = PromptWorker(
+            self.get_response,
+            maxsize=PROMPT_QUEUE_MAXSIZE,
+            on_idle=lambda: self.set_responding(False),
+        )
+        self.responding = False
+
+        # Side by side panes replacing the chat display when comparing models
+        self.panes_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.model_panes: dict[str, ModelPane] = {}
+
         # Create a smaller text area for typing messages
         self.message_input = ctk.CTkTextbox(
             self, font=chat_font, wrap="word", border_spacing=5
@@ -86,6 +131,9 @@ class ChatApp(ctk.CTk):
         self.bind("<Control-Return>", self.on_control_enter)
         self.bind("<Shift-Return>", self.on_control_enter)
 
+        # Bind Escape to stop the responses being streamed
+        self.bind("<Escape>", lambda event: self.on_stop_button())
+
     def set_icon(self):
         if os.name == "nt":
             self.iconbitmap(default=get_icon_path())
@@ -106,14 +154,54 @@ class ChatApp(ctk.CTk):
     def on_enter(self, event) -> None:
         if self.message_input.get("1.0", tk.END).isspace():
             return
-        self.send_message_thread()
+        self.queue_message()
 
     def on_send_button(self) -> None:
         if self.message_input.get("1.0", tk.END).isspace():
             return
-        self.send_message_thread()
+        self.queue_message()
+
+    def on_stop_button(self) -> None:
+        # The queued prompts are not sent, they go back to the input box
+        dropped = self.prompt_worker.clear()
+        if dropped:
+            self.message_input.insert(
+                "1.0", "\n\n".join(prompt.strip() for prompt in dropped) + "\n\n"
+            )
+        self.backend.cancel()
+        self.show_queued_prompts()
+
+    def set_responding(self, responding: bool) -> None:
+        # Called from the prompt worker thread, the widgets are updated by the
+        # Tk loop
+        self.after(0, self.show_responding, responding)
+
+    def show_responding(self, responding: bool) -> None:
+        # While responding, the send button stops the responses
+        self.responding = responding
+        if responding:
+            self.show_queued_prompts()
+            self.send_button.configure(command=self.on_stop_button)
+        else:
+            self.send_button.configure(
+                text="Get Response", command=self.on_send_button
+            )
+            # A new chat gets its title with its first prompt
+            self.show_open_chats()
+        self.toggle_progress_bar(responding)
+
+    def show_queued_prompts(self) -> None:
+        if not self.responding:
+            return
+        queued = self.prompt_worker.queued
+        text = f"Stop ({queued} queued)" if queued else "Stop"
+        self.send_button.configure(text=text)
 
     def on_model_selection(self, model_name) -> None:
+        # The response being streamed is stopped, and kept in the chat left
+        self.prompt_worker.clear()
+        self.backend.cancel()
+        self.on_compare_selection([])
         try:
             self.model_name = model_name
             self.backend.set_model(model_name=model_name)
@@ -121,18 +209,158 @@ class ChatApp(ctk.CTk):
             self.update_chat_display(message=f"\n{e}")
         else:
             self.clear_chat()
+            self.show_open_chats()
+
+    def on_chat_selection(self, label) -> None:
+        session_id = self.chats.get(label)
+        if session_id is None:
+            return
+        # The response being streamed is stopped, and kept in the chat left
+        self.prompt_worker.clear()
+        self.backend.cancel()
+        self.on_compare_selection([])
+        try:
+            self.model_name = self.backend.switch_session(session_id)
+        except (KeyError, ValueError) as e:
+            self.update_chat_display(message=f"\n{e}")
+            # A chat whose history was lost is dropped
+            self.show_open_chats()
+            return
+        self.showing_archive = False
+        self.settings_frame.model_selection_menu.set(self.model_name)
+        self.clear_chat()
+        self.show_messages(self.backend.messages(), ("chat", session_id))
+        self.show_open_chats()
+
+    def show_open_chats(self) -> None:
+        self.chats = {
+            f"{index}. {title or 'New Chat'} ({model_name})": session_id
+            for index, (session_id, model_name, title) in enumerate(
+                self.backend.open_sessions(), start=1
+            )
+        }
+        self.settings_frame.chat_selection_menu.configure(values=list(self.chats))
+        self.settings_frame.chat_selection_menu.set("Open Chats")
+
+    def on_compare_selection(self, model_names) -> None:
+        try:
+            self.backend.set_fanout_models(model_names)
+        except (KeyError, ValueError) as e:
+            self.update_chat_display(message=f"\n{e}")
+            return
+        self.show_model_panes(self.backend.fanout_models())
+
+    def show_model_panes(self, model_names) -> None:
+        for pane in self.model_panes.values():
+            pane.destroy()
+        self.model_panes = {}
+        if not model_names:
+            self.panes_frame.grid_remove()
+            self.chat_display.grid()
+            return
+        self.chat_display.grid_remove()
+        self.panes_frame.grid(row=2, column=0, padx=20, pady=(10, 10), sticky="nsew")
+        self.panes_frame.grid_rowconfigure(0, weight=1)
+        for column, model_name in enumerate(model_names):
+            pane = ModelPane(
+                self.panes_frame,
+                model_name,
+                self.chat_font,
+                load_turn=functools.partial(self.load_fanout_turn, model_name),
+                fg_color="transparent",
+            )
+            padx = (0, 0) if column == 0 else (10, 0)
+            pane.grid(row=0, column=column, padx=padx, sticky="nsew")
+            self.panes_frame.grid_columnconfigure(column, weight=1, uniform="panes")
+            self.model_panes[model_name] = pane
 
     def on_reset_callback(self) -> None:
+        # The queued prompts, and the response being streamed, belong to the
+        # conversation left
+        self.prompt_worker.clear()
+        self.backend.cancel()
+        self.show_queued_prompts()
+        if self.model_panes:
+            self.on_compare_selection(list(self.model_panes))
+            return
         self.clear_chat()
-        self.backend.set_model(model_name=self.model_name)
+        self.backend.new_chat()
+        self.show_open_chats()
+
+    def on_close_chat_callback(self) -> None:
+        session_id = self.backend.session_id()
+        if session_id is None:
+            return
+        self.prompt_worker.clear()
+        self.backend.cancel()
+        self.show_queued_prompts()
+        self.on_compare_selection([])
+        # Replaced by a new chat with the same model
+        self.backend.close_session(session_id)
+        self.showing_archive = False
+        self.clear_chat()
+        self.show_open_chats()
+
+    def on_history_callback(self) -> None:
+        if self.history_frame is None:
+            return
+        if self.history_frame.winfo_ismapped():
+            self.history_frame.grid_remove()
+            return
+        self.history_frame.grid(row=1, column=1, rowspan=4, padx=(0, 20), sticky="nsew")
+        self.history_frame.refresh()
+
+    def show_archived_messages(self, conversation_id, title, messages, offset) -> None:
+        if not offset:
+            self.on_compare_selection([])
+            self.clear_chat()
+            self.update_chat_display(f"[Archived conversation: {title}]\n\n")
+            self.renderer.end_turn()
+        self.showing_archive = True
+        self.show_messages(
+            [(message["role"], message["content"]) for message in messages],
+            ("archive", conversation_id),
+            offset,
+        )
+
+    def show_messages(self, messages, history, offset=0) -> None:
+        """
+        Show messages, from offset in history: ("chat", session_id) or
+        ("archive", conversation_id), where they are read back once hidden.
+        """
+        for index, message in enumerate(messages, offset):
+            self.update_chat_display(format_messages([message]))
+            self.renderer.end_turn((*history, index, index + 1))
+
+    def load_turn(self, source) -> str:
+        """The text of a turn hidden from the chat display, see show_messages."""
+        kind, history_id, start, stop = source
+        if kind == "archive":
+            messages = self.backend.archive.load_messages(
+                history_id, start, stop - start
+            )
+            return format_messages(
+                (message["role"], message["content"]) for message in messages
+            )
+        if history_id != self.backend.session_id():
+            # Closed after the chat was left
+            return ""
+        return format_messages(self.backend.messages(start, stop))
 
     def on_export_callback(self) -> None:
-        threading.Thread(target=self.backend.export_conversation, daemon=True).start()
+        new_file = filedialog.asksaveasfilename(
+            initialfile="Untitled.txt",
+            defaultextension=".txt",
+            filetypes=[("Text File", "*.txt")],
+        )
+        if not new_file:
+            return
+        threading.Thread(
+            target=self.backend.export_conversation, args=(new_file,), daemon=True
+        ).start()
 
     def clear_chat(self):
-        self.chat_display.configure(state="normal")
-        self.chat_display.delete("1.0", tk.END)
-        self.chat_display.configure(state="disabled")
+        self.renderer.clear()
 
     def toggle_progress_bar(self, start: bool):
         if start:
@@ -141,31 +369,94 @@ class ChatApp(ctk.CTk):
             self.progress_bar.stop()
             self.progress_bar.set(1.0)
 
-    def send_message_thread(self) -> None:
-        threading.Thread(target=self.get_response, daemon=True).start()
-
-    def get_response(self) -> None:
-        self.toggle_progress_bar(True)
-        self.send_button.configure(state="disabled")
+    def queue_message(self) -> None:
+        """
+        Queue the prompt of the input box. It is sent once the responses to
+        the prompts before it are complete.
+        """
+        if self.showing_archive:
+            # Archived conversations are read only, continue with a new chat
+            self.showing_archive = False
+            self.on_reset_callback()
         user_input = self.message_input.get("1.0", tk.END)
-        self.update_chat_display(f"You: {user_input.strip()}")
+        try:
+            self.prompt_worker.submit(user_input)
+        except queue.Full:
+            # Kept in the input box, the button shows the queue is full
+            return
         self.message_input.delete("1.0", tk.END)
+        self.show_queued_prompts()
+
+    def get_response(self, user_input: str) -> None:
+        if self.model_panes:
+            self.get_fanout_responses(user_input)
+            return
+        self.set_responding(True)
+        session_id = self.backend.session_id()
+        start = self.backend.message_count()
+        self.update_chat_display(f"You: {user_input.strip()}")
         try:
             stream_generator = self.backend.get_stream_response(user_input)
             self.update_chat_display(f"\n\n\nLLM: ")
             for data in stream_generator:
                 self.update_chat_display(data)
+            winner = self.backend.race_winner
+            if winner is not None and winner != self.model_name:
+                self.update_chat_display(f"\n\n[Answered by {winner}]")
+            trimmed = self.backend.trimmed_messages()
+            if trimmed:
+                self.update_chat_display(
+                    f"\n\n[{trimmed} earlier messages were not sent to fit the context window]"
+                )
+        except RequestCancelled:
+            self.update_chat_display("\n\n[Stopped]")
         except Exception as e:
             self.update_chat_display(f"\n\nError: {e}")
         self.update_chat_display("\n\n\n")
-        self.send_button.configure(state="normal")
-        self.toggle_progress_bar(False)
+        self.renderer.end_turn(self.turn_source(session_id, start))
+
+    def turn_source(self, session_id, start):
+        """
+        The source of the turn of the messages of the session session_id from
+        start on, or None if it added none (the text of the turn is kept).
+        """
+        if session_id is None or session_id != self.backend.session_id():
+            return None
+        stop = self.backend.message_count()
+        return ("chat", session_id, start, stop) if stop > start else None
+
+    def get_fanout_responses(self, user_input: str) -> None:
+        self.set_responding(True)
+        panes = dict(self.model_panes)
+        starts = {name: self.backend.message_count(name) for name in panes}
+        for pane in panes.values():
+            pane.push(f"You: {user_input.strip()}\n\n\nLLM: ")
+        futures = self.backend.get_fanout_responses(
+            user_input, lambda model_name, piece: panes[model_name].push(piece)
+        )
+        model_names = {future: model_name for model_name, future in futures.items()}
+        for future in as_completed(futures.values()):
+            model_name = model_names[future]
+            pane = panes[model_name]
+            try:
+                pane.show_metrics(future.result())
+            except RequestCancelled:
+                pane.push("\n\n[Stopped]")
+            except Exception as e:
+                pane.push(f"\n\nError: {e}")
+            pane.push("\n\n\n")
+            start = starts[model_name]
+            stop = self.backend.message_count(model_name)
+            pane.end_turn((start, stop) if stop > start else None)
+
+    def load_fanout_turn(self, model_name, source) -> str:
+        """The text of a turn hidden from the pane of model_name."""
+        start, stop = source
+        return format_messages(self.backend.messages(start, stop, model_name))
 
     def update_chat_display(self, message) -> None:
-        self.chat_display.configure(state="normal")
-        self.chat_display.insert(tk.END, f"{message}")
-        self.chat_display.configure(state="disabled")
-        self.chat_display.yview(tk.END)
+        # Safe to call from worker threads, the text is written by the renderer
+        self.renderer.push(f"{message}")
 
     def run(self) -> None:
         # start w/ fullscreen https://github.com/TomSchimansky/CustomTkinter/discussions/1500
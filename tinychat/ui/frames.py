@@ -1,8 +1,10 @@
 import customtkinter as ctk
 
-from tinychat.utils.secrets import get_secret, set_secret
+from tinychat.ui.renderer import StreamRenderer
+from tinychat.utils.secrets import get_secret, set_secrets
 from tinychat.settings import (
     ANTHROPIC_API_KEY_NAME,
+    ARCHIVE_PAGE_SIZE,
     COHERE_API_KEY_NAME,
     GOOGLE_API_KEY_NAME,
     MISTRAL_API_KEY_NAME,
@@ -21,13 +23,21 @@ class SettingsFrame(ctk.CTkFrame):
         parent,
         available_models,
         on_model_select_callback,
+        on_chat_select_callback,
         on_reset_callback,
+        on_close_chat_callback,
         on_export_callback,
+        on_compare_callback,
+        on_history_callback,
+        on_settings_saved_callback,
         *args,
         **kwargs
     ):
         super().__init__(parent, *args, **kwargs)
-        self.grid_columnconfigure(2, weight=1)
+        self.grid_columnconfigure(3, weight=1)
+        self.available_models = available_models
+        self.on_compare_callback = on_compare_callback
+        self.on_settings_saved_callback = on_settings_saved_callback
 
         # Create model selection menu
         self.model_selection_menu = ctk.CTkOptionMenu(
@@ -42,6 +52,20 @@ class SettingsFrame(ctk.CTkFrame):
             row=0, column=0, padx=(20, 0), pady=(10, 5), sticky="w"
         )
 
+        # Create the menu of the open chats, to switch between them
+        self.chat_selection_menu = ctk.CTkOptionMenu(
+            self,
+            values=[],
+            command=on_chat_select_callback,
+            font=ctk.CTkFont(family="Arial", size=13, weight="bold"),
+            dropdown_font=ctk.CTkFont(family="Arial", size=13, weight="bold"),
+            fg_color=("#0C955A", "#106A43"),
+        )
+        self.chat_selection_menu.set("Open Chats")
+        self.chat_selection_menu.grid(
+            row=0, column=1, padx=(10, 0), pady=(10, 5), sticky="w"
+        )
+
         # Create settings button
         self.settings_button = ctk.CTkButton(
             self,
@@ -52,7 +76,7 @@ class SettingsFrame(ctk.CTkFrame):
             hover_color="#2c6e49",
         )
         self.settings_button.grid(
-            row=0, column=1, padx=(10, 20), pady=(10, 5), sticky="e"
+            row=0, column=2, padx=(10, 20), pady=(10, 5), sticky="e"
         )
 
         # Create the new_chat button
@@ -64,7 +88,33 @@ class SettingsFrame(ctk.CTkFrame):
             fg_color=("#0C955A", "#106A43"),
             hover_color="#2c6e49",
         )
-        self.reset_button.grid(row=0, column=2, padx=(10, 0), pady=(10, 5), sticky="e")
+        self.reset_button.grid(row=0, column=3, padx=(10, 0), pady=(10, 5), sticky="e")
+
+        # Create the close chat button, dropping the chat from the open ones
+        self.close_chat_button = ctk.CTkButton(
+            self,
+            text="Close Chat",
+            command=on_close_chat_callback,
+            font=ctk.CTkFont(family="Arial", size=13, weight="bold"),
+            fg_color=("#0C955A", "#106A43"),
+            hover_color="#2c6e49",
+        )
+        self.close_chat_button.grid(
+            row=0, column=4, padx=(10, 0), pady=(10, 5), sticky="e"
+        )
+
+        # Create the compare models button
+        self.compare_button = ctk.CTkButton(
+            self,
+            text="Compare Models",
+            command=self.open_compare_window,
+            font=ctk.CTkFont(family="Arial", size=13, weight="bold"),
+            fg_color=("#0C955A", "#106A43"),
+            hover_color="#2c6e49",
+        )
+        self.compare_button.grid(
+            row=0, column=5, padx=(10, 0), pady=(10, 5), sticky="e"
+        )
 
         # Create the export chat button
         self.export_button = ctk.CTkButton(
@@ -76,9 +126,51 @@ class SettingsFrame(ctk.CTkFrame):
             hover_color="#2c6e49",
         )
         self.export_button.grid(
-            row=0, column=3, padx=(10, 20), pady=(10, 5), sticky="e"
+            row=0, column=6, padx=(10, 0), pady=(10, 5), sticky="e"
         )
 
+        # Create the history sidebar button
+        self.history_button = ctk.CTkButton(
+            self,
+            text="History",
+            command=on_history_callback,
+            font=ctk.CTkFont(family="Arial", size=13, weight="bold"),
+            fg_color=("#0C955A", "#106A43"),
+            hover_color="#2c6e49",
+        )
+        self.history_button.grid(
+            row=0, column=7, padx=(10, 20), pady=(10, 5), sticky="e"
+        )
+
+    def open_compare_window(self):
+        """
+        Open a window to choose the models answering side by side.
+        """
+        compare_window = ctk.CTkToplevel(self)
+        compare_window.title("TinyChat - Compare Models")
+        compare_window.transient(self)  # type:ignore - Set to be on top of the main window
+
+        checkboxes = {}
+        # The first entry of the menu is the "Language Model " placeholder
+        for row, model_name in enumerate(self.available_models[1:]):
+            checkbox = ctk.CTkCheckBox(compare_window, text=model_name)
+            checkbox.grid(row=row, column=0, padx=20, pady=(10, 0), sticky="w")
+            checkboxes[model_name] = checkbox
+
+        def on_compare():
+            selected = [name for name, box in checkboxes.items() if box.get()]
+            compare_window.destroy()
+            self.on_compare_callback(selected)
+
+        compare = ctk.CTkButton(
+            compare_window,
+            text="Compare",
+            command=on_compare,
+            fg_color=("#0C955A", "#106A43"),
+            hover_color="#2c6e49",
+        )
+        compare.grid(row=len(checkboxes), column=0, padx=20, pady=20, sticky="w")
+
     def open_settings_window(self):
         """
         Open settings window where API keys can be configured.
@@ -196,11 +288,200 @@ class SettingsFrame(ctk.CTkFrame):
         self.temperature_slider_label.configure(text=f"Temperature: {str(temperature)}")
 
     def save_settings(self):
-        set_secret(OPENAI_API_KEY_NAME, self.api_key_entry_1.get())
-        set_secret(MISTRAL_API_KEY_NAME, self.api_key_entry_2.get())
-        set_secret(COHERE_API_KEY_NAME, self.api_key_entry_3.get())
-        set_secret(GOOGLE_API_KEY_NAME, self.api_key_entry_4.get())
-        set_secret(ANTHROPIC_API_KEY_NAME, self.api_key_entry_5.get())
-        set_secret(TOGETHER_API_KEY_NAME, self.api_key_entry_6.get())
-        set_secret("temperature", self.temperature_slider.get() / 10)
+        set_secrets(
+            {
+                OPENAI_API_KEY_NAME: self.api_key_entry_1.get(),
+                MISTRAL_API_KEY_NAME: self.api_key_entry_2.get(),
+                COHERE_API_KEY_NAME: self.api_key_entry_3.get(),
+                GOOGLE_API_KEY_NAME: self.api_key_entry_4.get(),
+                ANTHROPIC_API_KEY_NAME: self.api_key_entry_5.get(),
+                TOGETHER_API_KEY_NAME: self.api_key_entry_6.get(),
+                "temperature": self.temperature_slider.get() / 10,
+            }
+        )
+        self.on_settings_saved_callback()
         self.status_label.configure(text="Saved.")
+
+
+class ModelPane(ctk.CTkFrame):
+    """
+    Displays the responses of one of the models compared side by side, with
+    the latency and throughput of its last response.
+    """
+
+    def __init__(self, parent, model_name, font, load_turn=None, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.model_name = model_name
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.header = ctk.CTkLabel(
+            self,
+            text=model_name,
+            font=ctk.CTkFont(family="Arial", size=13, weight="bold"),
+            anchor="w",
+        )
+        self.header.grid(row=0, column=0, padx=5, pady=(0, 5), sticky="ew")
+
+        self.display = ctk.CTkTextbox(
+            self, state="disabled", font=font, wrap="word", border_spacing=5
+        )
+        self.display.grid(row=1, column=0, sticky="nsew")
+
+        self.renderer = StreamRenderer(self, self.display, load_turn=load_turn)
+        self.renderer.start()
+
+    def push(self, text):
+        """Append text to the pane. Thread-safe."""
+        self.renderer.push(text)
+
+    def end_turn(self, source=None):
+        """Close the turn of the text pushed so far. Thread-safe."""
+        self.renderer.end_turn(source)
+
+    def destroy(self):
+        self.renderer.stop()
+        super().destroy()
+
+    def show_metrics(self, metrics):
+        """Show the metrics of the last response in the header. Thread-safe."""
+        text = self.model_name
+        if metrics is not None and metrics.first_token is not None:
+            text += f"  -  first token {metrics.first_token:.2f}s"
+            text += f"  -  {metrics.tokens_per_second:.0f} tokens/s"
+            if metrics.cache_read_tokens:
+                text += f"  -  {metrics.cache_read_tokens} cached prompt tokens"
+        # Called from the worker threads, the header is updated by the Tk loop
+        self.after(0, self._show_header, text)
+
+    def _show_header(self, text):
+        # The pane may have been closed meanwhile
+        if self.header.winfo_exists():
+            self.header.configure(text=text)
+
+
+class HistoryFrame(ctk.CTkFrame):
+    """
+    Sidebar listing the archived conversations, most recent first, with a
+    full-text search over all the messages.
+
+    Conversations and their messages are loaded ARCHIVE_PAGE_SIZE at a time,
+    the next page only when asked for.
+
+    :param archive: The ConversationArchive of the backend.
+    :param on_show_messages_callback: Called with the id and title of a
+        conversation, a page of its messages, and the offset of the page.
+    """
+
+    def __init__(self, parent, archive, on_show_messages_callback, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.archive = archive
+        self.on_show_messages_callback = on_show_messages_callback
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.search_entry = ctk.CTkEntry(self, placeholder_text="Search")
+        self.search_entry.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
+        self.search_entry.bind("<Return>", self.on_search)
+
+        self.results_frame = ctk.CTkScrollableFrame(self, fg_color="transparent")
+        self.results_frame.grid(row=1, column=0, padx=(10, 0), sticky="nsew")
+        self.results_frame.grid_columnconfigure(0, weight=1)
+
+        self.more_button = ctk.CTkButton(
+            self,
+            text="Older Conversations",
+            command=self.load_conversations,
+            fg_color=("#0C955A", "#106A43"),
+            hover_color="#2c6e49",
+        )
+        self.more_button.grid(row=2, column=0, padx=10, pady=(5, 0), sticky="ew")
+
+        self.more_messages_button = ctk.CTkButton(
+            self,
+            text="Load More Messages",
+            command=self.load_messages,
+            fg_color=("#0C955A", "#106A43"),
+            hover_color="#2c6e49",
+        )
+        self.more_messages_button.grid(
+            row=3, column=0, padx=10, pady=(5, 10), sticky="ew"
+        )
+        self.more_messages_button.grid_remove()
+
+        self.conversations_loaded = 0
+        self.conversation_id = None
+        self.conversation_title = ""
+        self.messages_loaded = 0
+
+    def refresh(self):
+        """List the most recent conversations again."""
+        self.archive.flush()
+        self.clear_results()
+        self.load_conversations()
+
+    def clear_results(self):
+        for widget in self.results_frame.winfo_children():
+            widget.destroy()
+        self.conversations_loaded = 0
+
+    def add_result(self, text, conversation_id, title):
+        button = ctk.CTkButton(
+            self.results_frame,
+            text=text,
+            anchor="w",
+            fg_color="transparent",
+            hover_color="#2c6e49",
+            command=lambda: self.open_conversation(conversation_id, title),
+        )
+        row = len(self.results_frame.winfo_children())
+        button.grid(row=row, column=0, sticky="ew")
+
+    def load_conversations(self):
+        conversations = self.archive.list_conversations(
+            self.conversations_loaded, ARCHIVE_PAGE_SIZE
+        )
+        for conversation in conversations:
+            text = f"{conversation['title'][:40]}\n{conversation['model']}"
+            self.add_result(text, conversation["id"], conversation["title"])
+        self.conversations_loaded += len(conversations)
+        if len(conversations) < ARCHIVE_PAGE_SIZE:
+            self.more_button.grid_remove()
+        else:
+            self.more_button.grid()
+
+    def on_search(self, event=None):
+        text = self.search_entry.get()
+        if not text.strip():
+            self.refresh()
+        else:
+            self.archive.flush()
+            self.clear_results()
+            self.more_button.grid_remove()
+            for result in self.archive.search(text, ARCHIVE_PAGE_SIZE):
+                text = f"{result['title'][:40]}\n{result['snippet'][:60]}"
+                self.add_result(text, result["conversation_id"], result["title"])
+        # Not the Return of the window, which would send the prompt
+        return "break"
+
+    def open_conversation(self, conversation_id, title):
+        self.conversation_id = conversation_id
+        self.conversation_title = title
+        self.messages_loaded = 0
+        self.load_messages()
+
+    def load_messages(self):
+        messages = self.archive.load_messages(
+            self.conversation_id, self.messages_loaded, ARCHIVE_PAGE_SIZE
+        )
+        self.on_show_messages_callback(
+            self.conversation_id,
+            self.conversation_title,
+            messages,
+            self.messages_loaded,
+        )
+        self.messages_loaded += len(messages)
+        if len(messages) < ARCHIVE_PAGE_SIZE:
+            self.more_messages_button.grid_remove()
+        else:
+            self.more_messages_button.grid()
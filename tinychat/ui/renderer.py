@@ -0,0 +1,163 @@
+import queue
+import time
+import tkinter as tk
+
+from tinychat.settings import CHAT_DISPLAY_WINDOW_CHARS
+from tinychat.ui.transcript import Transcript
+
+
+class StreamRenderer:
+    """
+    Render text streamed by worker threads into a textbox, one frame at a time.
+
+    Workers push text with push(), which is thread-safe and never touches Tk.
+    The Tk main loop drains the queue every frame via after(), and writes all
+    the text received since the previous frame with a single insert and a
+    single scroll. The frame interval follows the measured paint time, so that
+    painting takes at most about a quarter of each frame.
+
+    The textbox is windowed: workers close each turn with end_turn(), and
+    only the newest turns are kept in the textbox (see Transcript), with a
+    mark at the end of each one. Older turns are deleted while following the
+    end, and read back from their source when the view is scrolled to the
+    top, so the cost of an insert stays the same however long the session is.
+
+    :param root: The Tk widget used to schedule frames (usually the app).
+    :param textbox: The (disabled) textbox receiving the text.
+    :param window_chars: Characters of the newest turns kept in the textbox.
+    :param load_turn: Returns the text of a hidden turn from its source.
+    """
+
+    MIN_FRAME_MS = 16
+    MAX_FRAME_MS = 100
+    # Frame interval as a multiple of the measured paint time
+    PAINT_BUDGET_FACTOR = 4
+    # Weight of the last measure in the paint time moving average
+    PAINT_SMOOTHING = 0.2
+    # Queued by end_turn() to close the current turn, with its source
+    END_TURN = "end_turn"
+
+    def __init__(
+        self, root, textbox, window_chars=CHAT_DISPLAY_WINDOW_CHARS, load_turn=None
+    ) -> None:
+        self._root = root
+        self._textbox = textbox
+        self._queue = queue.SimpleQueue()
+        self.transcript = Transcript(window_chars, load_turn)
+        self._paint_ms = 0.0
+        self.frame_ms = self.MIN_FRAME_MS
+        # The after() id of the next frame, None once stopped
+        self._frame_id = None
+
+    def start(self) -> None:
+        self._frame_id = self._root.after(self.frame_ms, self._on_frame)
+
+    def stop(self) -> None:
+        """Cancel the next frame, before the textbox is destroyed."""
+        if self._frame_id is not None:
+            self._root.after_cancel(self._frame_id)
+            self._frame_id = None
+
+    def push(self, text: str) -> None:
+        """Queue text to be appended at the next frame. Thread-safe."""
+        self._queue.put(text)
+
+    def end_turn(self, source=None) -> None:
+        """
+        Close the turn of the text pushed so far, read back from source once
+        hidden (see Transcript.end_turn). Thread-safe.
+        """
+        self._queue.put((self.END_TURN, source))
+
+    def clear(self) -> None:
+        """Drop the text not rendered yet and empty the textbox."""
+        self._drain()
+        self._unset_marks(self.transcript.first, len(self.transcript))
+        self.transcript.clear()
+        self._textbox.configure(state="normal")
+        self._textbox.delete("1.0", tk.END)
+        self._textbox.configure(state="disabled")
+
+    def _drain(self) -> list[str]:
+        parts = []
+        try:
+            while True:
+                parts.append(self._queue.get_nowait())
+        except queue.Empty:
+            return parts
+
+    def _on_frame(self) -> None:
+        parts = self._drain()
+        top, bottom = self._textbox.yview()
+        if top <= 0.0 and self.transcript.first:
+            self._page_in()
+        if parts:
+            started = time.perf_counter()
+            # Scroll with the text only if the end is in view
+            following = bottom >= 1.0
+            self._textbox.configure(state="normal")
+            self._write(parts)
+            if following:
+                self._trim()
+            self._textbox.configure(state="disabled")
+            if following:
+                self._textbox.yview(tk.END)
+            # Paint now, so that the measure includes the redraw
+            self._root.update_idletasks()
+            paint_ms = (time.perf_counter() - started) * 1000
+            self._adapt_frame_rate(paint_ms)
+        self._frame_id = self._root.after(self.frame_ms, self._on_frame)
+
+    @staticmethod
+    def _mark(index: int) -> str:
+        # Mark at the end of a turn in the textbox
+        return f"tinychat_turn_{index}"
+
+    def _unset_marks(self, start: int, stop: int) -> None:
+        for index in range(start, stop):
+            self._textbox.mark_unset(self._mark(index))
+
+    def _write(self, parts: list) -> None:
+        text = []
+        for part in parts:
+            if isinstance(part, tuple):
+                _, source = part
+                self._textbox.insert(tk.END, "".join(text))
+                text = []
+                mark = self._mark(self.transcript.end_turn(source))
+                self._textbox.mark_set(mark, "end-1c")
+                # Text written after the mark belongs to the next turn
+                self._textbox.mark_gravity(mark, "left")
+            else:
+                self.transcript.append(part)
+                text.append(part)
+        if text:
+            self._textbox.insert(tk.END, "".join(text))
+
+    def _trim(self) -> None:
+        first = self.transcript.first
+        hidden = self.transcript.trim()
+        if hidden:
+            self._textbox.delete("1.0", self._mark(first + hidden - 1))
+            self._unset_marks(first, first + hidden)
+
+    def _page_in(self) -> None:
+        last = self.transcript.first
+        turns = self.transcript.page_in()
+        # Keep the line at the top of the view in place
+        self._textbox.mark_set("tinychat_top", "@0,0")
+        self._textbox.configure(state="normal")
+        for index, text in reversed(list(enumerate(turns, last - len(turns)))):
+            mark = self._mark(index)
+            # Set before the insert, so that the mark ends up after the text
+            self._textbox.mark_set(mark, "1.0")
+            self._textbox.mark_gravity(mark, "right")
+            self._textbox.insert("1.0", text)
+            self._textbox.mark_gravity(mark, "left")
+        self._textbox.configure(state="disabled")
+        self._textbox.yview("tinychat_top")
+
+    def _adapt_frame_rate(self, paint_ms: float) -> None:
+        self._paint_ms += self.PAINT_SMOOTHING * (paint_ms - self._paint_ms)
+        frame_ms = round(self._paint_ms * self.PAINT_BUDGET_FACTOR)
+        self.frame_ms = max(self.MIN_FRAME_MS, min(self.MAX_FRAME_MS, frame_ms))
@@ -0,0 +1,117 @@
+from typing import Callable, Hashable, Iterable, Optional
+
+from tinychat.llms.conversation import USER_ROLE
+
+
+def format_messages(messages: Iterable[tuple[str, str]]) -> str:
+    """The text of messages (role and content) in a chat display."""
+    return "".join(
+        f"{'You' if role == USER_ROLE else 'LLM'}: {content.strip()}\n\n\n"
+        for role, content in messages
+    )
+
+
+class Transcript:
+    """
+    The turns of a chat display, and the window of them shown in the textbox.
+
+    The textbox only holds the newest turns (from `first` on) plus the turn
+    being written. When they grow past twice the window, trim() hides the
+    oldest ones down to the window, and page_in() shows back about half a
+    window of older turns, so that the textbox stays the same size however
+    long the session is.
+
+    The text of the turns is not kept here, only their lengths and sources:
+    page_in() reads the hidden turns back with load_turn, from the history
+    their source points to (the range of their messages, say). Only the text
+    of the turns closed without a source, such as notices, is kept.
+
+    :param window_chars: Characters of the newest turns to keep shown.
+    :param load_turn: Returns the text of a turn from its source.
+    """
+
+    def __init__(
+        self,
+        window_chars: int,
+        load_turn: Optional[Callable[[Hashable], str]] = None,
+    ) -> None:
+        self.window_chars = window_chars
+        self.load_turn = load_turn
+        # Characters of each closed turn, as last shown
+        self.lengths: list[int] = []
+        # Where the text of each closed turn is read back from, see end_turn()
+        self.sources: list[Optional[Hashable]] = []
+        # The text of the turns without a source, by index
+        self._texts: dict[int, str] = {}
+        # Index of the first turn shown in the textbox
+        self.first = 0
+        self._open_parts: list[str] = []
+        # Characters shown, of the turns from first on and of the open turn
+        self.shown_chars = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def append(self, text: str) -> None:
+        """Add text to the open turn."""
+        self._open_parts.append(text)
+        self.shown_chars += len(text)
+
+    def end_turn(self, source: Optional[Hashable] = None) -> int:
+        """
+        Close the open turn and return its index. Its text is read back with
+        load_turn(source) once hidden, or kept if there is no source.
+        """
+        index = len(self.lengths)
+        text = "".join(self._open_parts)
+        self._open_parts = []
+        self.lengths.append(len(text))
+        self.sources.append(source)
+        if source is None or self.load_turn is None:
+            self._texts[index] = text
+        return index
+
+    def clear(self) -> None:
+        self.lengths = []
+        self.sources = []
+        self._texts = {}
+        self.first = 0
+        self._open_parts = []
+        self.shown_chars = 0
+
+    def trim(self) -> int:
+        """
+        Hide the oldest shown turns, if the shown text is past twice the
+        window, and return how many. The last closed turn is always shown.
+        """
+        if self.shown_chars <= 2 * self.window_chars:
+            return 0
+        hidden = 0
+        while self.shown_chars > self.window_chars and self.first < len(self) - 1:
+            self.shown_chars -= self.lengths[self.first]
+            self.first += 1
+            hidden += 1
+        return hidden
+
+    def page_in(self) -> list[str]:
+        """Show back about half a window of older turns and return them."""
+        turns = []
+        page_chars = 0
+        while self.first > 0 and page_chars < self.window_chars // 2:
+            self.first -= 1
+            text = self.text(self.first)
+            # The source may render it differently from the streamed text
+            self.lengths[self.first] = len(text)
+            turns.append(text)
+            page_chars += len(text)
+        self.shown_chars += page_chars
+        turns.reverse()
+        return turns
+
+    def text(self, index: int) -> str:
+        """The text of the closed turn index."""
+        text = self._texts.get(index)
+        if text is None:
+            assert self.load_turn is not None
+            text = self.load_turn(self.sources[index])
+        return text
@@ -0,0 +1,66 @@
+import queue
+import sys
+import threading
+from typing import Callable, Optional
+
+
+class PromptWorker:
+    """
+    A long-lived thread sending the prompts of the chat one at a time.
+
+    Prompts submitted while a response is being streamed wait in a bounded
+    queue, and are sent in order once the previous response is complete, so
+    that each one is answered with the history of the previous turns.
+
+    :param handle: Called from the worker thread with each prompt.
+    :param maxsize: Max number of prompts waiting in the queue.
+    :param on_idle: Called from the worker thread when the queue is empty
+        after a prompt was handled.
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[str], None],
+        maxsize: int,
+        on_idle: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self._handle = handle
+        self._on_idle = on_idle
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        """Number of prompts waiting for the one being handled."""
+        return self._queue.qsize()
+
+    def submit(self, prompt: str) -> None:
+        """Queue prompt. Raises queue.Full if maxsize prompts are waiting."""
+        with self._lock:
+            self._queue.put_nowait(prompt)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="tinychat-prompts", daemon=True
+                )
+                self._thread.start()
+
+    def clear(self) -> list[str]:
+        """Drop the waiting prompts and return them, in order."""
+        dropped = []
+        while True:
+            try:
+                dropped.append(self._queue.get_nowait())
+            except queue.Empty:
+                return dropped
+
+    def _run(self) -> None:
+        while True:
+            prompt = self._queue.get()
+            try:
+                self._handle(prompt)
+            except Exception:
+                # Reported as in any thread, the next prompts are still sent
+                sys.excepthook(*sys.exc_info())
+            if self._on_idle is not None and self._queue.empty():
+                self._on_idle()
@@ -1,25 +1,129 @@
+import contextlib
 import json
+import os
+import tempfile
+import threading
+from typing import Any, Optional
 
 from tinychat.settings import SECRETS_FILE_PATH
 
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: str):
+    """
+    Hold an exclusive lock on lock_path, shared by every tinychat process.
+    """
+    with open(lock_path, "a+") as lock_file:
+        if os.name == "nt":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class ConfigStore:
+    """
+    In-memory cache of a JSON config file.
+
+    The file is only parsed again when its inode, mtime or size change, so
+    reading a value is a dictionary lookup plus a stat call. Updates are
+    merged into the latest content of the file and written atomically
+    (temp file + rename) while holding a lock file, so several tinychat
+    processes can share the same file.
+
+    :param file_path: The path of the JSON file backing the store.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self.lock_path = f"{file_path}.lock"
+        self._data: dict = {}
+        self._stamp: Optional[tuple] = None
+        self._lock = threading.RLock()
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read_file(self) -> dict:
+        try:
+            with open(self.file_path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _write_file(self, data: dict) -> None:
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(data, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.file_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+            raise
+
+    def load(self) -> dict:
+        """Return the cached content of the file, reloading it if it changed."""
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp is None:
+                self.update({})
+            elif stamp != self._stamp:
+                self._data = self._read_file()
+                self._stamp = stamp
+            return self._data
+
+    def get(self, key: str, default: Any = "") -> Any:
+        return self.load().get(key, default)
+
+    def update(self, values: dict) -> None:
+        """Merge values into the file with a single atomic write."""
+        with self._lock, file_lock(self.lock_path):
+            data = self._read_file()
+            data.update(values)
+            self._write_file(data)
+            self._data = data
+            self._stamp = self._file_stamp()
+
+
+_config_store = ConfigStore(SECRETS_FILE_PATH)
+
 
 def load_secrets(file_path: str) -> dict:
-    try:
-        with open(file_path, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        with open(file_path, "w") as file:
-            json.dump({}, file)
-        return {}
+    if file_path == _config_store.file_path:
+        return dict(_config_store.load())
+    return dict(ConfigStore(file_path).load())
+
+
+def set_secrets(values: dict) -> None:
+    """Store several values with a single write of the secrets file."""
+    _config_store.update(values)
 
 
 def set_secret(key: str, value: str) -> None:
-    secrets = load_secrets(SECRETS_FILE_PATH)
-    secrets[key] = value
-    with open(SECRETS_FILE_PATH, "w") as file:
-        json.dump(secrets, file, indent=4)  # Writing back the updated secrets
+    set_secrets({key: value})
 
 
 def get_secret(key: str) -> str:
-    secrets = load_secrets(SECRETS_FILE_PATH)
-    return secrets.get(key, "")
+    return _config_store.get(key, "")